@@ -0,0 +1,470 @@
+import argparse
+import glob
+import io
+import json
+import logging
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from run import compare_intervals, iter_holding_periods, iter_interval_runs
+from src.stock_analysis.cli import setup_arg_parser
+from src.stock_analysis.core import run_strategy_backtest
+from src.stock_analysis.indicators import IndicatorCache
+from src.stock_analysis.ledger import TradeLedger
+from src.stock_analysis.log import get_logger, setup_logging
+from src.stock_analysis.sketch import SUMMARY_QUANTILES
+
+logger = get_logger("regression")
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+DATA_DIR = os.path.join(GOLDEN_DIR, "data")
+EXPECTED_DIR = os.path.join(GOLDEN_DIR, "expected")
+TIMINGS_PATH = os.path.join(GOLDEN_DIR, "timings.json")
+DATA_INTERVAL = "5m"
+
+# 每個案例: (模式, run.py 命令列參數)；每個案例也是一個計時階段
+# (Each case: (mode, run.py arguments); every case is also a timed stage)
+CASES = {
+    "analysis_bars": (
+        "analysis",
+        [
+            "-b",
+            "1",
+            "-i",
+            "3",
+            "--bootstrap-replicates",
+            "200",
+            "--bootstrap-seed",
+            "7",
+        ],
+    ),
+    "analysis_session_end": (
+        "analysis",
+        [
+            "-b",
+            "2",
+            "-i",
+            "3",
+            "--horizon-mode",
+            "session",
+            "--time-anchor",
+            "end",
+            "--regular-hours-only",
+        ],
+    ),
+    "analysis_chunked": (
+        "analysis",
+        ["-b", "2", "-i", "2", "--time-anchor", "end", "--chunk-by", "month"],
+    ),
+    # 15m K 線由 5m 重新取樣 (15m bars resampled from the 5m data)
+    "analysis_intervals": (
+        "analysis",
+        ["-b", "1", "-i", "2", "--interval-short", DATA_INTERVAL, "15m"],
+    ),
+    "backtest_fixed": (
+        "backtest",
+        ["--entry-trail-pct", "1.0", "--exit-trail-pct", "0.8"],
+    ),
+    "backtest_atr_daily": ("backtest", ["--trail-mode", "atr", "--daily-trades"]),
+    "backtest_event_fixed": (
+        "backtest",
+        [
+            "--entry-trail-pct",
+            "1.0",
+            "--exit-trail-pct",
+            "0.8",
+            "--backtest-engine",
+            "event",
+        ],
+    ),
+    "backtest_event_atr_daily": (
+        "backtest",
+        ["--trail-mode", "atr", "--daily-trades", "--backtest-engine", "event"],
+    ),
+}
+
+# 必須與另一個案例輸出相同的案例，共用其黃金輸出，--update 不會覆寫
+# (Cases that must reproduce another case's outputs; they share its goldens,
+# which --update leaves to the original case)
+SHARED_GOLDENS = {
+    "backtest_event_fixed": "backtest_fixed",
+    "backtest_event_atr_daily": "backtest_atr_daily",
+}
+
+# 比對容差 (Comparison tolerances): |actual - expected| <= atol + rtol * |expected|
+TOLERANCES = {
+    "summary": {"rtol": 1e-9, "atol": 1e-12},
+    "returns": {"rtol": 1e-9, "atol": 1e-12},
+    "comparison": {"rtol": 1e-9, "atol": 1e-12},
+    "trades": {"rtol": 1e-9, "atol": 1e-9},
+}
+
+# 分析案例逐筆報酬的欄位 (Columns of an analysis case's per-bar returns)
+RETURN_COLUMNS = ["ticker", "holding_hours", "time", "return"]
+
+# 低於此秒數的計時差異視為雜訊 (Timing differences below this are noise)
+TIMING_SLACK_SECONDS = 0.005
+
+
+def load_datasets() -> dict:
+    """讀取凍結的本地 K 線資料 (Loads the frozen local bar datasets)."""
+    datasets = {}
+    for path in sorted(glob.glob(os.path.join(DATA_DIR, f"*_{DATA_INTERVAL}.csv"))):
+        ticker = os.path.basename(path)[: -len(f"_{DATA_INTERVAL}.csv")]
+        frame = pd.read_csv(path, index_col=0)
+        frame.index = pd.to_datetime(frame.index, utc=True).tz_convert(
+            "America/New_York"
+        )
+        datasets[ticker] = frame
+    if not datasets:
+        raise FileNotFoundError(f"No frozen datasets found in {DATA_DIR}.")
+    return datasets
+
+
+def case_args(name: str) -> argparse.Namespace:
+    _, argv = CASES[name]
+    if "--interval-short" not in argv:
+        argv = argv + ["--interval-short", DATA_INTERVAL]
+    return setup_arg_parser().parse_args(argv)
+
+
+def _summary_values(results: dict) -> dict:
+    values = {}
+    for key, value in results.items():
+        if key in ("ticker", "holding_hours"):
+            continue
+        if key == "return_sketch":
+            for q, quantile in zip(
+                SUMMARY_QUANTILES, value.quantiles(SUMMARY_QUANTILES)
+            ):
+                values[f"return_p{round(q * 100)}"] = quantile
+        elif isinstance(value, tuple):
+            values[key] = [float(v) for v in value]
+        else:
+            values[key] = float(value)
+    return values
+
+
+def run_case(name: str, datasets: dict) -> dict:
+    """
+    執行一個案例並回傳其輸出 (Runs one case and returns its outputs).
+    Analysis cases go through run.iter_holding_periods, i.e. the same
+    latest_one_third slicing and per-iteration return normalization as a
+    normal run; backtest cases through run_strategy_backtest.
+
+    With several --interval-short intervals the analysis runs once per
+    interval (run.iter_interval_runs), the summary is keyed by
+    "<ticker>@<interval>", the returns get an interval column and the
+    cross-interval table of run.compare_intervals is added as "comparison".
+    """
+    mode, _ = CASES[name]
+    args = case_args(name)
+    indicators = IndicatorCache()
+
+    if mode == "backtest":
+        ledger = TradeLedger()
+        for ticker, frame in datasets.items():
+            run_strategy_backtest(
+                frame, ticker, args, ledger=ledger, indicators=indicators
+            )
+        return {"trades": ledger.to_frame()}
+
+    several = len(args.intervals_short) > 1
+    summary = {}
+    returns = []
+    interval_summaries = {}
+    for interval, interval_args, interval_data in iter_interval_runs(datasets, args):
+        interval_summary = interval_summaries.setdefault(interval, {})
+        for ticker in datasets:
+            key = f"{ticker}@{interval}" if several else ticker
+            for holding_hours, results, detailed_df in iter_holding_periods(
+                ticker, interval_data, interval_args, interval, indicators
+            ):
+                summary.setdefault(key, {})[str(holding_hours)] = _summary_values(
+                    results
+                )
+                interval_summary.setdefault(holding_hours, []).append(results)
+                frame = pd.DataFrame(
+                    {
+                        "ticker": ticker,
+                        "holding_hours": holding_hours,
+                        "time": detailed_df.index,
+                        "return": detailed_df["return"].to_numpy(),
+                    }
+                )
+                if several:
+                    frame.insert(0, "interval", interval)
+                returns.append(frame)
+            indicators.discard(ticker)
+
+    columns = (["interval"] if several else []) + RETURN_COLUMNS
+    outputs = {
+        "summary": summary,
+        "returns": (
+            pd.concat(returns, ignore_index=True)
+            if returns
+            else pd.DataFrame(columns=columns)
+        ),
+    }
+    if several:
+        outputs["comparison"] = compare_intervals(interval_summaries, "analysis")
+    return outputs
+
+
+def _expected_path(name: str, kind: str) -> str:
+    extension = "json" if kind == "summary" else "csv.gz"
+    name = SHARED_GOLDENS.get(name, name)
+    return os.path.join(EXPECTED_DIR, f"{name}.{kind}.{extension}")
+
+
+def write_golden(name: str, outputs: dict):
+    os.makedirs(EXPECTED_DIR, exist_ok=True)
+    for kind, value in outputs.items():
+        path = _expected_path(name, kind)
+        if kind == "summary":
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(value, f, indent=1, sort_keys=True)
+                f.write("\n")
+        else:
+            # 固定 mtime，內容相同時檔案位元組相同 (Fixed mtime: same content, same bytes)
+            value.to_csv(path, index=False, compression={"method": "gzip", "mtime": 0})
+
+
+def _close(actual, expected, rtol: float, atol: float) -> bool:
+    actual = np.asarray(actual, dtype=float)
+    expected = np.asarray(expected, dtype=float)
+    return actual.shape == expected.shape and bool(
+        np.all(np.isclose(actual, expected, rtol=rtol, atol=atol, equal_nan=True))
+    )
+
+
+def compare_summary(actual: dict, expected: dict) -> list:
+    failures = []
+    tolerance = TOLERANCES["summary"]
+    for ticker in sorted(set(actual) | set(expected)):
+        for hours in sorted(
+            set(actual.get(ticker, {})) | set(expected.get(ticker, {}))
+        ):
+            got = actual.get(ticker, {}).get(hours)
+            want = expected.get(ticker, {}).get(hours)
+            if got is None or want is None:
+                failures.append(
+                    f"{ticker} {hours}h: {'missing' if got is None else 'unexpected'}"
+                )
+                continue
+            for key in sorted(set(got) | set(want)):
+                if key not in got or key not in want:
+                    failures.append(
+                        f"{ticker} {hours}h {key}: {'missing' if key not in got else 'unexpected'}"
+                    )
+                elif not _close(got[key], want[key], **tolerance):
+                    failures.append(
+                        f"{ticker} {hours}h {key}: {got[key]!r} != {want[key]!r}"
+                    )
+    return failures
+
+
+def compare_frame(actual: pd.DataFrame, path: str, kind: str) -> list:
+    """
+    以 CSV 來回轉換後比對，數值欄位使用容差，其餘欄位需完全相同。
+    Compares after a CSV round trip: numeric columns within TOLERANCES[kind],
+    every other column (tickers, timestamps, counts) exactly.
+    """
+    actual = pd.read_csv(io.StringIO(actual.to_csv(index=False)))
+    expected = pd.read_csv(path)
+    if list(actual.columns) != list(expected.columns):
+        return [f"columns {list(actual.columns)} != {list(expected.columns)}"]
+    if len(actual) != len(expected):
+        return [f"{len(actual)} rows != {len(expected)} rows"]
+
+    failures = []
+    for column in expected.columns:
+        got, want = actual[column], expected[column]
+        if pd.api.types.is_float_dtype(want):
+            mismatch = ~np.isclose(got, want, equal_nan=True, **TOLERANCES[kind])
+        else:
+            mismatch = (got != want).to_numpy()
+        if mismatch.any():
+            row = int(np.flatnonzero(mismatch)[0])
+            failures.append(
+                f"{column}: {int(mismatch.sum())} rows differ, first at row {row}"
+                f" ({got.tolist()[row]!r} != {want.tolist()[row]!r})"
+            )
+    return failures
+
+
+def missing_outputs(outputs: dict) -> list:
+    """沒有產生任何結果的輸出 (Outputs that came out empty)."""
+    return [f"{kind}: no results" for kind, value in outputs.items() if len(value) == 0]
+
+
+def check_golden(name: str, outputs: dict) -> list:
+    failures = missing_outputs(outputs)
+    for kind, value in outputs.items():
+        path = _expected_path(name, kind)
+        if len(value) == 0:
+            continue
+        if not os.path.exists(path):
+            failures.append(f"{kind}: no golden output at {path} (run with --update)")
+        elif kind == "summary":
+            with open(path, encoding="utf-8") as f:
+                failures += [
+                    f"{kind}: {m}" for m in compare_summary(value, json.load(f))
+                ]
+        else:
+            failures += [f"{kind}: {m}" for m in compare_frame(value, path, kind)]
+    return failures
+
+
+def time_case(name: str, repeat: int) -> tuple:
+    """
+    重複執行取最短時間 (Best-of-``repeat`` wall time); each run gets freshly
+    loaded data so no run reuses another's caches.
+    """
+    best = float("inf")
+    outputs = None
+    for _ in range(repeat):
+        datasets = load_datasets()
+        start = time.perf_counter()
+        outputs = run_case(name, datasets)
+        best = min(best, time.perf_counter() - start)
+    return outputs, best
+
+
+def _environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+
+def check_timings(timings: dict, max_slowdown: float) -> list:
+    if not os.path.exists(TIMINGS_PATH):
+        return [f"no timing baseline at {TIMINGS_PATH} (run with --update-timings)"]
+    with open(TIMINGS_PATH, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("environment") != _environment():
+        logger.warning(
+            "警告：計時基準來自不同的環境 (Warning: the timing baseline was recorded"
+            f" in a different environment: {baseline.get('environment')})"
+        )
+
+    failures = []
+    logger.info(f"\n{'stage':<24}{'baseline':>10}{'current':>10}{'change':>9}")
+    for name, seconds in timings.items():
+        base = baseline["stages"].get(name)
+        if base is None:
+            failures.append(f"{name}: no baseline timing")
+            continue
+        change = seconds / base - 1 if base else 0.0
+        logger.info(f"{name:<24}{base:>9.3f}s{seconds:>9.3f}s{change:>+9.1%}")
+        if seconds > base * (1 + max_slowdown / 100) + TIMING_SLACK_SECONDS:
+            failures.append(
+                f"{name}: {seconds:.3f}s is {change:+.1%} vs the {base:.3f}s baseline"
+                f" (limit +{max_slowdown:g}%)"
+            )
+    return failures
+
+
+def setup_regression_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="以凍結的本地資料比對黃金輸出與計時基準 (Offline golden-output and timing regression check)."
+    )
+    parser.add_argument(
+        "cases",
+        nargs="*",
+        help=f"要執行的案例，預設全部 (Cases to run; all by default): {', '.join(CASES)}.",
+    )
+    parser.add_argument(
+        "--update",
+        action="store_true",
+        help="以目前的輸出覆寫黃金輸出與計時基準 (Overwrite the golden outputs and the timing baseline with the current results).",
+    )
+    parser.add_argument(
+        "--update-timings",
+        action="store_true",
+        help="只覆寫計時基準 (Overwrite only the timing baseline).",
+    )
+    parser.add_argument(
+        "--skip-timing",
+        action="store_true",
+        help="只比對輸出，不檢查計時 (Check outputs only, e.g. on shared CI runners).",
+    )
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=25.0,
+        help="各階段相對基準允許的最大變慢百分比 (Maximum allowed slowdown per stage, in percent of the baseline).",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="每個階段的重複次數，取最短時間 (Runs per stage; the fastest is compared).",
+    )
+    return parser
+
+
+def main(argv=None) -> int:
+    parser = setup_regression_parser()
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.cases if name not in CASES]
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)}")
+    setup_logging("INFO")
+    # 只顯示本工具的進度，被測程式的 INFO 訊息不輸出
+    # (Only this tool's progress; INFO output of the code under test is muted)
+    for name in ("core", "run"):
+        get_logger(name).setLevel(logging.WARNING)
+    names = args.cases or list(CASES)
+    repeat = 1 if args.skip_timing else max(1, args.repeat)
+
+    failures = []
+    timings = {}
+    for name in names:
+        outputs, timings[name] = time_case(name, repeat)
+        if args.update:
+            case_failures = missing_outputs(outputs)
+            if not case_failures and name in SHARED_GOLDENS:
+                case_failures = check_golden(name, outputs)
+            elif not case_failures:
+                write_golden(name, outputs)
+                logger.info(f"[{name}] 已更新黃金輸出 (golden outputs updated)")
+                continue
+        else:
+            case_failures = check_golden(name, outputs)
+        status = "OK" if not case_failures else f"FAILED ({len(case_failures)})"
+        logger.info(f"[{name}] {status}")
+        failures += [f"[{name}] {message}" for message in case_failures]
+
+    if args.update or args.update_timings:
+        stages = {}
+        if os.path.exists(TIMINGS_PATH):
+            with open(TIMINGS_PATH, encoding="utf-8") as f:
+                stages = json.load(f)["stages"]
+        stages.update({name: round(seconds, 4) for name, seconds in timings.items()})
+        with open(TIMINGS_PATH, "w", encoding="utf-8") as f:
+            json.dump({"environment": _environment(), "stages": stages}, f, indent=1)
+            f.write("\n")
+        logger.info(f"計時基準已更新 (Timing baseline updated): {TIMINGS_PATH}")
+    elif not args.skip_timing:
+        failures += check_timings(timings, args.max_slowdown)
+
+    if failures:
+        logger.error("\n回歸檢查失敗 (Regression check failed):")
+        for message in failures:
+            logger.error(f"  - {message}")
+        return 1
+    logger.info("\n回歸檢查通過 (Regression check passed)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,60 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import argparse
+import collections
+import logging
 import math
 import os
 import glob
+import itertools
+import json
 
 # Import modularized functions
-from src.stock_analysis.core import analyze_fixed_time_lag, run_strategy_backtest
-from src.stock_analysis.plotting import plot_results, plot_comparison_chart
+from src.stock_analysis.core import (
+    analyze_fixed_time_lag,
+    analyze_fixed_time_lag_chunked,
+    run_strategy_backtest,
+    run_strategy_backtest_chunked,
+)
+from src.stock_analysis.chunked import iter_bar_chunks, skip_rows
+from src.stock_analysis.plotting import (
+    COMPARISON_COLUMNS,
+    COMPARISON_MAX_TICKERS,
+    ReturnEnvelope,
+    plot_comparison_chart,
+    plot_results,
+)
 from src.stock_analysis.data import download_stock_data
 from src.stock_analysis.cli import setup_arg_parser
+from src.stock_analysis.stress import run_stress_test, summarize_stress_results
+from src.stock_analysis.optimize import (
+    candidate_names,
+    optimize_trails,
+    sample_candidates,
+)
+from src.stock_analysis.sessions import build_session_index, regular_hours_mask
+from src.stock_analysis.log import get_logger, setup_logging
+from src.stock_analysis.ledger import TradeLedger
+from src.stock_analysis.indicators import IndicatorCache
+from src.stock_analysis.sketch import SUMMARY_QUANTILES
+from src.stock_analysis.leadlag import rank_lead_lag
+from src.stock_analysis.metrics import compute_trade_metrics
+from src.stock_analysis.resample import ResampledBars
+from src.stock_analysis.retain import ResultStore
+from src.stock_analysis.pipeline import StreamingBars
+from src.stock_analysis.barstore import BarStore, bar_store_path
+from src.stock_analysis.feed import export_feed_dataset, write_feed_manifest
+from src.stock_analysis.shard import (
+    expected_bar_counts,
+    has_checkpoint,
+    load_checkpoint,
+    load_or_create_plan,
+    load_plan,
+    parse_shard_spec,
+    save_checkpoint,
+)
+
+logger = get_logger("run")
 
 
 def print_results(results: dict):
@@ -49,6 +94,284 @@ def latest_one_third(df: pd.DataFrame, divid: int) -> pd.DataFrame:
 # No content
 
 
+def _in_memory_analyzer(
+    ticker_symbol: str,
+    data_short_batch,
+    args: argparse.Namespace,
+    interval_short: str,
+    indicators: IndicatorCache = None,
+):
+    """
+    Prepares one ticker's bars in memory and returns
+    analyze(holding_hours, divid, keep_returns) -> (analysis_results,
+    detailed_df). The bars are in memory anyway, so the detailed frame is
+    always complete and keep_returns is ignored.
+    """
+    try:
+        stock_data_short_interval = data_short_batch[ticker_symbol].dropna()
+    except (KeyError, AttributeError):
+        stock_data_short_interval = pd.DataFrame()
+
+    if args.regular_hours_only and not stock_data_short_interval.empty:
+        stock_data_short_interval = stock_data_short_interval[
+            regular_hours_mask(stock_data_short_interval.index, interval_short)
+        ]
+
+    # 每檔股票只建立一次交易時段索引 (Build the session index once per ticker)
+    session_index = None
+    if args.horizon_mode != "bars" and not stock_data_short_interval.empty:
+        session_index = build_session_index(
+            stock_data_short_interval.index, interval_short
+        )
+
+    if args.save_data and not stock_data_short_interval.empty:
+        raw_filename = f"output_data/{ticker_symbol}_{interval_short}_raw.csv"
+        stock_data_short_interval.to_csv(raw_filename)
+        logger.info(f"原始資料已儲存至 (Raw data saved to): {raw_filename}")
+
+    if stock_data_short_interval.empty:
+        logger.warning(
+            f"*** {ticker_symbol} 沒有可分析的 {interval_short} 資料。跳過... ***"
+        )
+        # We don't continue here, to allow for long interval analysis if that data exists
+    elif indicators is not None:
+        # 以完整序列計算一次，各持有期的尾段皆由快取取得
+        # (Computed once on the full series; every holding period's tail is a cache hit)
+        indicators.get(
+            "atr_pct",
+            ticker_symbol,
+            interval_short,
+            stock_data_short_interval,
+            args.trail_window,
+        )
+
+    def analyze(holding_hours, divid, keep_returns=True):
+        stock_data_to_analyze = latest_one_third(stock_data_short_interval, divid)
+        return analyze_fixed_time_lag(
+            stock_data=stock_data_to_analyze,
+            ticker=ticker_symbol,
+            interval=interval_short,
+            holding_hours=holding_hours,
+            time_anchor=args.time_anchor,
+            bootstrap_replicates=args.bootstrap_replicates,
+            bootstrap_seed=args.bootstrap_seed,
+            bootstrap_confidence=args.bootstrap_confidence,
+            horizon_mode=args.horizon_mode,
+            session_index=session_index,
+            indicators=indicators,
+            indicator_window=args.trail_window,
+            sketch_k=args.sketch_k,
+        )
+
+    return analyze
+
+
+def _chunked_analyzer(
+    ticker_symbol: str,
+    data_short_batch,
+    args: argparse.Namespace,
+    interval_short: str,
+    indicators: IndicatorCache = None,
+):
+    """
+    Same as _in_memory_analyzer, but reads the bars one --chunk-by block at a
+    time and never holds the cleaned history in memory. Without keep_returns
+    the returns are streamed into a ReturnEnvelope instead of being kept, and
+    the detailed frame is that bounded envelope (enough for plot_results).
+    """
+
+    def cleaned_chunks():
+        for chunk in iter_bar_chunks(data_short_batch, ticker_symbol, args.chunk_by):
+            chunk = chunk.dropna()
+            if args.regular_hours_only and not chunk.empty:
+                chunk = chunk[regular_hours_mask(chunk.index, interval_short)]
+            yield chunk
+
+    # 先掃描一次取得有效 K 棒數 (One pass to count the valid bars)
+    raw_filename = f"output_data/{ticker_symbol}_{interval_short}_raw.csv"
+    bar_count = 0
+    for chunk in cleaned_chunks():
+        if args.save_data and not chunk.empty:
+            chunk.to_csv(raw_filename, mode="a" if bar_count else "w", header=not bar_count)
+        bar_count += len(chunk)
+
+    if args.save_data and bar_count:
+        logger.info(f"原始資料已儲存至 (Raw data saved to): {raw_filename}")
+    if not bar_count:
+        logger.warning(
+            f"*** {ticker_symbol} 沒有可分析的 {interval_short} 資料。跳過... ***"
+        )
+
+    def analyze(holding_hours, divid, keep_returns=True):
+        # 與 latest_one_third 取相同的最後區段 (Same tail as latest_one_third)
+        take = max(1, math.ceil(bar_count / divid)) if bar_count else 0
+        envelope = None if keep_returns else ReturnEnvelope()
+        analysis_results, detailed_df = analyze_fixed_time_lag_chunked(
+            skip_rows(cleaned_chunks(), bar_count - take),
+            ticker=ticker_symbol,
+            interval=interval_short,
+            holding_hours=holding_hours,
+            time_anchor=args.time_anchor,
+            bootstrap_replicates=args.bootstrap_replicates,
+            bootstrap_seed=args.bootstrap_seed,
+            bootstrap_confidence=args.bootstrap_confidence,
+            sketch_k=args.sketch_k,
+            on_returns=None if envelope is None else envelope.add,
+            keep_returns=keep_returns,
+        )
+        if envelope is not None and analysis_results is not None:
+            detailed_df = envelope.to_frame()
+        return analysis_results, detailed_df
+
+    return analyze
+
+
+def iter_holding_periods(
+    ticker_symbol: str,
+    data_short_batch,
+    args: argparse.Namespace,
+    interval_short: str,
+    indicators: IndicatorCache = None,
+    keep_returns=None,
+):
+    """
+    Yields (holding_hours, analysis_results, detailed_df) for every
+    holding-period iteration of one ticker that produced results, with the
+    per-iteration return normalization applied. Nothing is saved or plotted.
+
+    keep_returns(holding_hours) tells whether the complete per-bar returns
+    are needed besides plotting (default: always). With --chunk-by they are
+    otherwise not kept and detailed_df is a bounded ReturnEnvelope frame;
+    --save-data and --export-feed always need them.
+    """
+    make_analyzer = _chunked_analyzer if args.chunk_by else _in_memory_analyzer
+    analyze = make_analyzer(
+        ticker_symbol, data_short_batch, args, interval_short, indicators
+    )
+
+    for x in range(args.iterations):
+        holding_hours = args.base_hours * (x + 1)
+        logger.debug(f"--- 分析 ({interval_short} K線, {holding_hours} 小時) ---")
+
+        analysis_results, detailed_df = analyze(
+            holding_hours,
+            args.iterations / (x + 1),
+            keep_returns is None
+            or bool(args.save_data or args.export_feed)
+            or keep_returns(holding_hours),
+        )
+
+        if analysis_results and detailed_df is not None and not detailed_df.empty:
+            # --- NEW CODE START ---
+            # 取得當前的迭代次數 (iteration number)
+            iteration_num = x + 1
+
+            # 1. 正規化「平均期望報酬率」 (analysis_results['expected_return'])
+            # 這個值會用於 summary report 和 plot 上的平均線
+            if "expected_return" in analysis_results:
+                analysis_results["expected_return"] = (
+                    analysis_results["expected_return"] / iteration_num
+                )
+            if "expected_return_ci" in analysis_results:
+                analysis_results["expected_return_ci"] = tuple(
+                    bound / iteration_num
+                    for bound in analysis_results["expected_return_ci"]
+                )
+            analysis_results["return_sketch"] = analysis_results[
+                "return_sketch"
+            ].scaled(1 / iteration_num)
+
+            # 2. 正規化「每筆交易的報酬率」 (detailed_df['return'])
+            # 這個 DataFrame column 會用於繪製主圖表 (plot_results) 和
+            # 跨股票比較圖 (plot_comparison_chart)
+            if "return" in detailed_df.columns:
+                detailed_df["return"] = detailed_df["return"] / iteration_num
+            # --- NEW CODE END ---
+
+            yield holding_hours, analysis_results, detailed_df
+
+
+def analyze_ticker(
+    ticker_symbol: str,
+    data_short_batch,
+    args: argparse.Namespace,
+    interval_short: str,
+    filename_suffix: str,
+    indicators: IndicatorCache = None,
+    keep_returns=None,
+) -> dict:
+    """
+    Runs every holding-period iteration for one ticker.
+
+    Returns {holding_hours: (analysis_results, detailed_df)} for the holding
+    periods that produced results; see iter_holding_periods for keep_returns.
+    """
+    logger.info(f"\n======= 正在分析 (Now Analyzing): {ticker_symbol} =======")
+    ticker_results = {}
+    # 多個間隔時檔名加上間隔 (Several intervals: the file names carry the interval)
+    output_prefix = f"output_data/{ticker_symbol}_"
+    if len(getattr(args, "intervals_short", [])) > 1:
+        output_prefix += f"{interval_short}_"
+
+    for holding_hours, analysis_results, detailed_df in iter_holding_periods(
+        ticker_symbol,
+        data_short_batch,
+        args,
+        interval_short,
+        indicators,
+        keep_returns,
+    ):
+        if args.save_data:
+            analysis_filename = f"{output_prefix}{holding_hours}hr_analysis.csv"
+            detailed_df.to_csv(analysis_filename)
+            logger.info(
+                f"分析資料已儲存至 (Analysis data saved to): {analysis_filename}"
+            )
+            sketch_filename = f"{output_prefix}{holding_hours}hr_return_sketch.json"
+            with open(sketch_filename, "w", encoding="utf-8") as f:
+                json.dump(analysis_results["return_sketch"].to_dict(), f)
+
+        if args.export_feed:
+            export_feed_dataset(
+                args.export_feed,
+                ticker_symbol,
+                holding_hours,
+                analysis_results,
+                detailed_df,
+            )
+
+        ticker_results[holding_hours] = (analysis_results, detailed_df)
+
+        if not args.plot_on_profit or (
+            args.plot_on_profit and analysis_results["expected_return"] > 0
+        ):
+            print_results(analysis_results)
+            plot_results(
+                analysis_results, detailed_df, filename_suffix=filename_suffix
+            )
+
+    logger.debug(f"======= {ticker_symbol} 分析結束 (Analysis Complete) =======")
+    return ticker_results
+
+
+def collect_ticker_results(
+    ticker_symbol: str,
+    ticker_results: dict,
+    retained_results: ResultStore,
+    all_summary_results_master: dict,
+):
+    """
+    Adds one ticker's per-holding-period results to the group-level summary
+    map, and offers its detailed frames to the group's ResultStore, which
+    keeps only what the comparison charts need.
+    """
+    for holding_hours, (analysis_results, detailed_df) in ticker_results.items():
+        retained_results.add(holding_hours, ticker_symbol, detailed_df)
+        all_summary_results_master.setdefault(holding_hours, []).append(
+            analysis_results
+        )
+
+
 def run_analysis_loops(
     ticker_list_array: list,
     data_short_batch,
@@ -57,107 +380,70 @@ def run_analysis_loops(
     summary_filename: str,
     interval_short: str,
     filename_suffix: str,
+    indicators: IndicatorCache = None,
 ):
     """
     Runs the main analysis loops through all ticker lists and holding periods.
+
+    Only the return columns the comparison charts plot are kept across a
+    group's tickers (see new_result_store), so memory stays roughly constant
+    per ticker however large the group is. With --chunk-by the other
+    tickers' complete returns are not even built (see iter_holding_periods).
+
+    Returns the summary results of every group,
+    {holding_hours: [analysis_results, ...]}.
     """
+    run_summary_results = {}
 
     for ticker_list in ticker_list_array:
         if not ticker_list:
             continue
 
-        all_analysis_data_master = {}
         all_summary_results_master = {}
 
-        for ticker_symbol in ticker_list:
-            print("\n=======================================================")
-            print(f"======= 正在分析 (Now Analyzing): {ticker_symbol} =======")
-            print("=======================================================\n")
-
-            try:
-                stock_data_short_interval = data_short_batch[ticker_symbol].dropna()
-            except (KeyError, AttributeError):
-                stock_data_short_interval = pd.DataFrame()
-
-            if args.save_data and not stock_data_short_interval.empty:
-                raw_filename = f"output_data/{ticker_symbol}_{interval_short}_raw.csv"
-                stock_data_short_interval.to_csv(raw_filename)
-                print(f"原始資料已儲存至 (Raw data saved to): {raw_filename}")
-
-            if stock_data_short_interval.empty:
-                print(
-                    f"*** {ticker_symbol} 沒有可分析的 {interval_short} 資料。跳過... ***"
-                )
-                # We don't continue here, to allow for long interval analysis if that data exists
-
-            for x in range(args.iterations):
-                holding_hours = args.base_hours * (x + 1)
-                print(f"--- 分析 ({interval_short} K線, {holding_hours} 小時) ---")
-
-                stock_data_to_analyze = latest_one_third(
-                    stock_data_short_interval, args.iterations / (x + 1)
+        with new_result_store(args) as retained_results:
+            for ticker_symbol in ticker_list:
+                ticker_results = analyze_ticker(
+                    ticker_symbol,
+                    data_short_batch,
+                    args,
+                    interval_short,
+                    filename_suffix,
+                    indicators,
+                    keep_returns=retained_results.wants,
                 )
-
-                analysis_results, detailed_df = analyze_fixed_time_lag(
-                    stock_data=stock_data_to_analyze,
-                    ticker=ticker_symbol,
-                    interval=interval_short,
-                    holding_hours=holding_hours,
-                    time_anchor=args.time_anchor,
+                if indicators is not None:
+                    indicators.discard(ticker_symbol)
+                release_bars(data_short_batch, ticker_symbol)
+                collect_ticker_results(
+                    ticker_symbol,
+                    ticker_results,
+                    retained_results,
+                    all_summary_results_master,
                 )
+                del ticker_results
 
-                if (
-                    analysis_results
-                    and detailed_df is not None
-                    and not detailed_df.empty
-                ):
-                    # --- NEW CODE START ---
-                    # 取得當前的迭代次數 (iteration number)
-                    iteration_num = x + 1
-
-                    # 1. 正規化「平均期望報酬率」 (analysis_results['expected_return'])
-                    # 這個值會用於 summary report 和 plot 上的平均線
-                    if "expected_return" in analysis_results:
-                        analysis_results["expected_return"] = (
-                            analysis_results["expected_return"] / iteration_num
-                        )
-
-                    # 2. 正規化「每筆交易的報酬率」 (detailed_df['return'])
-                    # 這個 DataFrame column 會用於繪製主圖表 (plot_results) 和
-                    # 跨股票比較圖 (plot_comparison_chart)
-                    if "return" in detailed_df.columns:
-                        detailed_df["return"] = detailed_df["return"] / iteration_num
-                    # --- NEW CODE END ---
-
-                    if args.save_data:
-                        analysis_filename = f"output_data/{ticker_symbol}_{holding_hours}hr_analysis.csv"
-                        detailed_df.to_csv(analysis_filename)
-                        print(
-                            f"分析資料已儲存至 (Analysis data saved to): {analysis_filename}"
-                        )
+            generate_summary_reports(all_summary_results_master, summary_filename)
 
-                    # Initialize dicts if they don't exist
-                    if holding_hours not in all_analysis_data_master:
-                        all_analysis_data_master[holding_hours] = {}
-                    if holding_hours not in all_summary_results_master:
-                        all_summary_results_master[holding_hours] = []
+            generate_comparison_plots(retained_results, ticker_list, "output_img", filename_suffix)
 
-                    all_analysis_data_master[holding_hours][ticker_symbol] = detailed_df
-                    all_summary_results_master[holding_hours].append(analysis_results)
+        for holding_hours, results_list in all_summary_results_master.items():
+            run_summary_results.setdefault(holding_hours, []).extend(results_list)
 
-                    if not args.plot_on_profit or (
-                        args.plot_on_profit and analysis_results["expected_return"] > 0
-                    ):
-                        print_results(analysis_results)
-                        plot_results(analysis_results, detailed_df, filename_suffix=filename_suffix)
+    return run_summary_results
 
-            print(f"\n======= {ticker_symbol} 分析結束 (Analysis Complete) =======")
 
-        generate_summary_reports(all_summary_results_master, summary_filename)
-
-        generate_comparison_plots(all_analysis_data_master, ticker_list, "output_img", filename_suffix)
-
-    return all_analysis_data_master, all_summary_results_master
+def new_result_store(args: argparse.Namespace) -> ResultStore:
+    """
+    每個群組保留比較圖所需的資料，超過 --retain-memory-mb 時寫入暫存檔。
+    A ResultStore for one group that keeps what generate_comparison_plots
+    needs, spilling to temporary files beyond --retain-memory-mb.
+    """
+    return ResultStore(
+        COMPARISON_COLUMNS,
+        max_tickers=COMPARISON_MAX_TICKERS,
+        memory_budget_mb=args.retain_memory_mb,
+    )
 
 
 def generate_summary_reports(all_summary_results_grouped: dict, summary_filename: str):
@@ -165,7 +451,7 @@ def generate_summary_reports(all_summary_results_grouped: dict, summary_filename
     Generates and prints the summary report, and appends it to a file.
     """
     report_header = "\n======= 總結：各持有週期報酬率排行 (Summary: Return Ranking by Holding Period) ======="
-    print(report_header)
+    logger.info(report_header)
     with open(summary_filename, "a", encoding="utf-8") as f:
         f.write(report_header + "\n")
 
@@ -178,7 +464,7 @@ def generate_summary_reports(all_summary_results_grouped: dict, summary_filename
             period_header = (
                 f"\n--- 持有 {holding_hours} 小時 (Holding {holding_hours} Hours) ---"
             )
-            print(period_header)
+            logger.info(period_header)
             f.write(period_header + "\n")
 
             sorted_list = sorted(
@@ -189,32 +475,68 @@ def generate_summary_reports(all_summary_results_grouped: dict, summary_filename
 
             if not sorted_list:
                 no_data_msg = "  (無有效資料 No valid data)"
-                print(no_data_msg)
+                logger.info(no_data_msg)
                 f.write(no_data_msg + "\n")
                 continue
 
             for result in sorted_list:
                 result_line = f"  - {result['ticker']}: {result['expected_return']:.4%}"
-                print(result_line)
+                quantiles = {}
+                if result.get("return_sketch") is not None:
+                    quantiles = dict(
+                        zip(
+                            (f"p{round(q * 100)}" for q in SUMMARY_QUANTILES),
+                            result["return_sketch"].quantiles(SUMMARY_QUANTILES),
+                        )
+                    )
+                if "expected_return_ci" in result:
+                    lower, upper = result["expected_return_ci"]
+                    # 信賴區間不含 0 時標記 * (Mark * when the interval excludes 0)
+                    significant = "*" if lower > 0 or upper < 0 else ""
+                    win_lower, win_upper = result["win_rate_ci"]
+                    result_line += (
+                        f" [CI {lower:.4%}, {upper:.4%}]{significant}"
+                        f" (Win Rate {result['win_rate']:.2%}"
+                        f" [CI {win_lower:.2%}, {win_upper:.2%}])"
+                    )
+                if quantiles:
+                    result_line += " [" + ", ".join(
+                        f"{label} {value:.4%}" for label, value in quantiles.items()
+                    ) + "]"
+                logger.info(
+                    result_line,
+                    extra={
+                        "fields": {
+                            "event": "summary",
+                            "holding_hours": holding_hours,
+                            **{
+                                key: value
+                                for key, value in result.items()
+                                if key not in ("holding_hours", "return_sketch")
+                            },
+                            "return_quantiles": quantiles,
+                        }
+                    },
+                )
                 f.write(result_line + "\n")
 
 
 def generate_comparison_plots(
-    all_analysis_data: dict, ticker_list: list, output_folder: str, filename_suffix: str
+    all_analysis_data: ResultStore, ticker_list: list, output_folder: str, filename_suffix: str
 ):
     """
     Generates comparison plot charts for each holding period.
     """
-    print("\n======= 正在產生比較圖表 (Generating Comparison Charts) =======")
+    logger.info("\n======= 正在產生比較圖表 (Generating Comparison Charts) =======")
 
     # Flatten the ticker list array for easier processing
     all_tickers_in_run = ticker_list
 
     for holding_hours, ticker_data_map in all_analysis_data.items():
         if ticker_data_map:
-            # Plot the first 5 tickers from the overall list that are present in the current data map
+            # Plot the first tickers from the overall list that are present in the current data map
             tickers_to_plot = [t for t in all_tickers_in_run if t in ticker_data_map][
-                :5
+                :COMPARISON_MAX_TICKERS
             ]
             if tickers_to_plot:
                 plot_comparison_chart(
@@ -226,55 +548,540 @@ def generate_comparison_plots(
                 )
 
 
+def release_bars(bars, ticker: str):
+    """
+    告知分批下載的來源此股票已用完 (Tells a --download-chunk-size source that
+    one use of ticker is done, so its bars can be dropped; see StreamingBars).
+    """
+    if hasattr(bars, "release"):
+        bars.release(ticker)
+
+
+def backtest_ticker(
+    data_short,
+    ticker: str,
+    args: argparse.Namespace,
+    ledger: TradeLedger,
+    indicators: IndicatorCache = None,
+) -> bool:
+    """
+    Backtests one ticker into ledger, block by block when --chunk-by is set.
+    Returns False if there is no data for the ticker.
+    """
+    if args.chunk_by:
+        has_data = ticker in data_short
+    else:
+        stock_data = data_short.get(ticker)
+        has_data = stock_data is not None and not stock_data.empty
+    if not has_data:
+        logger.warning(
+            f"\n--- {ticker}: 無法取得資料，跳過回測 (No data, skipping backtest) ---"
+        )
+        return False
+
+    if args.chunk_by:
+        run_strategy_backtest_chunked(
+            iter_bar_chunks(data_short, ticker, args.chunk_by), ticker, args, ledger
+        )
+    else:
+        run_strategy_backtest(
+            stock_data, ticker, args, ledger=ledger, indicators=indicators
+        )
+    return True
+
+
 def run_backtest_mode(
-    ticker_list_array: list, data_short: dict, args: argparse.Namespace
+    ticker_list_array: list,
+    data_short: dict,
+    args: argparse.Namespace,
+    indicators: IndicatorCache = None,
 ):
     """
     Runs the backtesting mode for the given tickers.
     """
-    print("\n======= 策略回測模式 (Strategy Backtest Mode) =======")
+    logger.info("\n======= 策略回測模式 (Strategy Backtest Mode) =======")
+    ledger = TradeLedger()
     for ticker_list in ticker_list_array:
         if not ticker_list:
             continue
         for ticker in ticker_list:
-            stock_data = data_short.get(ticker)
-            if stock_data is None or stock_data.empty:
-                print(
-                    f"\n--- {ticker}: 無法取得資料，跳過回測 (No data, skipping backtest) ---"
+            first_trade = len(ledger)
+            if backtest_ticker(data_short, ticker, args, ledger, indicators):
+                log_trade_report(ticker, ledger, first_trade)
+            release_bars(data_short, ticker)
+
+    if len(ledger):
+        log_trade_metrics(ledger)
+
+    return ledger
+
+
+def log_trade_report(ticker: str, ledger: TradeLedger, first_trade: int = 0):
+    """
+    Prints the per-trade report for the trades of one ticker starting at first_trade.
+    """
+    trade_count = len(ledger) - first_trade
+    if trade_count and logger.isEnabledFor(logging.INFO):
+        logger.info(
+            f"\n======= 回測報告: {ticker} (共 {trade_count} 筆交易) ======="
+        )
+        for i, result in enumerate(ledger.records(first_trade)):
+            logger.info(f"\n--- 交易 #{i + 1} ---")
+            if "trail_mode" in result:
+                indicator = result["trail_mode"].upper()
+                logger.info(
+                    f"策略: {result['entry_trail_mult']}x {indicator} 進場追蹤, "
+                    f"{result['exit_trail_mult']}x {indicator} 出場追蹤 "
+                    f"(視窗 window {result['trail_window']})"
+                )
+            else:
+                logger.info(
+                    f"策略: {result['entry_trail_pct']}% 進場追蹤, {result['exit_trail_pct']}% 出場追蹤"
                 )
+
+            if result["budget"]:
+                logger.info(f"預算 (Budget): ${result['budget']:.2f}")
+                logger.info(f"部位 (Shares): {result['shares']:g} 股 (基於預算計算)")
+            else:
+                logger.info(f"部位 (Shares): {result['shares']:g} 股 (固定)")
+
+            logger.info(
+                f"買入觸發: ${result['buy_price']:.2f} (於 {result['buy_time'].strftime('%Y-%m-%d %H:%M')})"
+            )
+            logger.info(
+                f"賣出觸發: ${result['sell_price']:.2f} (於 {result['sell_time'].strftime('%Y-%m-%d %H:%M')})"
+            )
+            logger.info("----------------------------------------")
+            logger.info(
+                f"每股獲利: ${result['sell_price'] - result['buy_price']:.2f}"
+            )
+            logger.info(f"每股獲利率 (Profit %): {result['profit_pct']:.2%}")
+            logger.info(f"總損益: ${result['profit_and_loss']:.2f}")
+        logger.info("======================================\n")
+
+
+def log_trade_metrics(ledger: TradeLedger):
+    """
+    Prints the per-ticker and aggregate performance metrics of a trade ledger.
+    """
+    metrics = compute_trade_metrics(ledger)
+    logger.info("\n======= 績效統計 (Performance Metrics) =======")
+    logger.info(
+        metrics.to_string(
+            formatters={
+                "total_pnl": "{:,.2f}".format,
+                "avg_pnl": "{:,.2f}".format,
+                "win_rate": "{:.2%}".format,
+                "profit_factor": "{:.2f}".format,
+                "avg_profit_pct": "{:.4%}".format,
+                "max_drawdown": "{:,.2f}".format,
+            }
+        )
+    )
+
+
+def iter_interval_runs(data_short, args: argparse.Namespace):
+    """
+    依序產生每個 --interval-short 間隔的 (間隔, 參數, K 線來源)。
+    Yields (interval, args, bars) for every --interval-short interval, finest
+    first. The finest interval uses the downloaded bars and args as they are;
+    every coarser one gets a copy of args with that interval_short and a
+    ResampledBars view of the downloaded bars.
+    """
+    for interval in args.intervals_short:
+        if interval == args.interval_short:
+            yield interval, args, data_short
+            continue
+        logger.info(
+            f"\n======= {interval} K 線 (由 {args.interval_short} 重新取樣) "
+            f"({interval} bars, resampled from {args.interval_short}) ======="
+        )
+        yield (
+            interval,
+            argparse.Namespace(**{**vars(args), "interval_short": interval}),
+            ResampledBars(
+                data_short, interval, args.interval_short, args.regular_hours_only
+            ),
+        )
+
+
+def compare_intervals(interval_results: dict, shard_mode: str) -> pd.DataFrame:
+    """
+    將各間隔的結果整理成一張比較表 (One comparison table across intervals).
+
+    ``interval_results`` maps each interval to run_analysis_loops' summary
+    results ({holding_hours: [analysis_results, ...]}) in analysis mode, or
+    to run_backtest_mode's ledger in backtest mode. Analysis rows are one per
+    interval, ticker and holding period; backtest rows are the per-ticker and
+    ALL performance metrics of every interval.
+    """
+    frames = []
+    for interval, results in interval_results.items():
+        if shard_mode == "backtest":
+            if not len(results):
                 continue
+            frame = compute_trade_metrics(results).reset_index(names="ticker")
+        else:
+            frame = pd.DataFrame(
+                [
+                    {
+                        "ticker": result["ticker"],
+                        "holding_hours": holding_hours,
+                        "total_trades": result["total_trades"],
+                        "expected_return": result["expected_return"],
+                        "win_rate": result["win_rate"],
+                        "loss_probability": result["loss_probability"],
+                    }
+                    for holding_hours, results_list in sorted(results.items())
+                    for result in results_list
+                ]
+            )
+            # 同一股票在多個群組時只保留一次 (A ticker in several groups is kept once)
+            frame = frame.drop_duplicates(["ticker", "holding_hours"])
+        frame.insert(0, "interval", interval)
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+def report_interval_comparison(
+    interval_results: dict, shard_mode: str, filename_suffix: str
+):
+    """
+    Prints the cross-interval comparison and saves it to output_data.
+    """
+    comparison = compare_intervals(interval_results, shard_mode)
+    if comparison.empty:
+        return comparison
+
+    logger.info("\n======= 各 K 線間隔比較 (Comparison Across Intervals) =======")
+    if shard_mode == "backtest":
+        columns = ["trades", "total_pnl", "win_rate", "profit_factor", "avg_profit_pct"]
+        table = comparison.pivot(
+            index="ticker", columns="interval", values=columns
+        ).reindex(comparison["ticker"].unique())
+    else:
+        table = comparison.pivot(
+            index=["ticker", "holding_hours"],
+            columns="interval",
+            values=["expected_return", "win_rate"],
+        )
+    table = table.reindex(columns=list(interval_results), level="interval")
+    if shard_mode == "backtest":
+        logger.info(table.to_string(float_format=lambda v: f"{v:,.4f}"))
+    else:
+        logger.info(table.to_string(float_format=lambda v: f"{v:.4%}"))
+
+    output_filename = f"output_data/interval_comparison_{shard_mode}{filename_suffix}.csv"
+    comparison.to_csv(output_filename, index=False)
+    logger.info(f"間隔比較已儲存至 (Interval comparison saved to): {output_filename}")
+    return comparison
 
-            results = run_strategy_backtest(stock_data, ticker, args)
 
-            if results:
-                print(
-                    f"\n======= 回測報告: {ticker} (共 {len(results)} 筆交易) ======="
+def shard_run_config(args: argparse.Namespace, shard_mode: str) -> dict:
+    """
+    Arguments that must match across all shards of one run.
+    """
+    return {
+        "mode": shard_mode,
+        "interval_short": args.interval_short,
+        "prepost_short": args.prepost_short,
+        "period": args.period,
+        "start_date": args.start_date,
+        "end_date": args.end_date,
+        "base_hours": args.base_hours,
+        "iterations": args.iterations,
+        "time_anchor": args.time_anchor,
+        "horizon_mode": args.horizon_mode,
+        "regular_hours_only": args.regular_hours_only,
+        "bootstrap_replicates": args.bootstrap_replicates,
+        "bootstrap_seed": args.bootstrap_seed,
+        "bootstrap_confidence": args.bootstrap_confidence,
+        "sketch_k": args.sketch_k,
+        "entry_trail_pct": args.entry_trail_pct,
+        "exit_trail_pct": args.exit_trail_pct,
+        "budget": args.budget,
+        "shares": args.shares,
+        "daily_trades": args.daily_trades,
+        "trail_mode": args.trail_mode,
+        "entry_trail_mult": args.entry_trail_mult,
+        "exit_trail_mult": args.exit_trail_mult,
+        "trail_window": args.trail_window,
+        "backtest_engine": args.backtest_engine,
+    }
+
+
+def run_shard(
+    ticker_list_array: list,
+    data_short_batch,
+    args: argparse.Namespace,
+    shard_mode: str,
+    interval_short: str,
+    filename_suffix: str,
+    indicators: IndicatorCache = None,
+):
+    """
+    Runs this shard's tickers and checkpoints each ticker's partial results.
+    """
+    logger.info(f"\n======= 分片 {args.shard} (Shard {args.shard}) =======")
+    for ticker_list in ticker_list_array:
+        for ticker in ticker_list:
+            if shard_mode == "backtest":
+                ledger = TradeLedger()
+                if backtest_ticker(data_short_batch, ticker, args, ledger, indicators):
+                    log_trade_report(ticker, ledger)
+                payload = {"trades": ledger}
+            else:
+                ticker_results = analyze_ticker(
+                    ticker,
+                    data_short_batch,
+                    args,
+                    interval_short,
+                    filename_suffix,
+                    indicators,
                 )
-                for i, result in enumerate(results):
-                    print(f"\n--- 交易 #{i + 1} ---")
-                    print(
-                        f"策略: {result['entry_trail_pct']}% 進場追蹤, {result['exit_trail_pct']}% 出場追蹤"
+                # 比較圖只需要報酬欄位 (Comparison charts only need the return column)
+                payload = {
+                    "summary": {h: r for h, (r, _) in ticker_results.items()},
+                    "returns": {
+                        h: df[COMPARISON_COLUMNS] for h, (_, df) in ticker_results.items()
+                    },
+                }
+            if indicators is not None:
+                indicators.discard(ticker)
+            release_bars(data_short_batch, ticker)
+            save_checkpoint(args.shard_dir, shard_mode, ticker, payload)
+            logger.info(f"  - {ticker}: 已儲存分片結果 (Checkpoint saved)")
+
+
+def merge_shard_results(
+    ticker_list_array: list,
+    args: argparse.Namespace,
+    shard_mode: str,
+    summary_filename: str,
+    filename_suffix: str,
+):
+    """
+    Merges the shard checkpoints into the same reports a single run produces.
+    """
+    logger.info(f"\n======= 合併分片結果 (Merging shard results from {args.shard_dir}) =======")
+    missing = []
+    ledgers = []
+    for ticker_list in ticker_list_array:
+        if not ticker_list:
+            continue
+
+        all_summary_results_master = {}
+        with new_result_store(args) as retained_results:
+            for ticker in ticker_list:
+                payload = load_checkpoint(args.shard_dir, shard_mode, ticker)
+                if payload is None:
+                    missing.append(ticker)
+                elif shard_mode == "backtest":
+                    ledgers.append(payload["trades"])
+                else:
+                    collect_ticker_results(
+                        ticker,
+                        {
+                            h: (results, payload["returns"][h])
+                            for h, results in payload["summary"].items()
+                        },
+                        retained_results,
+                        all_summary_results_master,
                     )
 
-                    if result["budget"]:
-                        print(f"預算 (Budget): ${result['budget']:.2f}")
-                        print(f"部位 (Shares): {result['shares']} 股 (基於預算計算)")
-                    else:
-                        print(f"部位 (Shares): {result['shares']} 股 (固定)")
+            if shard_mode == "analysis":
+                generate_summary_reports(all_summary_results_master, summary_filename)
+                generate_comparison_plots(
+                    retained_results, ticker_list, "output_img", filename_suffix
+                )
 
-                    print(
-                        f"買入觸發: ${result['buy_price']:.2f} (於 {result['buy_time'].strftime('%Y-%m-%d %H:%M')})"
-                    )
-                    print(
-                        f"賣出觸發: ${result['sell_price']:.2f} (於 {result['sell_time'].strftime('%Y-%m-%d %H:%M')})"
-                    )
-                    print("----------------------------------------")
-                    print(
-                        f"每股獲利: ${result['sell_price'] - result['buy_price']:.2f}"
-                    )
-                    print(f"每股獲利率 (Profit %): {result['profit_pct']:.2%}")
-                    print(f"總損益: ${result['profit_and_loss']:.2f}")
-                print("======================================\n")
+    if missing:
+        logger.warning(
+            f"\n警告：以下股票沒有分片結果 (Warning: no shard results for): {', '.join(missing)}"
+        )
+    if shard_mode == "backtest":
+        ledger = TradeLedger.concat(ledgers)
+        if len(ledger):
+            log_trade_metrics(ledger)
+        return ledger
+
+
+def run_stress_test_mode(
+    ticker_list_array: list, data_short: dict, args: argparse.Namespace
+):
+    """
+    Runs the Monte Carlo stress test mode for the given tickers.
+    """
+    logger.info("\n======= 蒙地卡羅壓力測試模式 (Monte Carlo Stress Test Mode) =======")
+    logger.info(
+        f"策略: {args.entry_trail_pct}% 進場追蹤, {args.exit_trail_pct}% 出場追蹤, "
+        f"{args.stress_paths} 條路徑 (paths)"
+    )
+    for ticker_list in ticker_list_array:
+        if not ticker_list:
+            continue
+        for ticker in ticker_list:
+            stock_data = data_short.get(ticker)
+            release_bars(data_short, ticker)
+            if stock_data is None or stock_data.dropna().empty:
+                logger.warning(
+                    f"\n--- {ticker}: 無法取得資料，跳過壓力測試 (No data, skipping stress test) ---"
+                )
+                continue
+
+            results = run_stress_test(stock_data.dropna(), ticker, args)
+            if results is None:
+                continue
+
+            summary = summarize_stress_results(results)
+            logger.info(f"\n======= 壓力測試報告: {ticker} =======")
+            logger.info(summary.to_string(float_format=lambda v: f"{v:,.4f}"))
+
+            if args.save_data:
+                stress_filename = f"output_data/{ticker}_stress_paths.csv"
+                pd.DataFrame(results).to_csv(stress_filename, index_label="path")
+                logger.info(f"壓力測試資料已儲存至 (Stress test data saved to): {stress_filename}")
+            logger.info("======================================\n")
+
+
+def run_optimize_mode(
+    ticker_list_array: list,
+    data_short: dict,
+    args: argparse.Namespace,
+    filename_suffix: str,
+    indicators: IndicatorCache = None,
+):
+    """
+    Runs the trail-percentage optimizer for the given tickers.
+    """
+    logger.info("\n======= 追蹤停損參數最佳化 (Trail Optimizer Mode) =======")
+    candidates = sample_candidates(
+        args.opt_candidates,
+        tuple(args.opt_entry_range),
+        tuple(args.opt_exit_range),
+        seed=args.opt_seed,
+        names=candidate_names(args.trail_mode),
+    )
+    logger.info(
+        f"{len(candidates)} 組候選參數, eta={args.opt_eta}, 驗證期 {args.opt_holdout:.0%} "
+        f"({len(candidates)} candidates, eta={args.opt_eta}, holdout {args.opt_holdout:.0%})"
+    )
+
+    tables = []
+    best_rows = []
+    total_bars = 0
+    total_grid_bars = 0
+    for ticker_list in ticker_list_array:
+        for ticker in ticker_list:
+            stock_data = data_short.get(ticker)
+            release_bars(data_short, ticker)
+            if stock_data is None or stock_data.dropna().empty:
+                logger.warning(
+                    f"\n--- {ticker}: 無法取得資料，跳過最佳化 (No data, skipping optimizer) ---"
+                )
+                continue
+
+            table, bars, grid_bars = optimize_trails(
+                stock_data.dropna(), ticker, args, candidates, indicators
+            )
+            if indicators is not None:
+                indicators.discard(ticker)
+            if table is None:
+                continue
+            tables.append(table)
+            best_rows.append(table.iloc[0])
+            total_bars += bars
+            total_grid_bars += grid_bars
+
+            logger.info(f"\n--- {ticker}: 前 {args.opt_top} 名 (Top {args.opt_top}) ---")
+            logger.info(
+                table.head(args.opt_top)
+                .drop(columns="ticker")
+                .to_string(index=False, float_format=lambda v: f"{v:,.4f}")
+            )
+
+    if not tables:
+        return None
+
+    best = pd.DataFrame(best_rows).reset_index(drop=True)
+    logger.info("\n======= 各股票最佳參數 (Best Settings per Ticker) =======")
+    logger.info(best.to_string(index=False, float_format=lambda v: f"{v:,.4f}"))
+    logger.info(
+        f"\n模擬 K 棒數 (Bars simulated): {total_bars:,} / 完整網格 (full grid) {total_grid_bars:,} "
+        f"= {total_bars / total_grid_bars:.1%}"
+    )
+
+    results = pd.concat(tables, ignore_index=True)
+    optimize_filename = f"output_data/optimize_trails{filename_suffix}.csv"
+    results.to_csv(optimize_filename, index=False)
+    logger.info(f"最佳化結果已儲存至 (Optimizer results saved to): {optimize_filename}")
+    return results
+
+
+def run_lead_lag_mode(
+    ticker_list_array: list,
+    data_short,
+    args: argparse.Namespace,
+    filename_suffix: str,
+):
+    """
+    Ranks ticker pairs by the lead-lag of their bar returns.
+    """
+    logger.info("\n======= 領先/落後分析 (Lead-Lag Analysis) =======")
+    table = rank_lead_lag(
+        data_short,
+        ticker_list_array,
+        args.interval_short,
+        args.lead_lag_max_lag,
+        scope=args.lead_lag_scope,
+        regular_hours_mask=(
+            (lambda index: regular_hours_mask(index, args.interval_short))
+            if args.regular_hours_only
+            else None
+        ),
+    )
+    if table.empty:
+        logger.warning("沒有可比較的股票對 (No ticker pairs to compare).")
+        return table
+
+    logger.info(
+        f"{len(table)} 組股票對，最大落後 {args.lead_lag_max_lag} 根 K 棒 "
+        f"({len(table)} pairs, lags up to {args.lead_lag_max_lag} bars)"
+    )
+    logger.info(
+        f"\n--- 前 {args.lead_lag_top} 名 (Top {args.lead_lag_top}: leader -> follower) ---"
+    )
+    logger.info(
+        table.head(args.lead_lag_top).to_string(
+            index=False, float_format=lambda v: f"{v:,.4f}"
+        )
+    )
+
+    output_filename = f"output_data/lead_lag{filename_suffix}.csv"
+    table.to_csv(output_filename, index=False)
+    logger.info(f"領先/落後排名已儲存至 (Lead-lag ranking saved to): {output_filename}")
+    return table
+
+
+def write_export_feed_manifest(args: argparse.Namespace):
+    """
+    Rebuilds the --export-feed manifest from the datasets exported so far.
+    """
+    if (
+        not args.export_feed
+        or args.strategy_backtest
+        or args.stress_test
+        or args.optimize_trails
+        or args.lead_lag
+    ):
+        return
+    manifest = write_feed_manifest(args.export_feed)
+    logger.info(
+        f"視覺化資料已匯出至 (Visualizer feed exported to): {args.export_feed} "
+        f"({sum(len(d) for d in manifest['tickers'].values())} datasets)"
+    )
 
 
 def main():
@@ -284,6 +1091,36 @@ def main():
     plt.ioff()
     parser = setup_arg_parser()
     args = parser.parse_args()
+    setup_logging(args.log_level, quiet=args.quiet, json_path=args.log_json)
+    if args.chunk_by and args.horizon_mode != "bars" and not args.strategy_backtest:
+        parser.error("--chunk-by requires --horizon-mode bars.")
+    if args.trail_mode != "fixed" and (args.chunk_by or args.stress_test):
+        parser.error(
+            f"--trail-mode {args.trail_mode} is not supported with --chunk-by or --stress-test."
+        )
+    if args.backtest_engine == "event" and args.chunk_by:
+        parser.error("--backtest-engine event is not supported with --chunk-by.")
+    if args.opt_eta < 2:
+        parser.error("--opt-eta must be at least 2.")
+    if args.lead_lag_max_lag < 1 or args.lead_lag_top < 1:
+        parser.error("--lead-lag-max-lag and --lead-lag-top must be at least 1.")
+    if args.download_chunk_size < 0 or args.download_queue < 1:
+        parser.error("--download-chunk-size must be >= 0 and --download-queue >= 1.")
+    if args.download_chunk_size and args.bar_store:
+        parser.error("--download-chunk-size cannot be combined with --bar-store.")
+    if len(args.intervals_short) > 1 and (
+        args.shard
+        or args.merge_shards
+        or args.export_feed
+        or (
+            not args.strategy_backtest
+            and (args.stress_test or args.optimize_trails or args.lead_lag)
+        )
+    ):
+        parser.error(
+            "Several --interval-short intervals are only supported by the analysis "
+            "and --strategy-backtest modes, without --shard, --merge-shards or --export-feed."
+        )
 
     # 自動建立輸出資料夾 (Automatically create output folders)
     os.makedirs("output_img", exist_ok=True)
@@ -291,7 +1128,7 @@ def main():
     os.makedirs("output_data", exist_ok=True)
 
     if args.clean:
-        print("Cleaning output directories...")
+        logger.info("Cleaning output directories...")
         # Clean images
         img_files = glob.glob("output_img/*.png")
         img_count = 0
@@ -300,8 +1137,8 @@ def main():
                 os.remove(f)
                 img_count += 1
             except OSError as e:
-                print(f"Error removing file {f}: {e}")
-        print(f"Removed {img_count} .png file(s) from output_img/.")
+                logger.error(f"Error removing file {f}: {e}")
+        logger.info(f"Removed {img_count} .png file(s) from output_img/.")
 
         # Clean text reports
         txt_files = glob.glob("output_txt/*.txt")
@@ -311,8 +1148,8 @@ def main():
                 os.remove(f)
                 txt_count += 1
             except OSError as e:
-                print(f"Error removing file {f}: {e}")
-        print(f"Removed {txt_count} .txt file(s) from output_txt/.")
+                logger.error(f"Error removing file {f}: {e}")
+        logger.info(f"Removed {txt_count} .txt file(s) from output_txt/.")
 
         # Clean data files
         csv_files = glob.glob("output_data/*.csv")
@@ -322,8 +1159,8 @@ def main():
                 os.remove(f)
                 csv_count += 1
             except OSError as e:
-                print(f"Error removing file {f}: {e}")
-        print(f"Removed {csv_count} .csv file(s) from output_data/.")
+                logger.error(f"Error removing file {f}: {e}")
+        logger.info(f"Removed {csv_count} .csv file(s) from output_data/.")
 
     # Dynamic Date Calculation
     max_lookback_hours = args.base_hours * args.iterations
@@ -331,7 +1168,7 @@ def main():
 
     if args.start_date and args.end_date:
         # --- 模式 1：絕對日期 (Absolute Date Mode) ---
-        print("模式：使用絕對日期區間 (Mode: Using absolute date range)")
+        logger.info("模式：使用絕對日期區間 (Mode: Using absolute date range)")
         analysis_start_date = pd.Timestamp(args.start_date)
         analysis_end_date = pd.Timestamp(args.end_date)
 
@@ -344,7 +1181,7 @@ def main():
 
     else:
         # --- 模式 2：相對日期 (Relative Date Mode - Current Logic) ---
-        print(f"模式：使用相對期間 (Mode: Using relative period '{args.period}')")
+        logger.info(f"模式：使用相對期間 (Mode: Using relative period '{args.period}')")
         analysis_period_timedelta = pd.Timedelta(args.period)
         total_download_timedelta = max_lookback_timedelta + analysis_period_timedelta
         end_date = pd.Timestamp.now()
@@ -359,20 +1196,31 @@ def main():
     else:
         period_str = f"period-{args.period}"
 
-    filename_suffix = f"_{args.interval_short}_anchor-{args.time_anchor}_{period_str}"
+    # 每個 K 線間隔各自的檔名後綴與報告 (One suffix and report per interval)
+    filename_suffixes = {
+        interval: f"_{interval}_anchor-{args.time_anchor}_{period_str}"
+        for interval in args.intervals_short
+    }
+    filename_suffix = filename_suffixes[args.interval_short]
     # --- 檔名後綴建立完畢 ---
 
     # 定義報告檔案路徑 (Define report file path) with base hours
-    summary_filename = f"output_txt/summary_base-{args.base_hours}_iter-{args.iterations}{filename_suffix}.txt"
+    summary_filenames = {
+        interval: f"output_txt/summary_base-{args.base_hours}_iter-{args.iterations}{suffix}.txt"
+        for interval, suffix in filename_suffixes.items()
+    }
+    summary_filename = summary_filenames[args.interval_short]
 
     # 在迴圈開始前，清空檔案並寫入標頭 (Before the loop, clear the file and write the header)
     try:
-        with open(summary_filename, "w", encoding="utf-8") as f:
-            f.write("Stock Dynamic Analysis Report\n")
-            f.write("=============================\n")
-        print(f"Summary report will be saved to {summary_filename}")
+        for summary_filename in summary_filenames.values():
+            with open(summary_filename, "w", encoding="utf-8") as f:
+                f.write("Stock Dynamic Analysis Report\n")
+                f.write("=============================\n")
+            logger.info(f"Summary report will be saved to {summary_filename}")
+        summary_filename = summary_filenames[args.interval_short]
     except IOError as e:
-        print(f"Error: Unable to write to file {summary_filename}. {e}")
+        logger.error(f"Error: Unable to write to file {summary_filename}. {e}")
         # 選擇性地決定是否要因此錯誤而中止程式
         # Optionally, decide if you want to exit the script on this error
         return
@@ -383,7 +1231,7 @@ def main():
     # --- Ticker Configuration ---
     # Check if the --tickers argument is provided. If so, override the config.
     if args.tickers:
-        print(
+        logger.info(
             f"模式：使用命令行提供的 Tickers (Mode: Using tickers from command line): {args.tickers}"
         )
         TICKER_SYMBOLS = args.tickers
@@ -391,12 +1239,79 @@ def main():
             args.tickers
         ]  # Analyze all provided tickers as a single group
     else:
-        print("模式：使用設定檔中的 Tickers (Mode: Using tickers from config file)")
+        logger.info("模式：使用設定檔中的 Tickers (Mode: Using tickers from config file)")
         from src.stock_analysis.config import TICKER_SYMBOLS, TICKER_LIST_ARRAY
 
+    # --- Sharding ---
+    shard_mode = "backtest" if args.strategy_backtest else "analysis"
+    if args.merge_shards:
+        # 只合併同一執行設定的分片 (Only merge shards of the same run configuration)
+        try:
+            load_plan(
+                args.shard_dir, TICKER_LIST_ARRAY, shard_run_config(args, shard_mode)
+            )
+        except ValueError as e:
+            parser.error(str(e))
+        merge_shard_results(
+            TICKER_LIST_ARRAY, args, shard_mode, summary_filename, filename_suffix
+        )
+        write_export_feed_manifest(args)
+        logger.info("\n======= 程式執行完畢 (Process Finished) =======")
+        return
+
+    if args.shard:
+        try:
+            shard_index, n_shards = parse_shard_spec(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+        weights = None
+        if args.bar_store:
+            store_path = bar_store_path(
+                args.bar_store, args.interval_short, args.prepost_short
+            )
+            if os.path.exists(os.path.join(store_path, "manifest.json")):
+                weights = expected_bar_counts(BarStore(store_path), TICKER_SYMBOLS)
+        try:
+            plan = load_or_create_plan(
+                args.shard_dir,
+                TICKER_LIST_ARRAY,
+                n_shards,
+                shard_run_config(args, shard_mode),
+                weights,
+            )
+        except ValueError as e:
+            parser.error(str(e))
+        assigned = plan["shards"][shard_index]
+        pending = [
+            t for t in assigned if not has_checkpoint(args.shard_dir, shard_mode, t)
+        ]
+        logger.info(
+            f"分片 {args.shard}: {len(assigned)} 檔股票，{len(assigned) - len(pending)} 檔已完成 "
+            f"(Shard {args.shard}: {len(assigned)} tickers, {len(assigned) - len(pending)} already done)"
+        )
+        if not pending:
+            logger.info("\n======= 程式執行完畢 (Process Finished) =======")
+            return
+        TICKER_SYMBOLS = pending
+        TICKER_LIST_ARRAY = [
+            [t for t in ticker_list if t in pending] for ticker_list in TICKER_LIST_ARRAY
+        ]
+
+    # 分批下載時依群組順序下載，讓最先分析的股票最先到達
+    # (Chunked downloads follow the group order, so the first tickers analyzed arrive first)
+    download_tickers = TICKER_SYMBOLS
+    if args.download_chunk_size:
+        symbols = set(TICKER_SYMBOLS)
+        download_tickers = list(
+            dict.fromkeys(
+                [t for t in itertools.chain(*TICKER_LIST_ARRAY) if t in symbols]
+                + list(TICKER_SYMBOLS)
+            )
+        )
+
     # Use the global TICKER_SYMBOLS for the download
     data_short, data_long = download_stock_data(
-        TICKER_SYMBOLS,
+        download_tickers,
         args.interval_short,
         INTERVAL_LONG,
         start_date,
@@ -405,42 +1320,112 @@ def main():
         args,
     )
 
+    # 分批下載時，每檔股票用完即丟棄其 K 線 (lead-lag 需要全部股票，因此保留)
+    # (With chunked downloads each ticker's bars are dropped once its last use
+    # is done; lead-lag needs every ticker at once, so it keeps them)
+    if isinstance(data_short, StreamingBars):
+        if args.download_only:
+            uses = dict.fromkeys(TICKER_SYMBOLS, 1 if args.save_data else 0)
+            data_long.set_uses(uses)
+            data_short.set_uses(uses)
+        elif not args.lead_lag:
+            group_counts = collections.Counter(itertools.chain(*TICKER_LIST_ARRAY))
+            data_short.set_uses(
+                {
+                    ticker: count * len(args.intervals_short)
+                    for ticker, count in group_counts.items()
+                }
+            )
+
+    # 各模式共用的指標快取 (Indicator cache shared by every mode)
+    indicators = IndicatorCache()
+    comparison_suffix = (
+        f"_{'-'.join(args.intervals_short)}_anchor-{args.time_anchor}_{period_str}"
+    )
+
     # --- Download Only Mode ---
     if args.download_only:
         if args.save_data:
-            print("--- 儲存已下載的資料 (Saving downloaded data) ---")
+            logger.info("--- 儲存已下載的資料 (Saving downloaded data) ---")
             for ticker in TICKER_SYMBOLS:
                 # Save short interval data
                 df_short = data_short.get(ticker)
                 if df_short is not None and not df_short.empty:
                     filename_short = f"output_data/{ticker}_{args.interval_short}_raw.csv"
                     df_short.to_csv(filename_short)
-                    print(f"  - Saved short-interval data for {ticker} to {filename_short}")
+                    logger.info(f"  - Saved short-interval data for {ticker} to {filename_short}")
 
                 # Save long interval data
                 df_long = data_long.get(ticker)
                 if df_long is not None and not df_long.empty:
                     filename_long = f"output_data/{ticker}_{INTERVAL_LONG}_raw.csv"
                     df_long.to_csv(filename_long)
-                    print(f"  - Saved long-interval data for {ticker} to {filename_long}")
+                    logger.info(f"  - Saved long-interval data for {ticker} to {filename_long}")
+                release_bars(data_short, ticker)
+                release_bars(data_long, ticker)
 
-        print("\n資料下載完成，已根據 --download-only 指令跳過分析。")
-        print("Data download complete. Skipping analysis as per --download-only flag.")
+        logger.info("\n資料下載完成，已根據 --download-only 指令跳過分析。")
+        logger.info("Data download complete. Skipping analysis as per --download-only flag.")
 
-    elif args.strategy_backtest:
-        run_backtest_mode(TICKER_LIST_ARRAY, data_short, args)
-    else:
-        all_data, all_results = run_analysis_loops(
+    elif args.shard:
+        run_shard(
             TICKER_LIST_ARRAY,
             data_short,
-            data_long,
             args,
-            summary_filename,
+            shard_mode,
             args.interval_short,
             filename_suffix,
+            indicators,
         )
+    elif args.strategy_backtest:
+        interval_ledgers = {
+            interval: run_backtest_mode(
+                TICKER_LIST_ARRAY, interval_data, interval_args, indicators
+            )
+            for interval, interval_args, interval_data in iter_interval_runs(
+                data_short, args
+            )
+        }
+        if len(interval_ledgers) > 1:
+            report_interval_comparison(
+                interval_ledgers, shard_mode, comparison_suffix
+            )
+    elif args.stress_test:
+        run_stress_test_mode(TICKER_LIST_ARRAY, data_short, args)
+    elif args.optimize_trails:
+        run_optimize_mode(
+            TICKER_LIST_ARRAY, data_short, args, filename_suffix, indicators
+        )
+    elif args.lead_lag:
+        run_lead_lag_mode(TICKER_LIST_ARRAY, data_short, args, filename_suffix)
+    else:
+        interval_summaries = {}
+        for interval, interval_args, interval_data in iter_interval_runs(
+            data_short, args
+        ):
+            interval_summaries[interval] = run_analysis_loops(
+                TICKER_LIST_ARRAY,
+                interval_data,
+                data_long,
+                interval_args,
+                summary_filenames[interval],
+                interval,
+                filename_suffixes[interval],
+                indicators,
+            )
+        if len(interval_summaries) > 1:
+            report_interval_comparison(
+                interval_summaries, shard_mode, comparison_suffix
+            )
+
+    if not args.download_only:
+        write_export_feed_manifest(args)
+
+    for bars in (data_short, data_long):
+        if isinstance(bars, StreamingBars):
+            bars.close()
 
-    print("\n======= 程式執行完畢 (Process Finished) =======")
+    logger.info("\n======= 程式執行完畢 (Process Finished) =======")
 
 
 # --- 執行主程式 (Run Main Program) ---
@@ -0,0 +1,258 @@
+import json
+import os
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+BAR_STORE_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+STORE_TZ = "America/New_York"
+
+
+def bar_store_path(root: str, interval: str, prepost: bool) -> str:
+    """每個 K 線間隔 (及盤前盤後設定) 各自一個資料夾 (One directory per interval/prepost)."""
+    return os.path.join(root, f"{interval}{'_prepost' if prepost else ''}")
+
+
+def write_bar_store(
+    path: str,
+    data_batch: pd.DataFrame,
+    tickers: list,
+    interval: str,
+    start,
+    end,
+    prepost: bool,
+):
+    """
+    將 yf.download (group_by="ticker") 的結果寫成可記憶體映射的 K 線檔。
+    Writes a yf.download (group_by="ticker") result as a memory-mappable bar
+    store.
+
+    Layout: ``values-<token>.npy`` holds float64 OHLCV as (columns, rows) so
+    each column of each ticker is one contiguous run, ``timestamps-<token>.npy``
+    holds int64 UTC nanoseconds, and ``manifest.json`` maps every ticker to its
+    row offset and length. The manifest is replaced atomically after the data
+    files are complete, so readers never see a partially written store.
+    """
+    os.makedirs(path, exist_ok=True)
+
+    frames = {}
+    for ticker in tickers:
+        try:
+            frame = data_batch[ticker].dropna(how="all")
+        except (KeyError, AttributeError):
+            continue
+        if not frame.empty:
+            frames[ticker] = frame
+    columns = list(next(iter(frames.values())).columns) if frames else []
+
+    entries = {}
+    offset = 0
+    for ticker, frame in frames.items():
+        entries[ticker] = {"offset": offset, "length": len(frame)}
+        offset += len(frame)
+
+    token = uuid.uuid4().hex[:12]
+    values = np.lib.format.open_memmap(
+        os.path.join(path, f"values-{token}.npy"),
+        mode="w+",
+        dtype=np.float64,
+        shape=(len(columns), offset),
+    )
+    timestamps = np.lib.format.open_memmap(
+        os.path.join(path, f"timestamps-{token}.npy"),
+        mode="w+",
+        dtype=np.int64,
+        shape=(offset,),
+    )
+    for ticker, frame in frames.items():
+        rows = slice(entries[ticker]["offset"], entries[ticker]["offset"] + len(frame))
+        values[:, rows] = frame.reindex(columns=columns).to_numpy(dtype=np.float64).T
+        index = frame.index
+        if index.tz is None:
+            index = index.tz_localize("UTC")
+        timestamps[rows] = index.as_unit("ns").asi8
+    values.flush()
+    timestamps.flush()
+    del values, timestamps
+
+    manifest = {
+        "version": BAR_STORE_VERSION,
+        "token": token,
+        "interval": interval,
+        "prepost": prepost,
+        "start": pd.Timestamp(start).isoformat(),
+        "end": pd.Timestamp(end).isoformat(),
+        "columns": columns,
+        "requested_tickers": list(tickers),
+        "tickers": entries,
+    }
+    manifest_tmp = os.path.join(path, f"{MANIFEST_NAME}.{token}.tmp")
+    with open(manifest_tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    old_token = _read_manifest(path).get("token") if _has_manifest(path) else None
+    os.replace(manifest_tmp, os.path.join(path, MANIFEST_NAME))
+
+    # 舊檔案即使被移除，已映射的處理程序仍可繼續讀取 (Mapped readers keep unlinked files alive)
+    if old_token and old_token != token:
+        for prefix in ("values", "timestamps"):
+            try:
+                os.remove(os.path.join(path, f"{prefix}-{old_token}.npy"))
+            except OSError:
+                pass
+
+
+def _has_manifest(path: str) -> bool:
+    return os.path.exists(os.path.join(path, MANIFEST_NAME))
+
+
+def _read_manifest(path: str) -> dict:
+    with open(os.path.join(path, MANIFEST_NAME), encoding="utf-8") as f:
+        return json.load(f)
+
+
+class BarStore:
+    """
+    以唯讀記憶體映射開啟的 K 線檔；同一台主機上的多個處理程序共用同一份實體記憶體。
+    Read-only, memory-mapped view of a bar store. Every process that opens the
+    same store shares one physical copy of the data through the page cache.
+
+    Supports the parts of the yf.download DataFrame interface used by the
+    pipeline: ``store[ticker]``, ``store.get(ticker)``, ``ticker in store`` and
+    ``store.empty``. Frames are built on zero-copy views of the mapped arrays
+    and can be restricted to a [start, end) range.
+    """
+
+    def __init__(self, path: str, start=None, end=None):
+        self.path = path
+        # 寫入者可能在讀取 manifest 與開檔之間替換檔案，此時重新讀取一次
+        # (A writer may swap files between reading the manifest and opening)
+        for attempt in range(2):
+            self.manifest = _read_manifest(path)
+            token = self.manifest["token"]
+            try:
+                self._values = np.load(
+                    os.path.join(path, f"values-{token}.npy"), mmap_mode="r"
+                )
+                self._timestamps = np.load(
+                    os.path.join(path, f"timestamps-{token}.npy"), mmap_mode="r"
+                )
+                break
+            except FileNotFoundError:
+                if attempt:
+                    raise
+        self.columns = self.manifest["columns"]
+        self._start = None if start is None else _to_utc_ns(start)
+        self._end = None if end is None else _to_utc_ns(end)
+
+    @property
+    def tickers(self) -> list:
+        return list(self.manifest["tickers"])
+
+    @property
+    def empty(self) -> bool:
+        return not self.manifest["tickers"]
+
+    def __contains__(self, ticker) -> bool:
+        return ticker in self.manifest["tickers"]
+
+    def __len__(self) -> int:
+        return len(self.manifest["tickers"])
+
+    def bar_count(self, ticker: str) -> int:
+        return self._rows(ticker).stop - self._rows(ticker).start
+
+    def covers(
+        self, tickers: list, start, end, max_age: pd.Timedelta = pd.Timedelta(0)
+    ) -> bool:
+        """
+        此檔是否已下載過這些股票並涵蓋 [start, end) (容許 end 落後 max_age)。
+        Whether the store was downloaded for ``tickers`` and covers [start, end),
+        allowing its end to lag behind by max_age.
+        """
+        stored_start = pd.Timestamp(self.manifest["start"])
+        stored_end = pd.Timestamp(self.manifest["end"])
+        return (
+            set(tickers) <= set(self.manifest["requested_tickers"])
+            and stored_start <= pd.Timestamp(start)
+            and stored_end + max_age >= pd.Timestamp(end)
+        )
+
+    def _rows(self, ticker: str) -> slice:
+        entry = self.manifest["tickers"][ticker]
+        lo = entry["offset"]
+        hi = lo + entry["length"]
+        timestamps = self._timestamps[lo:hi]
+        if self._start is not None:
+            lo += int(np.searchsorted(timestamps, self._start, side="left"))
+        if self._end is not None:
+            hi = entry["offset"] + int(
+                np.searchsorted(timestamps, self._end, side="left")
+            )
+        return slice(lo, max(lo, hi))
+
+    def timestamps(self, ticker: str) -> np.ndarray:
+        """UTC 奈秒時間戳的零複製視圖 (Zero-copy view of UTC ns timestamps)."""
+        return self._timestamps[self._rows(ticker)]
+
+    def arrays(self, ticker: str) -> dict:
+        """各欄位的零複製 NumPy 視圖 (Zero-copy NumPy views per column)."""
+        rows = self._rows(ticker)
+        return {name: self._values[i, rows] for i, name in enumerate(self.columns)}
+
+    def __getitem__(self, ticker: str) -> pd.DataFrame:
+        return self.frame(ticker)
+
+    def frame(self, ticker: str, start: int = 0, stop: int = None) -> pd.DataFrame:
+        """
+        以位置 [start, stop) 取出部分 K 棒的零複製 DataFrame。
+        Zero-copy DataFrame of the ticker's bars at positions [start, stop).
+        """
+        if ticker not in self:
+            raise KeyError(ticker)
+        rows = self._rows(ticker)
+        lo = rows.start + start
+        hi = rows.stop if stop is None else min(rows.stop, rows.start + stop)
+        rows = slice(lo, max(lo, hi))
+        index = pd.DatetimeIndex(
+            self._timestamps[rows].view("M8[ns]"), tz="UTC"
+        ).tz_convert(STORE_TZ)
+        return pd.DataFrame(
+            self._values[:, rows].T, index=index, columns=self.columns, copy=False
+        )
+
+    def get(self, ticker: str, default=None):
+        return self[ticker] if ticker in self else default
+
+
+def _to_utc_ns(timestamp) -> int:
+    timestamp = pd.Timestamp(timestamp)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize(STORE_TZ)
+    return timestamp.value
+
+
+@contextmanager
+def store_lock(path: str):
+    """
+    以檔案鎖序列化同一個 K 線檔的檢查與下載，避免多個處理程序重複下載。
+    File lock serializing the check-and-download of one bar store, so that
+    concurrent runs download it once. A no-op where fcntl is unavailable.
+    """
+    lock_path = f"{path.rstrip(os.sep)}.lock"
+    os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+    with open(lock_path, "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
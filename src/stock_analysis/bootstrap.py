@@ -0,0 +1,71 @@
+import math
+
+import numpy as np
+
+# 每批次最多產生的區塊索引數量，用來限制重抽樣矩陣的記憶體用量
+# (Upper bound on block indices drawn per batch, caps resampling matrix memory)
+MAX_BATCH_ELEMENTS = 4_000_000
+
+BOOTSTRAP_STATISTICS = ("expected_return", "win_rate", "loss_probability")
+
+
+def block_bootstrap_ci(
+    returns,
+    block_length: int,
+    n_replicates: int = 1000,
+    confidence: float = 0.95,
+    seed=None,
+):
+    """
+    以移動區塊重抽樣 (moving block bootstrap) 計算期望報酬率、勝率與下跌機率的信賴區間。
+    Computes moving-block bootstrap confidence intervals for the expected return,
+    win rate and loss probability of a series of (overlapping) lagged returns.
+
+    區塊長度應等於持有期的 K 棒數，以保留重疊報酬之間的相關性。
+    The block length should equal the lag in bars so that the correlation
+    introduced by overlapping holding periods is preserved.
+
+    Each replicate is a row of block start offsets in an index matrix; block
+    sums are read from prefix sums, so a replicate costs O(n / block_length)
+    and all replicates of a batch are evaluated with a single gather.
+    """
+    returns = np.asarray(returns, dtype=float)
+    n = len(returns)
+    if n == 0 or n_replicates <= 0:
+        return {}
+
+    block_length = min(max(1, int(block_length)), n)
+    n_blocks = math.ceil(n / block_length)
+    last_block_length = n - (n_blocks - 1) * block_length
+    n_starts = n - block_length + 1
+
+    # 每列分別對應: 報酬率、獲利指標、虧損指標 (rows: return, win flag, loss flag)
+    values = np.vstack([returns, returns > 0, returns < 0]).astype(float)
+    prefix = np.zeros((values.shape[0], n + 1))
+    np.cumsum(values, axis=1, out=prefix[:, 1:])
+
+    full_block_sums = prefix[:, block_length:] - prefix[:, :n_starts]
+    last_block_sums = (
+        prefix[:, last_block_length : last_block_length + n_starts]
+        - prefix[:, :n_starts]
+    )
+
+    rng = np.random.default_rng(seed)
+    estimates = np.empty((values.shape[0], n_replicates))
+    batch_size = max(1, MAX_BATCH_ELEMENTS // n_blocks)
+
+    for start in range(0, n_replicates, batch_size):
+        stop = min(start + batch_size, n_replicates)
+        block_starts = rng.integers(0, n_starts, size=(stop - start, n_blocks))
+        totals = last_block_sums[:, block_starts[:, -1]]
+        if n_blocks > 1:
+            totals = totals + full_block_sums[:, block_starts[:, :-1]].sum(axis=2)
+        estimates[:, start:stop] = totals / n
+
+    alpha = (1 - confidence) / 2
+    lower, upper = np.quantile(estimates, [alpha, 1 - alpha], axis=1)
+
+    return {
+        f"{name}_ci": (float(lower[i]), float(upper[i]))
+        for i, name in enumerate(BOOTSTRAP_STATISTICS)
+    }
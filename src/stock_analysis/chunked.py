@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+from .barstore import STORE_TZ, BarStore
+
+CHUNK_MODES = ["day", "month"]
+
+
+def chunk_bounds(index: pd.DatetimeIndex, chunk_by: str) -> np.ndarray:
+    """
+    依當地交易日或月份切分 K 線，回傳各區塊的起點位置 (最後一個元素為總長度)。
+    Positions where a new trading day (or month) starts in local time, plus
+    the total length, so that block i is [bounds[i], bounds[i + 1]).
+    """
+    if chunk_by not in CHUNK_MODES:
+        raise ValueError(f"Unsupported chunk mode '{chunk_by}'.")
+    if chunk_by == "day":
+        keys = index.normalize().asi8
+    else:
+        keys = np.asarray(index.year * 12 + index.month)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else []
+    return np.r_[starts, len(index)].astype(np.int64)
+
+
+def iter_bar_chunks(source, ticker: str, chunk_by: str):
+    """
+    逐日或逐月產生一檔股票的 K 線區塊。
+    Yields one ticker's bars one trading day (or month) at a time.
+
+    ``source`` is a BarStore or a yf.download-style DataFrame. From a bar store
+    only the timestamps are scanned to find the boundaries and each block is a
+    zero-copy view of the mapped file, so at most one block is resident.
+    """
+    if isinstance(source, BarStore):
+        if ticker not in source:
+            return
+        timestamps = source.timestamps(ticker)
+        index = pd.DatetimeIndex(timestamps.view("M8[ns]"), tz="UTC").tz_convert(
+            STORE_TZ
+        )
+        bounds = chunk_bounds(index, chunk_by)
+        del index
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            yield source.frame(ticker, lo, hi)
+        return
+
+    try:
+        frame = source[ticker]
+    except (KeyError, AttributeError):
+        return
+    bounds = chunk_bounds(frame.index, chunk_by)
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        yield frame.iloc[lo:hi]
+
+
+def skip_rows(chunks, n_rows: int):
+    """
+    略過前 n_rows 根 K 棒後繼續產生區塊 (Yields the blocks after dropping the first n_rows bars).
+    """
+    for chunk in chunks:
+        if n_rows >= len(chunk):
+            n_rows -= len(chunk)
+            continue
+        yield chunk.iloc[n_rows:] if n_rows else chunk
+        n_rows = 0
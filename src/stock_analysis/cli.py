@@ -1,4 +1,29 @@
 import argparse
+import os
+
+from .chunked import CHUNK_MODES
+from .events import BACKTEST_ENGINES
+from .indicators import TRAIL_MODES
+from .leadlag import LEAD_LAG_SCOPES
+from .log import LOG_LEVELS
+from .resample import order_intervals
+from .sessions import HORIZON_MODES
+
+
+class IntervalsAction(argparse.Action):
+    """
+    儲存排序後的間隔清單 (intervals_short)，並以最細的間隔作為 interval_short。
+    Stores the sorted interval list as ``intervals_short`` and the finest
+    interval, the one that is downloaded, as ``interval_short``.
+    """
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        try:
+            intervals = order_intervals(values)
+        except ValueError as e:
+            raise argparse.ArgumentError(self, str(e))
+        namespace.intervals_short = intervals
+        setattr(namespace, self.dest, intervals[0])
 
 
 def setup_arg_parser():
@@ -57,17 +82,47 @@ def setup_arg_parser():
         action="store_false",
         help="下載長週期資料時不包含盤前盤後數據 (Exclude pre/post market data for long interval download).",
     )
-    parser.add_argument(
+    interval_short = parser.add_argument(
         "--interval-short",
-        type=str,
+        nargs="+",
+        action=IntervalsAction,
         default="5m",
-        help='設定分析用的短週期 K 線間隔 (e.g., "1m", "5m", "15m")',
+        help='設定分析用的短週期 K 線間隔，可指定多個；只下載最細的間隔，其餘由其重新取樣 (e.g., "1m", "5m", "15m"; several intervals are analyzed in one run from the finest download).',
     )
     parser.add_argument(
         "--save-data",
         action="store_true",
         help="儲存下載的原始 K 線資料與分析後的 DataFrame 為 CSV 檔案。",
     )
+    parser.add_argument(
+        "--bar-store",
+        type=str,
+        default=None,
+        help="共用 K 線檔資料夾；同一主機上的多個執行以記憶體映射共用同一份資料 (Directory of shared, memory-mapped bar files reused by concurrent runs on this host).",
+    )
+    parser.add_argument(
+        "--bar-store-max-age",
+        type=float,
+        default=60,
+        help="共用 K 線檔的結束時間最多可落後多少分鐘仍被重複使用 (Minutes a bar store's end may lag the requested end and still be reused).",
+    )
+    parser.add_argument(
+        "--refresh-bar-store",
+        action="store_true",
+        help="忽略既有的共用 K 線檔並重新下載 (Ignore an existing bar store and download again).",
+    )
+    parser.add_argument(
+        "--download-chunk-size",
+        type=int,
+        default=0,
+        help="每批下載的股票數；大於 0 時於背景分批下載，每檔股票到達後即開始分析 (Download this many tickers per chunk on a background thread and start each ticker as soon as its chunk arrives; 0 downloads everything first).",
+    )
+    parser.add_argument(
+        "--download-queue",
+        type=int,
+        default=2,
+        help="背景下載最多可領先分析的批數 (How many downloaded chunks may wait ahead of the analysis).",
+    )
     parser.add_argument(
         "--start-date",
         type=str,
@@ -87,11 +142,72 @@ def setup_arg_parser():
         choices=["start", "end"],
         help="Set the time anchor for analysis: 'start' (X-axis is buy time) or 'end' (X-axis is sell time).",
     )
+    parser.add_argument(
+        "--horizon-mode",
+        type=str,
+        default="bars",
+        choices=HORIZON_MODES,
+        help="持有期的計算方式：'bars' 固定 K 棒數；'wall' 實際時間 (可跨夜)；'session' 交易時間 (不計休市)；'intraday' 交易時間且不跨交易日 (How holding periods are measured: fixed bar count, wall-clock time, session time, or session time within one session).",
+    )
+    parser.add_argument(
+        "--regular-hours-only",
+        action="store_true",
+        help="分析前剔除盤前盤後 K 棒 (Drop pre/post market bars before analysis).",
+    )
+    parser.add_argument(
+        "--log-level",
+        type=str.upper,
+        default="INFO",
+        choices=LOG_LEVELS,
+        help="紀錄層級；DEBUG 會列出每筆買賣觸發 (Log level; DEBUG lists every BUY/SELL trigger).",
+    )
+    parser.add_argument(
+        "-q",
+        "--quiet",
+        action="store_true",
+        help="主控台僅顯示警告與錯誤 (Only show warnings and errors on the console).",
+    )
+    parser.add_argument(
+        "--log-json",
+        type=str,
+        default=None,
+        help="將結構化紀錄以 JSON lines 格式寫入此檔案 (Write structured JSON-lines logs to this file).",
+    )
     parser.add_argument(
         "--download-only",
         action="store_true",
         help="僅下載資料，不執行分析 (Only download data without running analysis).",
     )
+    parser.add_argument(
+        "--bootstrap-replicates",
+        type=int,
+        default=0,
+        help="區塊重抽樣次數，用於計算期望報酬率與勝率的信賴區間；0 表示停用 (Number of block-bootstrap replicates for confidence intervals; 0 disables).",
+    )
+    parser.add_argument(
+        "--bootstrap-seed",
+        type=int,
+        default=None,
+        help="區塊重抽樣的亂數種子 (Random seed for the block bootstrap).",
+    )
+    parser.add_argument(
+        "--bootstrap-confidence",
+        type=float,
+        default=0.95,
+        help="信賴區間的信賴水準 (Confidence level of the bootstrap intervals).",
+    )
+    parser.add_argument(
+        "--sketch-k",
+        type=int,
+        default=200,
+        help="報酬率分位數摘要的大小；越大越精確，約佔 24*k 位元組 (Size k of the return quantile sketches; larger is more accurate, about 24*k bytes each).",
+    )
+    parser.add_argument(
+        "--retain-memory-mb",
+        type=float,
+        default=256,
+        help="比較圖保留資料的記憶體上限 (MB)，超過時寫入暫存檔 (Memory budget in MB for the results kept for the comparison charts; beyond it they are spilled to temporary files).",
+    )
 
     # --- Strategy Backtest Arguments ---
     parser.add_argument(
@@ -125,5 +241,185 @@ def setup_arg_parser():
         action="store_true",
         help="在策略回測中，允許每天重新建立進場條件單 (Allow re-initiating entry conditions daily in strategy backtest mode).",
     )
+    parser.add_argument(
+        "--trail-mode",
+        choices=TRAIL_MODES,
+        default="fixed",
+        help="追蹤距離: fixed 為固定百分比；atr/std 依前一根 K 棒的 ATR 或報酬率標準差乘上倍數 (Trail distance: fixed percentages, or --entry/--exit-trail-mult times the previous bar's ATR or return std).",
+    )
+    parser.add_argument(
+        "--entry-trail-mult",
+        type=float,
+        default=2.0,
+        help="atr/std 模式的進場追蹤倍數 (Entry trail multiple of the volatility in atr/std mode).",
+    )
+    parser.add_argument(
+        "--exit-trail-mult",
+        type=float,
+        default=1.5,
+        help="atr/std 模式的出場追蹤倍數 (Exit trail multiple of the volatility in atr/std mode).",
+    )
+    parser.add_argument(
+        "--trail-window",
+        type=int,
+        default=14,
+        help="ATR 與滾動標準差的 K 棒視窗 (Bar window of the ATR and rolling std).",
+    )
+    parser.add_argument(
+        "--backtest-engine",
+        choices=BACKTEST_ENGINES,
+        default="loop",
+        help="回測引擎: loop 逐根 K 棒；event 以預先計算的區間極值索引直接跳到下一個買賣點，交易相同 (Backtest engine: loop visits every bar; event jumps from trigger to trigger with precomputed range-extreme indexes, same trades). Not supported with --chunk-by.",
+    )
+    parser.add_argument(
+        "--chunk-by",
+        choices=CHUNK_MODES,
+        default=None,
+        help="逐日或逐月分塊處理 K 線以限制記憶體用量，結果與一次載入相同 (Process bars one trading day or month at a time to bound memory; results match the in-memory run). Requires --horizon-mode bars.",
+    )
+    parser.add_argument(
+        "--export-feed",
+        type=str,
+        default=None,
+        metavar="DIR",
+        help="將分析明細匯出為多解析度的二進位資料 (每根 K 棒/每小時/每日/每週) 及 manifest，供 stock-performance-visualizer 使用 (Export analysis details as a tiled multi-resolution binary feed with a manifest for the stock-performance-visualizer).",
+    )
+
+    # --- Sharding Arguments ---
+    parser.add_argument(
+        "--shard",
+        type=str,
+        default=None,
+        help="只執行第 i 個分片 (共 N 個，0 <= i < N)，部分結果寫入 --shard-dir (Run shard i of N, 'i/N' with 0 <= i < N; partial results go to --shard-dir).",
+    )
+    parser.add_argument(
+        "--shard-dir",
+        type=str,
+        default="output_shards",
+        help="分片計畫與部分結果的共用資料夾 (Shared directory for the shard plan and partial results).",
+    )
+    parser.add_argument(
+        "--merge-shards",
+        action="store_true",
+        help="合併 --shard-dir 中的分片結果，產生與單次執行相同的報告與圖表 (Merge shard results into the same reports and charts as a single run).",
+    )
+
+    # --- Stress Test Arguments ---
+    parser.add_argument(
+        "--stress-test",
+        action="store_true",
+        help="以合成路徑對追蹤停損策略進行蒙地卡羅壓力測試 (Monte Carlo stress test of the trailing stop strategy on synthetic paths).",
+    )
+    parser.add_argument(
+        "--stress-paths",
+        type=int,
+        default=1000,
+        help="每檔股票產生的合成路徑數 (Number of synthetic paths per ticker).",
+    )
+    parser.add_argument(
+        "--stress-sessions",
+        type=int,
+        default=None,
+        help="每條合成路徑的交易日數，預設與歷史資料相同 (Trading sessions per synthetic path; defaults to the history length).",
+    )
+    parser.add_argument(
+        "--stress-seed",
+        type=int,
+        default=None,
+        help="壓力測試的亂數種子 (Random seed for the stress test).",
+    )
+    parser.add_argument(
+        "--stress-workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="壓力測試使用的處理程序數 (Number of worker processes for the stress test).",
+    )
+
+    # --- Trail Optimizer Arguments ---
+    parser.add_argument(
+        "--optimize-trails",
+        action="store_true",
+        help="以逐次減半搜尋每檔股票的進場/出場追蹤百分比，並以最後一段資料驗證 (Search entry/exit trail percentages per ticker with successive halving and a walk-forward holdout).",
+    )
+    parser.add_argument(
+        "--opt-candidates",
+        type=int,
+        default=81,
+        help="抽樣的候選參數組數 (Number of sampled candidate settings).",
+    )
+    parser.add_argument(
+        "--opt-entry-range",
+        type=float,
+        nargs=2,
+        default=[0.5, 10.0],
+        metavar=("LOW", "HIGH"),
+        help="進場追蹤百分比的搜尋範圍 (Search range of the entry trail percentage).",
+    )
+    parser.add_argument(
+        "--opt-exit-range",
+        type=float,
+        nargs=2,
+        default=[0.5, 10.0],
+        metavar=("LOW", "HIGH"),
+        help="出場追蹤百分比的搜尋範圍 (Search range of the exit trail percentage).",
+    )
+    parser.add_argument(
+        "--opt-eta",
+        type=int,
+        default=3,
+        help="每輪保留 1/eta 的候選並將視窗放大 eta 倍 (Keep the best 1/eta each rung and grow the window eta-fold).",
+    )
+    parser.add_argument(
+        "--opt-budget",
+        type=float,
+        default=None,
+        help="每檔股票的計算預算，以完整訓練期回測次數計 (Per-ticker compute budget in full-training-window backtests); fewer candidates are sampled if the schedule exceeds it.",
+    )
+    parser.add_argument(
+        "--opt-holdout",
+        type=float,
+        default=0.25,
+        help="保留作前進式驗證的最後交易日比例 (Fraction of the most recent sessions held out for walk-forward validation).",
+    )
+    parser.add_argument(
+        "--opt-top",
+        type=int,
+        default=5,
+        help="在驗證期評估的最佳候選數 (Number of top candidates scored on the holdout).",
+    )
+    parser.add_argument(
+        "--opt-seed",
+        type=int,
+        default=None,
+        help="候選參數抽樣的亂數種子 (Random seed for candidate sampling).",
+    )
+
+    # --- Lead-Lag Arguments ---
+    parser.add_argument(
+        "--lead-lag",
+        action="store_true",
+        help="以 FFT 互相關找出股票對之間的領先/落後關係並排名 (Rank ticker pairs by FFT cross-correlation lead-lag).",
+    )
+    parser.add_argument(
+        "--lead-lag-max-lag",
+        type=int,
+        default=12,
+        help="搜尋的最大落後 K 棒數 (Largest lag searched, in bars).",
+    )
+    parser.add_argument(
+        "--lead-lag-scope",
+        choices=LEAD_LAG_SCOPES,
+        default="group",
+        help="'group' 只比較同一群組內的股票對，'universe' 比較所有股票對 ('group' compares pairs within each ticker group, 'universe' every pair).",
+    )
+    parser.add_argument(
+        "--lead-lag-top",
+        type=int,
+        default=20,
+        help="報告中列出的股票對數量 (Number of pairs listed in the report).",
+    )
 
+    # 由 --interval-short 的預設值推得，兩者不會不一致
+    # (Derived from --interval-short's default, so the two cannot drift apart)
+    parser.set_defaults(intervals_short=order_intervals([interval_short.default]))
     return parser
@@ -1,6 +1,53 @@
+import numpy as np
 import pandas as pd
-import re
 import argparse
+import logging
+
+from .bootstrap import block_bootstrap_ci
+from .events import BacktestIndex, backtest_events
+from .indicators import IndicatorCache, trail_params, trail_percentages
+from .ledger import TradeLedger
+from .log import get_logger
+from .sessions import (
+    build_session_index,
+    parse_interval_minutes,
+    resolve_horizon,
+    slice_session_index,
+)
+from .sketch import QuantileSketch
+
+logger = get_logger("core")
+
+
+def _lag_periods(interval: str, holding_hours: float, horizon_mode: str = "bars"):
+    """
+    將持有時間換算為 K 棒數；無法換算時記錄錯誤並回傳 None。
+    Converts the holding period into a bar count, logging and returning None
+    if the interval cannot be parsed or does not divide the holding period.
+    """
+    try:
+        minutes_per_bar = parse_interval_minutes(interval)
+    except ValueError:
+        logger.error(
+            f"錯誤：無法從 K 線間隔 '{interval}' 提取分鐘數。請使用 '1m', '5m', '1h', '1d' 格式。"
+        )
+        logger.error(
+            f"ERROR: Could not parse minutes from interval '{interval}'. Please use '1m', '5m', '1h', '1d' format."
+        )
+        return None
+
+    total_minutes_to_lag = holding_hours * 60
+
+    if horizon_mode == "bars" and total_minutes_to_lag % minutes_per_bar != 0:
+        logger.error(
+            f"錯誤：持有時間 {holding_hours} 小時 ({total_minutes_to_lag} 分鐘) 不是 K 線間隔 {minutes_per_bar} 分鐘的整數倍。"
+        )
+        logger.error(
+            f"ERROR: Holding period {holding_hours} hours ({total_minutes_to_lag} mins) is not an integer multiple of the K-bar interval ({minutes_per_bar} mins)."
+        )
+        return None
+
+    return max(1, int(round(total_minutes_to_lag / minutes_per_bar)))
 
 
 def analyze_fixed_time_lag(
@@ -9,46 +56,53 @@ def analyze_fixed_time_lag(
     interval: str,
     holding_hours: float,
     time_anchor: str = "start",
+    bootstrap_replicates: int = 0,
+    bootstrap_seed=None,
+    bootstrap_confidence: float = 0.95,
+    horizon_mode: str = "bars",
+    session_index: pd.DataFrame = None,
+    indicators: IndicatorCache = None,
+    indicator_window: int = 14,
+    sketch_k: int = 200,
 ):
     """
     分析一檔股票在給定數據下，與 {holding_hours} 小時前的 K 線收盤價的價差。
     Analyzes the price difference of a stock based on provided data,
     between the current bar and the close price {holding_hours} hours prior.
+
+    若 bootstrap_replicates > 0，另以區塊重抽樣計算各統計量的信賴區間。
+    If bootstrap_replicates > 0, block-bootstrap confidence intervals are added
+    for expected_return, win_rate and loss_probability.
+
+    horizon_mode 'bars' 以固定 K 棒數計算持有期；'wall'、'session'、'intraday'
+    則以交易時段索引 (session_index，未提供時自動建立) 解析持有期。
+    horizon_mode 'bars' converts the holding period to a fixed bar count;
+    'wall', 'session' and 'intraday' resolve it in wall-clock or session time
+    through the trading-session index (built here if session_index is None).
+
+    若提供 indicators，另回報分析期間的平均 ATR 百分比 (avg_atr_pct)。
+    If an indicator cache is given, the mean ATR as a percentage of the close
+    over the analyzed bars is added as avg_atr_pct.
+
+    報酬率分布另存為 return_sketch (大小為 sketch_k 的 QuantileSketch)。
+    The return distribution is kept as return_sketch, a QuantileSketch of
+    size sketch_k, from which the summary reads its tail quantiles.
     """
     if stock_data.empty:
-        print(f"錯誤：{ticker} 沒有提供數據。")
-        print(f"ERROR: No data provided for {ticker}.")
+        logger.error(f"錯誤：{ticker} 沒有提供數據。")
+        logger.error(f"ERROR: No data provided for {ticker}.")
         return None, None
 
     # 數據已預先處理，直接使用
-    print(f"Processing {ticker} data. Total bars: {len(stock_data)}.")
+    logger.debug(f"Processing {ticker} data. Total bars: {len(stock_data)}.")
     # print("-" * 30)
 
     # --- 參數計算 (Parameter Calculation) ---
-    try:
-        minutes_per_bar = int(re.findall(r"(\d+)", interval)[0])
-    except Exception:
-        print(
-            f"錯誤：無法從 K 線間隔 '{interval}' 提取分鐘數。請使用 '1m', '5m', '15m' 格式。"
-        )
-        print(
-            f"ERROR: Could not parse minutes from interval '{interval}'. Please use '1m', '5m', '15m' format."
-        )
+    lag_periods = _lag_periods(interval, holding_hours, horizon_mode)
+    if lag_periods is None:
         return None, None
-
     total_minutes_to_lag = holding_hours * 60
 
-    if total_minutes_to_lag % minutes_per_bar != 0:
-        print(
-            f"錯誤：持有時間 {holding_hours} 小時 ({total_minutes_to_lag} 分鐘) 不是 K 線間隔 {minutes_per_bar} 分鐘的整數倍。"
-        )
-        print(
-            f"ERROR: Holding period {holding_hours} hours ({total_minutes_to_lag} mins) is not an integer multiple of the K-bar interval ({minutes_per_bar} mins)."
-        )
-        return None, None
-
-    lag_periods = int(total_minutes_to_lag / minutes_per_bar)
-
     # print(f"分析參數 (Analysis Parameters)：")
     # print(f"  - K線間隔 (Interval): {interval} ({minutes_per_bar} 分鐘)")
     # print(f"  - 持有時長 (Holding Period): {holding_hours} 小時 (Hours)")
@@ -56,7 +110,25 @@ def analyze_fixed_time_lag(
     # print("-" * 30)
 
     # --- 核心計算 (Core Calculation) ---
-    if time_anchor == "end":
+    if horizon_mode != "bars":
+        if session_index is None:
+            session_index = build_session_index(stock_data.index, interval)
+        else:
+            session_index = slice_session_index(session_index, stock_data.index)
+
+        partner = resolve_horizon(
+            session_index, total_minutes_to_lag, horizon_mode, time_anchor
+        )
+        close = stock_data["Close"].to_numpy(dtype=float)
+        partner_close = np.where(partner >= 0, close[np.maximum(partner, 0)], np.nan)
+
+        if time_anchor == "end":
+            stock_data["P_buy"] = partner_close
+            stock_data["P_sell"] = stock_data["Close"]
+        else:
+            stock_data["P_buy"] = stock_data["Close"]
+            stock_data["P_sell"] = partner_close
+    elif time_anchor == "end":
         stock_data["P_buy"] = stock_data["Close"].shift(lag_periods)
         stock_data["P_sell"] = stock_data["Close"]
     else:  # Default to 'start'
@@ -66,8 +138,10 @@ def analyze_fixed_time_lag(
     analysis_df = stock_data.dropna().copy()
 
     if analysis_df.empty:
-        print(f"錯誤：數據量不足，無法進行 {holding_hours} 小時的回測分析。")
-        print(f"ERROR: Not enough data for a {holding_hours}-hour lookback analysis.")
+        logger.warning(f"錯誤：數據量不足，無法進行 {holding_hours} 小時的回測分析。")
+        logger.warning(
+            f"ERROR: Not enough data for a {holding_hours}-hour lookback analysis."
+        )
         return None, None
 
     analysis_df["price_diff"] = analysis_df["P_sell"] - analysis_df["P_buy"]
@@ -95,38 +169,244 @@ def analyze_fixed_time_lag(
         "win_rate": (analysis_df["return"] > 0).sum() / total_trades
         if total_trades > 0
         else 0,
+        "return_sketch": QuantileSketch(sketch_k).update(analysis_df["return"]),
     }
 
+    if indicators is not None:
+        atr_pct = pd.Series(
+            indicators.get("atr_pct", ticker, interval, stock_data, indicator_window),
+            index=stock_data.index,
+        )
+        results["avg_atr_pct"] = atr_pct.reindex(analysis_df.index).mean()
+
+    if bootstrap_replicates > 0:
+        results.update(
+            block_bootstrap_ci(
+                analysis_df["return"].to_numpy(),
+                block_length=lag_periods,
+                n_replicates=bootstrap_replicates,
+                confidence=bootstrap_confidence,
+                seed=bootstrap_seed,
+            )
+        )
+
     return results, analysis_df
 
 
-def run_strategy_backtest(
-    stock_data: pd.DataFrame, ticker: str, args: argparse.Namespace
+def analyze_fixed_time_lag_chunked(
+    chunks,
+    ticker: str,
+    interval: str,
+    holding_hours: float,
+    time_anchor: str = "start",
+    bootstrap_replicates: int = 0,
+    bootstrap_seed=None,
+    bootstrap_confidence: float = 0.95,
+    sketch_k: int = 200,
+    on_returns=None,
+    keep_returns: bool = True,
 ):
     """
-    Simulates a trailing stop trading strategy, allowing for multiple trades.
+    逐區塊計算固定 K 棒數持有期的統計量，區塊之間只延續最後 lag_periods 根收盤價。
+    Chunked variant of analyze_fixed_time_lag for horizon_mode 'bars'.
+    ``chunks`` yields consecutive blocks of NaN-free bars; only the last
+    lag_periods closes are carried across block boundaries and the statistics
+    are accumulated as running sums and a quantile sketch.
+
+    Each block's returns are passed to ``on_returns`` as a frame with a
+    'return' column as soon as they are computed. The full detail frame
+    (only the 'return' column) is built only with ``keep_returns``, and the
+    bare return vector only for ``bootstrap_replicates`` > 0; both grow with
+    the history. Otherwise (results, None) is returned and memory stays
+    bounded by one block. Results equal the in-memory path up to
+    floating-point summation order.
+    """
+    lag_periods = _lag_periods(interval, holding_hours)
+    if lag_periods is None:
+        return None, None
+
+    carry_close = np.empty(0)
+    carry_time = np.empty(0, dtype=np.int64)
+    tz = None
+    bar_count = 0
+    totals = dict.fromkeys(
+        ["trades", "losses", "wins", "diff", "gain", "gains", "loss", "return"], 0.0
+    )
+    sketch = QuantileSketch(sketch_k)
+    return_parts = []
+    time_parts = []
+
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        bar_count += len(chunk)
+        tz = chunk.index.tz
+        close = np.concatenate([carry_close, chunk["Close"].to_numpy(dtype=float)])
+        times = np.concatenate([carry_time, chunk.index.as_unit("ns").asi8])
+
+        if len(close) > lag_periods:
+            p_buy = close[:-lag_periods]
+            p_sell = close[lag_periods:]
+            price_diff = p_sell - p_buy
+            returns = price_diff / p_buy
+
+            totals["trades"] += len(price_diff)
+            totals["losses"] += np.count_nonzero(price_diff < 0)
+            totals["wins"] += np.count_nonzero(returns > 0)
+            totals["diff"] += price_diff.sum()
+            totals["gain"] += price_diff[price_diff > 0].sum()
+            totals["gains"] += np.count_nonzero(price_diff > 0)
+            totals["loss"] += price_diff[price_diff < 0].sum()
+            totals["return"] += returns.sum()
+            sketch.update(returns)
+
+            # 'end' 以賣出 K 棒標記，'start' 以買入 K 棒標記
+            # ('end' labels a pair by its sell bar, 'start' by its buy bar)
+            pair_times = (
+                times[lag_periods:] if time_anchor == "end" else times[:-lag_periods]
+            )
+            if on_returns is not None:
+                on_returns(
+                    pd.DataFrame({"return": returns}, index=_ns_index(pair_times, tz))
+                )
+            if keep_returns or bootstrap_replicates > 0:
+                return_parts.append(returns)
+            if keep_returns:
+                time_parts.append(pair_times)
+
+        carry_close = close[-lag_periods:]
+        carry_time = times[-lag_periods:]
+
+    if not bar_count:
+        logger.error(f"錯誤：{ticker} 沒有提供數據。")
+        logger.error(f"ERROR: No data provided for {ticker}.")
+        return None, None
+
+    total_trades = int(totals["trades"])
+    if not total_trades:
+        logger.warning(f"錯誤：數據量不足，無法進行 {holding_hours} 小時的回測分析。")
+        logger.warning(
+            f"ERROR: Not enough data for a {holding_hours}-hour lookback analysis."
+        )
+        return None, None
+
+    losing_trades = int(totals["losses"])
+    gain_count = int(totals["gains"])
+    results = {
+        "ticker": ticker,
+        "holding_hours": holding_hours,
+        "total_trades": total_trades,
+        "loss_probability": losing_trades / total_trades,
+        "avg_price_diff": totals["diff"] / total_trades,
+        "avg_gain_diff": totals["gain"] / gain_count if gain_count else np.nan,
+        "avg_loss_diff": totals["loss"] / losing_trades if losing_trades else np.nan,
+        "expected_return": totals["return"] / total_trades,
+        "win_rate": totals["wins"] / total_trades,
+        "return_sketch": sketch,
+    }
+
+    if bootstrap_replicates > 0:
+        results.update(
+            block_bootstrap_ci(
+                np.concatenate(return_parts),
+                block_length=lag_periods,
+                n_replicates=bootstrap_replicates,
+                confidence=bootstrap_confidence,
+                seed=bootstrap_seed,
+            )
+        )
+
+    analysis_df = None
+    if keep_returns:
+        analysis_df = pd.DataFrame(
+            {"return": np.concatenate(return_parts)},
+            index=_ns_index(np.concatenate(time_parts), tz),
+        )
+
+    return results, analysis_df
+
+
+def _ns_index(values: np.ndarray, tz) -> pd.DatetimeIndex:
+    """UTC 奈秒整數轉為 DatetimeIndex (UTC nanosecond integers to a DatetimeIndex)."""
+    index = pd.DatetimeIndex(values.view("M8[ns]"))
+    if tz is not None:
+        index = index.tz_localize("UTC").tz_convert(tz)
+    return index
+
+
+def new_backtest_state() -> dict:
+    """
+    追蹤停損策略的狀態機變數，跨資料區塊延續 (State machine variables of the
+    trailing-stop strategy, carried across chunks).
+    """
+    return {
+        "state": "LOOKING_TO_BUY",
+        "lowest_price_seen": float("inf"),
+        "highest_price_since_buy": float("-inf"),
+        "buy_price": 0,
+        "buy_time": None,
+        "current_day": None,
+        "day_of_last_trade": None,
+        "buy_count": 0,
+        "trade_count": 0,
+    }
+
+
+def backtest_chunk(
+    stock_data: pd.DataFrame,
+    ticker: str,
+    args: argparse.Namespace,
+    ledger: TradeLedger,
+    state: dict,
+    trail_pcts: tuple = None,
+):
+    """
+    以 state 繼續執行一段 K 線的追蹤停損狀態機，成交的交易附加到 ledger。
+    Advances the trailing-stop state machine over one block of bars, starting
+    from and updating ``state``; completed trades are appended to ``ledger``.
+    Feeding consecutive blocks gives the same trades as one pass over all bars.
+
+    trail_pcts 為每根 K 棒的 (進場, 出場) 追蹤百分比，預設依 args 計算。
+    ``trail_pcts`` holds per-bar (entry, exit) trail percentages aligned with
+    the block; by default they are derived from args via trail_percentages.
     """
     if stock_data.empty:
-        print(f"No data for {ticker}, skipping backtest.")
-        return []
-
-    trades = []
-    # --- State Machine Initialization ---
-    state = "LOOKING_TO_BUY"
-    lowest_price_seen = float("inf")
-    highest_price_since_buy = float("-inf")
-    buy_price = 0
-    buy_time = None
-    current_day = None
-    day_of_last_trade = None
+        return
+
+    ticker_id = ledger.ticker_id(ticker)
+    param_id = ledger.param_id(**trail_params(args))
+
+    if trail_pcts is None:
+        trail_pcts = trail_percentages(stock_data, ticker, args)
+    entry_factors = 1 + trail_pcts[0] / 100
+    exit_factors = 1 - trail_pcts[1] / 100
+    # 只在迴圈外判斷一次，低於 DEBUG 時迴圈內完全不產生訊息
+    # (Checked once; below DEBUG the loop never builds per-trigger messages)
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
+
+    index = stock_data.index
+    lows = stock_data["Low"].to_numpy(dtype=float)
+    highs = stock_data["High"].to_numpy(dtype=float)
+    # 以當地午夜的時間戳代表交易日 (Local midnight stands for the bar's date)
+    bar_dates = index.normalize().asi8
+
+    in_position = state["state"] == "IN_POSITION"
+    lowest_price_seen = state["lowest_price_seen"]
+    highest_price_since_buy = state["highest_price_since_buy"]
+    buy_price = state["buy_price"]
+    buy_time = state["buy_time"]
+    current_day = state["current_day"]
+    day_of_last_trade = state["day_of_last_trade"]
+    buy_count = state["buy_count"]
+    trade_count = state["trade_count"]
 
     # --- Iterate through K-lines ---
-    for index, row in stock_data.iterrows():
-        current_low = row["Low"]
-        current_high = row["High"]
-        bar_date = index.date()
+    for i in range(len(lows)):
+        current_low = lows[i]
+        current_high = highs[i]
+        bar_date = bar_dates[i]
 
-        if state == "LOOKING_TO_BUY":
+        if not in_position:
             if bar_date == day_of_last_trade:
                 continue
 
@@ -138,28 +418,49 @@ def run_strategy_backtest(
             elif current_low < lowest_price_seen:
                 lowest_price_seen = current_low
 
-            buy_trigger_price = lowest_price_seen * (1 + args.entry_trail_pct / 100)
+            buy_trigger_price = lowest_price_seen * entry_factors[i]
 
             if current_high >= buy_trigger_price:
                 buy_price = buy_trigger_price
-                buy_time = index
+                buy_time = index[i]
                 # Reset the highest price seen since the new buy
                 highest_price_since_buy = buy_price
-                state = "IN_POSITION"
-                print(f"[{ticker}] BUY triggered at ${buy_price:.2f} on {buy_time}")
-
-        elif state == "IN_POSITION":
+                in_position = True
+                buy_count += 1
+                if debug_enabled:
+                    logger.debug(
+                        f"[{ticker}] BUY triggered at ${buy_price:.2f} on {buy_time}",
+                        extra={
+                            "fields": {
+                                "event": "buy",
+                                "ticker": ticker,
+                                "price": buy_price,
+                                "bar_time": buy_time,
+                            }
+                        },
+                    )
+
+        else:
             if current_high > highest_price_since_buy:
                 highest_price_since_buy = current_high
 
-            sell_trigger_price = highest_price_since_buy * (
-                1 - args.exit_trail_pct / 100
-            )
+            sell_trigger_price = highest_price_since_buy * exit_factors[i]
 
             if current_low <= sell_trigger_price:
                 sell_price = sell_trigger_price
-                sell_time = index
-                print(f"[{ticker}] SELL triggered at ${sell_price:.2f} on {sell_time}")
+                sell_time = index[i]
+                if debug_enabled:
+                    logger.debug(
+                        f"[{ticker}] SELL triggered at ${sell_price:.2f} on {sell_time}",
+                        extra={
+                            "fields": {
+                                "event": "sell",
+                                "ticker": ticker,
+                                "price": sell_price,
+                                "bar_time": sell_time,
+                            }
+                        },
+                    )
 
                 # --- Result Compilation for this trade ---
                 if args.budget:
@@ -167,33 +468,120 @@ def run_strategy_backtest(
                 else:
                     shares_to_trade = args.shares
 
-                pnl = (sell_price - buy_price) * shares_to_trade
-                profit_pct = (sell_price - buy_price) / buy_price
-
-                result = {
-                    "ticker": ticker,
-                    "buy_price": buy_price,
-                    "buy_time": buy_time,
-                    "sell_price": sell_price,
-                    "sell_time": sell_time,
-                    "shares": shares_to_trade,
-                    "profit_and_loss": pnl,
-                    "profit_pct": profit_pct,
-                    "entry_trail_pct": args.entry_trail_pct,
-                    "exit_trail_pct": args.exit_trail_pct,
-                    "budget": args.budget,
-                }
-                trades.append(result)
+                ledger.append(
+                    ticker_id,
+                    param_id,
+                    buy_time,
+                    sell_time,
+                    buy_price,
+                    sell_price,
+                    shares_to_trade,
+                )
+                trade_count += 1
 
                 # --- Reset for next trade ---
                 day_of_last_trade = bar_date
-                state = "LOOKING_TO_BUY"
+                in_position = False
                 lowest_price_seen = current_low  # Start tracking from current bar's low
                 highest_price_since_buy = float("-inf")
                 buy_price = 0
                 buy_time = None
 
-    if not trades:
-        print(f"[{ticker}] No complete trade was executed during the backtest period.")
+    state.update(
+        state="IN_POSITION" if in_position else "LOOKING_TO_BUY",
+        lowest_price_seen=lowest_price_seen,
+        highest_price_since_buy=highest_price_since_buy,
+        buy_price=buy_price,
+        buy_time=buy_time,
+        current_day=current_day,
+        day_of_last_trade=day_of_last_trade,
+        buy_count=buy_count,
+        trade_count=trade_count,
+    )
+
+
+def _log_backtest_summary(ticker: str, state: dict):
+    if not state["trade_count"]:
+        logger.info(
+            f"[{ticker}] No complete trade was executed during the backtest period."
+        )
+    else:
+        logger.info(
+            f"[{ticker}] {state['buy_count']} BUY / {state['trade_count']} SELL triggered",
+            extra={
+                "fields": {
+                    "event": "backtest_summary",
+                    "ticker": ticker,
+                    "buys": state["buy_count"],
+                    "sells": state["trade_count"],
+                }
+            },
+        )
+
+
+def run_strategy_backtest(
+    stock_data: pd.DataFrame,
+    ticker: str,
+    args: argparse.Namespace,
+    ledger: TradeLedger = None,
+    indicators: IndicatorCache = None,
+) -> TradeLedger:
+    """
+    Simulates a trailing stop trading strategy, allowing for multiple trades.
+
+    交易會附加到 ledger (未提供時新建) 並回傳；策略參數在 ledger 中只儲存一次。
+    Trades are appended to ``ledger`` (a new one if None), which is returned;
+    the strategy parameters are stored once in the ledger's parameter table.
+    Adaptive trail modes read their volatility from ``indicators``, so several
+    variants over the same bars share one indicator pass.
+
+    args.backtest_engine 為 'event' 時改用事件跳躍引擎 (backtest_events)，交易相同。
+    With args.backtest_engine 'event' the bars go through the event-skipping
+    engine (backtest_events) instead of the per-bar loop; the trades are the
+    same.
+    """
+    if ledger is None:
+        ledger = TradeLedger()
+    if stock_data.empty:
+        logger.warning(f"No data for {ticker}, skipping backtest.")
+        return ledger
 
-    return trades
+    if getattr(args, "backtest_engine", "loop") == "event":
+        bar_index = BacktestIndex(stock_data, ticker, args.interval_short, indicators)
+        _log_backtest_summary(ticker, backtest_events(bar_index, args, ledger))
+        return ledger
+
+    state = new_backtest_state()
+    trail_pcts = trail_percentages(stock_data, ticker, args, indicators)
+    backtest_chunk(stock_data, ticker, args, ledger, state, trail_pcts)
+    _log_backtest_summary(ticker, state)
+    return ledger
+
+
+def run_strategy_backtest_chunked(
+    chunks,
+    ticker: str,
+    args: argparse.Namespace,
+    ledger: TradeLedger = None,
+) -> TradeLedger:
+    """
+    逐區塊執行追蹤停損回測，區塊之間只延續狀態機變數。
+    Chunked variant of run_strategy_backtest: ``chunks`` yields consecutive
+    blocks of bars and only the state machine variables are carried between
+    them, so peak memory is bounded by the block size. The trades are the
+    same as those of run_strategy_backtest on the concatenated bars.
+    """
+    if ledger is None:
+        ledger = TradeLedger()
+
+    state = new_backtest_state()
+    bar_count = 0
+    for chunk in chunks:
+        backtest_chunk(chunk, ticker, args, ledger, state)
+        bar_count += len(chunk)
+
+    if not bar_count:
+        logger.warning(f"No data for {ticker}, skipping backtest.")
+        return ledger
+    _log_backtest_summary(ticker, state)
+    return ledger
@@ -1,7 +1,89 @@
 import yfinance as yf
+import pandas as pd
 import pytz
 import argparse
 
+from .barstore import BarStore, bar_store_path, store_lock, write_bar_store
+from .log import get_logger
+from .pipeline import StreamingBars
+
+logger = get_logger("data")
+
+
+def _convert_to_new_york(data_batch: pd.DataFrame, interval: str) -> pd.DataFrame:
+    """
+    將下載資料的索引轉換至 'America/New_York' 時區 (Converts the index to New York time).
+    """
+    if data_batch.empty:
+        return data_batch
+
+    new_york_tz = pytz.timezone("America/New_York")
+    if data_batch.index.tzinfo is None:
+        data_batch.index = data_batch.index.tz_localize("UTC").tz_convert(new_york_tz)
+    else:
+        data_batch.index = data_batch.index.tz_convert(new_york_tz)
+    logger.info(f"{interval} 資料已轉換至 'America/New_York' 時區。")
+    return data_batch
+
+
+def _download_interval(
+    tickers: list, interval: str, start_date, end_date, prepost: bool, progress=True
+):
+    data_batch = yf.download(
+        tickers=tickers,
+        interval=interval,
+        start=start_date,
+        end=end_date,
+        progress=progress,
+        prepost=prepost,
+        group_by="ticker",
+    )
+    return _convert_to_new_york(data_batch, interval)
+
+
+def _load_or_download(
+    tickers: list,
+    interval: str,
+    start_date,
+    end_date,
+    prepost: bool,
+    args: argparse.Namespace,
+):
+    """
+    若指定 --bar-store，優先使用已涵蓋此區間的共用 K 線檔，否則下載後寫入再以記憶體映射開啟。
+    With --bar-store, reuses a shared bar store that already covers the range;
+    otherwise downloads, writes the store and reopens it memory-mapped, so that
+    this process also holds the bars only through the shared mapping.
+    """
+    store_root = getattr(args, "bar_store", None)
+    if not store_root:
+        return _download_interval(tickers, interval, start_date, end_date, prepost)
+
+    path = bar_store_path(store_root, interval, prepost)
+    max_age = pd.Timedelta(minutes=args.bar_store_max_age)
+
+    with store_lock(path):
+        if not args.refresh_bar_store:
+            try:
+                store = BarStore(path, start_date, end_date)
+            except (FileNotFoundError, KeyError, ValueError):
+                store = None
+            if store is not None and store.covers(
+                tickers, start_date, end_date, max_age
+            ):
+                logger.info(f"使用共用 K 線檔 (Using shared bar store): {path}")
+                return store
+
+        data_batch = _download_interval(
+            tickers, interval, start_date, end_date, prepost
+        )
+        write_bar_store(
+            path, data_batch, tickers, interval, start_date, end_date, prepost
+        )
+        logger.info(f"K 線檔已寫入 (Bar store written): {path}")
+
+    return BarStore(path, start_date, end_date)
+
 
 def download_stock_data(
     tickers: list,
@@ -14,62 +96,73 @@ def download_stock_data(
 ):
     """
     Downloads stock data for the given tickers and intervals, and handles timezone conversion.
-    """
-    print("=======================================================")
-    print("======= 開始批次下載資料 (Starting Batch Download) =======")
-    print(f"Tickers: {tickers}")
-    print(f"Intervals: {interval_short}, {interval_long}")
-    print(f"Analysis Period/Range: {period_log_str}")
-    print(f"Pre/Post Market (Short): {args.prepost_short}")
-    print(f"Pre/Post Market (Long): {args.prepost_long}")
-    print("=======================================================\n")
-
-    data_short_interval_batch = yf.download(
-        tickers=tickers,
-        interval=interval_short,
-        start=start_date,
-        end=end_date,
-        progress=True,
-        prepost=args.prepost_short,
-        group_by="ticker",
-    )
 
-    data_long_interval_batch = yf.download(
-        tickers=tickers,
-        interval=interval_long,
-        start=start_date,
-        end=end_date,
-        progress=True,
-        prepost=args.prepost_long,
-        group_by="ticker",
-    )
+    When args.bar_store is set, the data is returned as memory-mapped BarStore
+    objects shared with other runs on the same host.
 
-    new_york_tz = pytz.timezone("America/New_York")
+    With args.download_chunk_size the call returns at once: the tickers are
+    downloaded in chunks of that size on a background thread (the long
+    interval only while the short one is idle) and StreamingBars sources are
+    returned, so the first tickers can be analyzed while the rest are still
+    downloading. Close them with close() when done. Only --download-only
+    reads the long interval, so otherwise it is not downloaded at all and
+    None is returned in its place.
+    """
+    logger.info("=======================================================")
+    logger.info("======= 開始批次下載資料 (Starting Batch Download) =======")
+    logger.info(f"Tickers: {tickers}")
+    logger.info(f"Intervals: {interval_short}, {interval_long}")
+    logger.info(f"Analysis Period/Range: {period_log_str}")
+    logger.info(f"Pre/Post Market (Short): {args.prepost_short}")
+    logger.info(f"Pre/Post Market (Long): {args.prepost_long}")
+    logger.info("=======================================================\n")
 
-    if not data_short_interval_batch.empty:
-        if data_short_interval_batch.index.tzinfo is None:
-            data_short_interval_batch.index = (
-                data_short_interval_batch.index.tz_localize("UTC").tz_convert(
-                    new_york_tz
-                )
+    if args.download_chunk_size:
+        data_short_interval_batch = StreamingBars(
+            tickers,
+            lambda chunk: _download_interval(
+                chunk,
+                interval_short,
+                start_date,
+                end_date,
+                args.prepost_short,
+                progress=False,
+            ),
+            args.download_chunk_size,
+            args.download_queue,
+            name=interval_short,
+        )
+        data_long_interval_batch = None
+        if args.download_only:
+            data_long_interval_batch = StreamingBars(
+                tickers,
+                lambda chunk: _download_interval(
+                    chunk,
+                    interval_long,
+                    start_date,
+                    end_date,
+                    args.prepost_long,
+                    progress=False,
+                ),
+                args.download_chunk_size,
+                args.download_queue,
+                after=data_short_interval_batch,
+                name=interval_long,
             )
-        else:
-            data_short_interval_batch.index = (
-                data_short_interval_batch.index.tz_convert(new_york_tz)
-            )
-        print(f"{interval_short} 資料已轉換至 'America/New_York' 時區。")
-
-    if not data_long_interval_batch.empty:
-        if data_long_interval_batch.index.tzinfo is None:
-            data_long_interval_batch.index = data_long_interval_batch.index.tz_localize(
-                "UTC"
-            ).tz_convert(new_york_tz)
-        else:
-            data_long_interval_batch.index = data_long_interval_batch.index.tz_convert(
-                new_york_tz
-            )
-        print("60m 資料已轉換至 'America/New_York' 時區。")
+        logger.info(
+            f"\n======= 背景分批下載中 (每批 {args.download_chunk_size} 檔)，開始執行分析... "
+            f"(Downloading in chunks of {args.download_chunk_size} in the background, "
+            f"starting the analysis) ======="
+        )
+        return data_short_interval_batch, data_long_interval_batch
+
+    data_short_interval_batch = _load_or_download(
+        tickers, interval_short, start_date, end_date, args.prepost_short, args
+    )
+    data_long_interval_batch = _load_or_download(
+        tickers, interval_long, start_date, end_date, args.prepost_long, args
+    )
 
-    print("\n======= 資料下載與處理完畢。開始執行分析... =======")
+    logger.info("\n======= 資料下載與處理完畢。開始執行分析... =======")
 
     return data_short_interval_batch, data_long_interval_batch
@@ -0,0 +1,346 @@
+import argparse
+import logging
+import math
+
+import numpy as np
+import pandas as pd
+
+from .indicators import TRAIL_INDICATORS, IndicatorCache, trail_params
+from .ledger import TradeLedger
+from .log import get_logger
+
+logger = get_logger("events")
+
+BACKTEST_ENGINES = ["loop", "event"]
+
+# 區塊大小：範圍查詢以整個區塊為單位，區塊內以向量化掃描精確判斷
+# (Block size: range queries work on whole blocks of bars, and the bars of a
+# candidate block are checked exactly with one vectorized scan)
+BLOCK = 32
+# 可能觸發的區塊數不超過此值時直接精確掃描，不再對半切
+# (Candidate runs of at most this many blocks are scanned exactly instead of
+# being halved further)
+SCAN_BLOCKS = 8
+
+
+class RangeQuery:
+    """
+    以區塊為單位的區間最小值或最大值查詢 (Range-minimum or range-maximum
+    queries over whole blocks of BLOCK bars).
+
+    Keeps the extreme of every block and a sparse table over them, so the
+    extreme of any run of blocks is two lookups, with about
+    n / BLOCK * log(n / BLOCK) floats of memory. ``values`` must not contain
+    NaN; the last block is padded with the identity of ``op``.
+    """
+
+    def __init__(self, values: np.ndarray, op):
+        self._pick = min if op is np.minimum else max
+        n_blocks = -(-len(values) // BLOCK)
+        padded = np.full(n_blocks * BLOCK, np.inf if op is np.minimum else -np.inf)
+        padded[: len(values)] = values
+        self._levels = [op.reduce(padded.reshape(n_blocks, BLOCK), axis=1)]
+        width = 1
+        while 2 * width <= n_blocks:
+            previous = self._levels[-1]
+            self._levels.append(op(previous[:-width], previous[width:]))
+            width *= 2
+
+    def __call__(self, first: int, last: int) -> float:
+        """區塊 [first, last) 的極值 (Extreme over blocks first..last-1), last > first."""
+        level = (last - first).bit_length() - 1
+        table = self._levels[level]
+        return self._pick(table[first], table[last - (1 << level)])
+
+
+class BacktestIndex:
+    """
+    一檔股票的預先計算索引，可供多組追蹤參數重複使用。
+    Per-ticker range-extreme indexes for the event-driven backtest, built
+    once and shared by every trail setting run on the same bars: range-min
+    of Low, range-max of High, the first bar of the next session for every
+    bar, and (on first use) range-min/max of the atr/std volatility that
+    the adaptive trail modes scale.
+
+    Missing Low/High are stored as +inf/-inf, which never set a new low or
+    high and never trigger, exactly as the NaN comparisons in backtest_chunk.
+    """
+
+    def __init__(
+        self,
+        stock_data: pd.DataFrame,
+        ticker: str,
+        interval: str,
+        indicators: IndicatorCache = None,
+    ):
+        self.stock_data = stock_data
+        self.ticker = ticker
+        self.interval = interval
+        self.indicators = indicators if indicators is not None else IndicatorCache()
+        self.index = stock_data.index
+        self.raw_lows = stock_data["Low"].to_numpy(dtype=float)
+        self.lows = np.where(np.isnan(self.raw_lows), np.inf, self.raw_lows)
+        highs = stock_data["High"].to_numpy(dtype=float)
+        self.highs = np.where(np.isnan(highs), -np.inf, highs)
+        self.low_min = RangeQuery(self.lows, np.minimum)
+        self.high_max = RangeQuery(self.highs, np.maximum)
+
+        dates = self.index.normalize().asi8
+        n_bars = len(dates)
+        day_starts = (
+            np.flatnonzero(np.r_[True, dates[1:] != dates[:-1]]) if n_bars else []
+        )
+        # 每根 K 棒之後下一個交易日的第一根 K 棒 (First bar of the next session)
+        self.next_day = np.repeat(
+            np.r_[day_starts[1:], n_bars], np.diff(np.r_[day_starts, n_bars])
+        ).tolist()
+        self._volatility = {}
+
+    def __len__(self) -> int:
+        return len(self.lows)
+
+    def volatility(self, trail_mode: str, window: int) -> tuple:
+        """
+        (前一根 K 棒的波動率百分比, 區間最小值, 區間最大值)，與 trail_percentages 相同。
+        (Lag-1 volatility percentage as used by trail_percentages, its range-min
+        and its range-max); NaN warm-up bars are excluded from both.
+        """
+        key = (trail_mode, window)
+        if key not in self._volatility:
+            values = self.indicators.get(
+                TRAIL_INDICATORS[trail_mode],
+                self.ticker,
+                self.interval,
+                self.stock_data,
+                window,
+                lag=1,
+            )
+            self._volatility[key] = (
+                values,
+                RangeQuery(np.where(np.isnan(values), np.inf, values), np.minimum),
+                RangeQuery(np.where(np.isnan(values), -np.inf, values), np.maximum),
+            )
+        return self._volatility[key]
+
+
+def _trail_factors(bar_index: BacktestIndex, args: argparse.Namespace) -> tuple:
+    """
+    回傳 (進場係數, 出場係數, 進場係數下界, 出場係數上界) 四個函式。
+    Returns (entry factors of bars [a, b), exit factors of bars [a, b), lower
+    bound of the entry factor over blocks [p, q), upper bound of the exit
+    factor over blocks [p, q)). Factors are computed with the same operations
+    as backtest_chunk, so the trigger prices match it bit for bit.
+    """
+    trail_mode = getattr(args, "trail_mode", "fixed")
+    if trail_mode == "fixed":
+        entry = 1 + float(args.entry_trail_pct) / 100
+        exit_ = 1 - float(args.exit_trail_pct) / 100
+        return (
+            lambda a, b: entry,
+            lambda a, b: exit_,
+            lambda p, q: entry,
+            lambda p, q: exit_,
+        )
+
+    values, volatility_min, volatility_max = bar_index.volatility(
+        trail_mode, args.trail_window
+    )
+    entry_mult = args.entry_trail_mult
+    exit_mult = args.exit_trail_mult
+
+    # 係數對波動率為線性，區間極值出現在波動率的最小或最大值
+    # (Factors are linear in the volatility, so their extremes over a range
+    # are reached at the volatility's minimum or maximum)
+    def entry_bound(p, q):
+        low, high = volatility_min(p, q), volatility_max(p, q)
+        return min(1 + entry_mult * low / 100, 1 + entry_mult * high / 100)
+
+    def exit_bound(p, q):
+        low, high = volatility_min(p, q), volatility_max(p, q)
+        return max(1 - exit_mult * low / 100, 1 - exit_mult * high / 100)
+
+    return (
+        lambda a, b: 1 + entry_mult * values[a:b] / 100,
+        lambda a, b: 1 - exit_mult * values[a:b] / 100,
+        entry_bound,
+        exit_bound,
+    )
+
+
+def _scan(bar_index, start, stop, extreme, factors, entry):
+    """
+    逐根精確檢查 [start, stop) (向量化)，回傳 (觸發的 K 棒, 觸發價) 或 (None, 延續的極值)。
+    Exact, vectorized check of bars [start, stop), the same comparisons as
+    backtest_chunk: for an entry the running min of Low (from ``extreme``)
+    times the entry factor against High, for an exit the running max of
+    High times the exit factor against Low. Returns (first triggering bar,
+    its trigger price), or (None, running extreme at stop).
+    """
+    lows = bar_index.lows[start:stop]
+    highs = bar_index.highs[start:stop]
+    if entry:
+        running = np.minimum.accumulate(np.r_[extreme, lows])[1:]
+        triggers = running * factors
+        hits = highs >= triggers
+    else:
+        running = np.maximum.accumulate(np.r_[extreme, highs])[1:]
+        triggers = running * factors
+        hits = lows <= triggers
+    first = int(hits.argmax())
+    if hits[first]:
+        return start + first, float(triggers[first])
+    return None, float(running[-1])
+
+
+def _next_trigger(bar_index, start, stop, extreme, factors, bound, entry):
+    """
+    在 [start, stop) 中找出第一根觸發買進 (entry) 或賣出的 K 棒。
+    First bar in [start, stop) that triggers the entry (``entry``) or the
+    trailing exit, given the running Low min / High max ``extreme`` so far.
+
+    Runs of whole blocks are skipped while they provably hold no trigger:
+    for an entry, when their max High is below their min Low (and
+    ``extreme``) times the smallest entry factor; for an exit, when their min
+    Low is above their max High (and ``extreme``) times the largest exit
+    factor. The run length doubles after every skip and is halved around a
+    run that might trigger, down to one block, which is then scanned
+    exactly. Partial blocks at either end are always scanned. Returns
+    (bar, trigger price) or (None, None).
+    """
+    low_min, high_max = bar_index.low_min, bar_index.high_max
+    position = start
+    size = 1
+    while position < stop:
+        block = position // BLOCK
+        n_blocks = min(size, (stop - position) // BLOCK)
+        if position % BLOCK == 0 and n_blocks:
+            last = block + n_blocks
+            factor = bound(block, last)
+            if entry:
+                window_extreme = min(extreme, low_min(block, last))
+                skip = factor > 0 and high_max(block, last) < factor * window_extreme
+            else:
+                window_extreme = max(extreme, high_max(block, last))
+                skip = low_min(block, last) > max(factor, 0) * window_extreme
+            if skip:
+                extreme = window_extreme
+                position += n_blocks * BLOCK
+                size = 2 * n_blocks
+                continue
+            if n_blocks > SCAN_BLOCKS:
+                size = n_blocks // 2
+                continue
+
+        end = min((block + max(n_blocks, 1)) * BLOCK, stop)
+        bar, extreme = _scan(
+            bar_index, position, end, extreme, factors(position, end), entry
+        )
+        if bar is not None:
+            return bar, extreme
+        position = end
+        size = 1
+    return None, None
+
+
+def backtest_events(
+    bar_index: BacktestIndex,
+    args: argparse.Namespace,
+    ledger: TradeLedger,
+    start: int = 0,
+    stop: int = None,
+) -> dict:
+    """
+    以事件跳躍方式回測 bar_index 的 [start, stop) 區段，結果與 backtest_chunk 相同。
+    Event-driven trailing-stop backtest over bars [start, stop) of
+    ``bar_index``, starting flat. Instead of visiting every bar it jumps from
+    one state transition to the next (the next entry trigger, the next
+    trailing exit, the next session after a sale), so the cost grows with
+    the number of trades and new lows rather than with the bar count. The
+    trades and the returned counters are the same as those of backtest_chunk
+    on the same bars with a new state.
+    """
+    start = int(start)
+    stop = len(bar_index) if stop is None else int(stop)
+    ticker = bar_index.ticker
+    ticker_id = ledger.ticker_id(ticker)
+    param_id = ledger.param_id(**trail_params(args))
+    entry_factors, exit_factors, entry_bound, exit_bound = _trail_factors(
+        bar_index, args
+    )
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
+
+    buy_count = 0
+    trade_count = 0
+    lowest = math.inf
+    i = start
+    while i < stop:
+        if args.daily_trades:
+            # 每個交易日從第一根 K 棒重新起算 (Each session restarts from its first bar)
+            segment_end = min(bar_index.next_day[i], stop)
+            if np.isnan(bar_index.raw_lows[i]):
+                # backtest_chunk 以 NaN 重設時，當日不會再觸發
+                # (backtest_chunk resets to NaN here and cannot trigger that day)
+                i = segment_end
+                continue
+            lowest = math.inf
+        else:
+            segment_end = stop
+
+        buy_bar, buy_price = _next_trigger(
+            bar_index, i, segment_end, lowest, entry_factors, entry_bound, True
+        )
+        if buy_bar is None:
+            i = segment_end
+            continue
+
+        buy_time = bar_index.index[buy_bar]
+        buy_count += 1
+        if debug_enabled:
+            logger.debug(
+                f"[{ticker}] BUY triggered at ${buy_price:.2f} on {buy_time}",
+                extra={
+                    "fields": {
+                        "event": "buy",
+                        "ticker": ticker,
+                        "price": buy_price,
+                        "bar_time": buy_time,
+                    }
+                },
+            )
+
+        sell_bar, sell_price = _next_trigger(
+            bar_index, buy_bar + 1, stop, buy_price, exit_factors, exit_bound, False
+        )
+        if sell_bar is None:
+            break
+
+        sell_time = bar_index.index[sell_bar]
+        if debug_enabled:
+            logger.debug(
+                f"[{ticker}] SELL triggered at ${sell_price:.2f} on {sell_time}",
+                extra={
+                    "fields": {
+                        "event": "sell",
+                        "ticker": ticker,
+                        "price": sell_price,
+                        "bar_time": sell_time,
+                    }
+                },
+            )
+        shares_to_trade = args.budget // buy_price if args.budget else args.shares
+        ledger.append(
+            ticker_id,
+            param_id,
+            buy_time,
+            sell_time,
+            buy_price,
+            sell_price,
+            shares_to_trade,
+        )
+        trade_count += 1
+
+        # 賣出當日其餘 K 棒不再進場 (No new entry for the rest of the sale's session)
+        lowest = bar_index.lows[sell_bar]
+        i = bar_index.next_day[sell_bar]
+
+    return {"buy_count": buy_count, "trade_count": trade_count}
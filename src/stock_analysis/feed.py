@@ -0,0 +1,234 @@
+import glob
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+FEED_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+DATASET_INDEX_NAME = "index.json"
+TILE_ROWS = 1024
+
+# 金字塔層級，由細到粗 (Pyramid levels, finest first)
+FEED_LEVELS = ["bar", "hour", "day", "week"]
+
+# 每層欄位: t 為 float64 (epoch 毫秒)，其餘為 float32
+# (Tile columns: t is float64 epoch ms, the rest float32)
+FEED_COLUMNS = [
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "p_buy",
+    "p_sell",
+    "price_diff",
+    "return",
+    "return_min",
+    "return_max",
+    "count",
+]
+
+# 分析明細欄位對應 (analysis_df column -> feed column)
+_SOURCE_COLUMNS = {
+    "Open": "open",
+    "High": "high",
+    "Low": "low",
+    "Close": "close",
+    "Volume": "volume",
+    "P_buy": "p_buy",
+    "P_sell": "p_sell",
+    "price_diff": "price_diff",
+    "return": "return",
+}
+
+
+def _bucket_keys(index: pd.DatetimeIndex, level: str) -> np.ndarray:
+    """以當地時間分組 (Bucket keys in local wall-clock time)."""
+    local = (index.tz_localize(None) if index.tz is not None else index).as_unit("ns")
+    if level == "hour":
+        return local.floor("h").asi8
+    if level == "day":
+        return local.normalize().asi8
+    if level == "week":
+        return (local.normalize() - pd.to_timedelta(local.weekday, unit="D")).asi8
+    raise ValueError(f"Unsupported feed level '{level}'.")
+
+
+def build_feed_levels(detailed_df: pd.DataFrame) -> dict:
+    """
+    將分析明細彙總為多解析度層級：每根 K 棒、每小時、每日、每週。
+    Aggregates an analysis_df into multi-resolution levels (per bar, hour,
+    day and week). Every level has the same columns: OHLC of the bars in the
+    bucket, summed volume, mean P_buy/P_sell/price_diff/return, the min/max
+    return and the number of bars. Coarser levels that do not reduce the row
+    count (e.g. 'hour' for daily bars) are skipped.
+    """
+    times = detailed_df.index.as_unit("ns").asi8 // 1_000_000
+    base = {"t": times.astype(np.float64)}
+    for source, name in _SOURCE_COLUMNS.items():
+        if source in detailed_df:
+            base[name] = detailed_df[source].to_numpy(dtype=np.float64)
+    if "return" in base:
+        base["return_min"] = base["return"]
+        base["return_max"] = base["return"]
+    base["count"] = np.ones(len(times))
+
+    levels = {"bar": base}
+    previous_rows = len(times)
+    for level in FEED_LEVELS[1:]:
+        keys = _bucket_keys(detailed_df.index, level)
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        if len(starts) >= previous_rows:
+            continue
+        ends = np.r_[starts[1:], len(keys)] - 1
+        counts = np.diff(np.r_[starts, len(keys)]).astype(np.float64)
+
+        aggregated = {"t": base["t"][starts], "count": counts}
+        for name, values in base.items():
+            if name in ("t", "count"):
+                continue
+            if name == "open":
+                aggregated[name] = values[starts]
+            elif name == "close":
+                aggregated[name] = values[ends]
+            elif name in ("high", "return_max"):
+                aggregated[name] = np.maximum.reduceat(values, starts)
+            elif name in ("low", "return_min"):
+                aggregated[name] = np.minimum.reduceat(values, starts)
+            elif name == "volume":
+                aggregated[name] = np.add.reduceat(values, starts)
+            else:
+                aggregated[name] = np.add.reduceat(values, starts) / counts
+        levels[level] = aggregated
+        previous_rows = len(starts)
+    return levels
+
+
+def _write_tile(path: str, columns: dict, names: list, rows: slice):
+    """
+    Tile 格式: float64 時間欄位後接各 float32 欄位，小端序、無標頭。
+    Tile layout: the float64 't' column followed by one float32 run per
+    column in ``names``, little-endian and header-less.
+    """
+    with open(path, "wb") as f:
+        f.write(columns["t"][rows].astype("<f8").tobytes())
+        for name in names:
+            f.write(columns[name][rows].astype("<f4").tobytes())
+
+
+def _json_number(value):
+    """JSON 不支援 NaN/inf，轉為 null (JSON has no NaN/inf; they become null)."""
+    if isinstance(value, tuple):
+        return [_json_number(v) for v in value]
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def _atomic_json(path: str, payload: dict):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def export_feed_dataset(
+    root: str,
+    ticker: str,
+    holding_hours: float,
+    analysis_results: dict,
+    detailed_df: pd.DataFrame,
+):
+    """
+    將一檔股票、一個持有期的分析結果匯出為分塊的二進位金字塔。
+    Exports one ticker/holding-period analysis as tiled binary pyramid levels
+    under ``<root>/<ticker>/<holding_hours>h/`` with a per-dataset index.json;
+    write_feed_manifest collects the indexes into the feed manifest.
+    """
+    dataset = f"{holding_hours}h"
+    directory = os.path.join(root, ticker, dataset)
+    os.makedirs(directory, exist_ok=True)
+    for stale in glob.glob(os.path.join(directory, "*.bin")):
+        os.remove(stale)
+
+    levels = build_feed_levels(detailed_df)
+    level_entries = {}
+    for level, columns in levels.items():
+        names = [name for name in FEED_COLUMNS if name in columns]
+        n_rows = len(columns["t"])
+        tiles = []
+        for i, lo in enumerate(range(0, n_rows, TILE_ROWS)):
+            rows = slice(lo, min(lo + TILE_ROWS, n_rows))
+            filename = f"{level}-{i:05d}.bin"
+            _write_tile(os.path.join(directory, filename), columns, names, rows)
+            tiles.append(
+                {
+                    "file": f"{ticker}/{dataset}/{filename}",
+                    "rows": rows.stop - rows.start,
+                    "start": float(columns["t"][rows.start]),
+                    "end": float(columns["t"][rows.stop - 1]),
+                }
+            )
+        level_entries[level] = {"rows": n_rows, "columns": names, "tiles": tiles}
+
+    summary = {
+        key: _json_number(value)
+        for key, value in analysis_results.items()
+        if isinstance(value, (int, float, np.integer, np.floating, tuple))
+    }
+    _atomic_json(
+        os.path.join(directory, DATASET_INDEX_NAME),
+        {
+            "ticker": ticker,
+            "holding_hours": holding_hours,
+            "timezone": str(detailed_df.index.tz) if detailed_df.index.tz else None,
+            "summary": summary,
+            "levels": level_entries,
+        },
+    )
+
+
+def write_feed_manifest(root: str) -> dict:
+    """
+    掃描所有資料集的 index.json 並原子地寫入 manifest.json。
+    Collects every dataset index under ``root`` into manifest.json (written
+    atomically, so concurrent shards can each rebuild it safely). The
+    manifest only lists each level's row count and time range; the tile lists
+    stay in the per-dataset index.json, which a viewer fetches on selection.
+    """
+    datasets = {}
+    for index_path in sorted(
+        glob.glob(os.path.join(root, "*", "*", DATASET_INDEX_NAME))
+    ):
+        with open(index_path, encoding="utf-8") as f:
+            entry = json.load(f)
+        levels = {
+            level: {
+                "rows": info["rows"],
+                "start": info["tiles"][0]["start"] if info["tiles"] else None,
+                "end": info["tiles"][-1]["end"] if info["tiles"] else None,
+            }
+            for level, info in entry["levels"].items()
+        }
+        datasets.setdefault(entry["ticker"], {})[str(entry["holding_hours"])] = {
+            "index": os.path.relpath(index_path, root).replace(os.sep, "/"),
+            "timezone": entry["timezone"],
+            "summary": entry["summary"],
+            "levels": levels,
+        }
+
+    manifest = {
+        "version": FEED_VERSION,
+        "time_column": "t",
+        "time_dtype": "float64",
+        "value_dtype": "float32",
+        "levels": FEED_LEVELS,
+        "tickers": datasets,
+    }
+    os.makedirs(root, exist_ok=True)
+    _atomic_json(os.path.join(root, MANIFEST_NAME), manifest)
+    return manifest
@@ -0,0 +1,193 @@
+import numpy as np
+import pandas as pd
+
+TRAIL_MODES = ["fixed", "atr", "std"]
+
+
+def average_true_range(stock_data: pd.DataFrame, window: int) -> np.ndarray:
+    """
+    以 Wilder 平滑計算的平均真實波幅 (ATR, Wilder smoothing).
+    """
+    high = stock_data["High"].to_numpy(dtype=float)
+    low = stock_data["Low"].to_numpy(dtype=float)
+    prev_close = np.r_[np.nan, stock_data["Close"].to_numpy(dtype=float)[:-1]]
+    true_range = np.fmax(
+        high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close))
+    )
+    return (
+        pd.Series(true_range)
+        .ewm(alpha=1 / window, adjust=False, min_periods=window)
+        .mean()
+        .to_numpy()
+    )
+
+
+def rolling_return_std(stock_data: pd.DataFrame, window: int) -> np.ndarray:
+    """
+    收盤報酬率的滾動標準差 (Rolling standard deviation of close-to-close returns).
+    Missing closes are carried forward, so a gap counts as a zero return
+    instead of blanking the next ``window`` bars.
+    """
+    returns = stock_data["Close"].ffill().pct_change(fill_method=None)
+    return returns.rolling(window, min_periods=window).std().to_numpy()
+
+
+def session_vwap(stock_data: pd.DataFrame) -> np.ndarray:
+    """
+    每個交易日重新起算的成交量加權平均價 (VWAP anchored at each local session).
+    """
+    typical = (stock_data["High"] + stock_data["Low"] + stock_data["Close"]) / 3
+    volume = stock_data["Volume"].astype(float)
+    session = stock_data.index.normalize()
+    cum_pv = (typical * volume).groupby(session).cumsum()
+    cum_volume = volume.groupby(session).cumsum()
+    return (cum_pv / cum_volume.where(cum_volume > 0)).to_numpy()
+
+
+INDICATORS = {
+    "atr": average_true_range,
+    "std": rolling_return_std,
+    "vwap": lambda data, window: session_vwap(data),
+}
+
+# 由快取中的基礎指標換算的百分比指標 (Percent indicators derived from a cached base)
+DERIVED_INDICATORS = {
+    "atr_pct": (
+        "atr",
+        lambda atr, data: atr / data["Close"].to_numpy(dtype=float) * 100,
+    ),
+    "std_pct": ("std", lambda std, data: std * 100),
+}
+
+# 追蹤模式使用的百分比指標 (Percent indicator behind each adaptive trail mode)
+TRAIL_INDICATORS = {"atr": "atr_pct", "std": "std_pct"}
+
+
+class IndicatorCache:
+    """
+    以 (股票, K 線間隔, 指標, 視窗) 為鍵的指標快取；每檔股票每個指標只計算一次。
+    Indicator cache keyed by (ticker, interval, indicator, window).
+
+    Each indicator is computed once, vectorized, over the bars it is first
+    requested for, and later requests for the same bars or any contiguous
+    slice of them (a tail used by the fixed-lag analysis, a window of the
+    optimizer) are served from the cached array without recomputation.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self.computed = 0
+
+    def get(
+        self,
+        name: str,
+        ticker: str,
+        interval: str,
+        stock_data: pd.DataFrame,
+        window: int = None,
+        lag: int = 0,
+    ) -> np.ndarray:
+        """
+        回傳與 stock_data 對齊的指標值；lag=1 為前一根 K 棒的值 (沿用快取中的完整序列)。
+        Indicator values aligned with stock_data. With lag=1 each bar gets the
+        previous bar's value, taken from the full cached series, so a slice's
+        first bar still sees the bar before the slice.
+        """
+        key = (ticker, interval, name, window)
+        timestamps = stock_data.index.asi8
+        entry = self._entries.get(key)
+        lo = 0
+        if entry is not None and len(timestamps):
+            cached_timestamps = entry[0]
+            lo = int(np.searchsorted(cached_timestamps, timestamps[0]))
+            hi = lo + len(timestamps)
+            if not (
+                hi <= len(cached_timestamps)
+                and cached_timestamps[lo] == timestamps[0]
+                and cached_timestamps[hi - 1] == timestamps[-1]
+            ):
+                entry = None
+
+        if entry is None:
+            if name in DERIVED_INDICATORS:
+                base, derive = DERIVED_INDICATORS[name]
+                values = derive(
+                    self.get(base, ticker, interval, stock_data, window), stock_data
+                )
+            else:
+                values = INDICATORS[name](stock_data, window)
+            values = np.asarray(values, dtype=float)
+            values.flags.writeable = False
+            self._entries[key] = (timestamps, values)
+            self.computed += 1
+            lo = 0
+        values = self._entries[key][1]
+
+        start = lo - lag
+        if start >= 0:
+            return values[start : start + len(timestamps)]
+        return np.r_[np.full(-start, np.nan), values[: start + len(timestamps)]]
+
+    def discard(self, ticker: str):
+        """移除一檔股票的所有指標 (Drops every cached indicator of a ticker)."""
+        for key in [key for key in self._entries if key[0] == ticker]:
+            del self._entries[key]
+
+
+def trail_params(args) -> dict:
+    """
+    記錄在交易紀錄中的策略參數 (Strategy parameters recorded in the trade ledger).
+    """
+    params = {
+        "entry_trail_pct": args.entry_trail_pct,
+        "exit_trail_pct": args.exit_trail_pct,
+        "budget": args.budget,
+    }
+    trail_mode = getattr(args, "trail_mode", "fixed")
+    if trail_mode != "fixed":
+        params.update(
+            trail_mode=trail_mode,
+            entry_trail_mult=args.entry_trail_mult,
+            exit_trail_mult=args.exit_trail_mult,
+            trail_window=args.trail_window,
+        )
+    return params
+
+
+def trail_percentages(
+    stock_data: pd.DataFrame,
+    ticker: str,
+    args,
+    indicators: IndicatorCache = None,
+) -> tuple:
+    """
+    每根 K 棒的進場/出場追蹤百分比。
+    Per-bar entry and exit trail percentages for args.trail_mode.
+
+    'fixed' uses --entry-trail-pct/--exit-trail-pct on every bar. 'atr' and
+    'std' scale the volatility measured up to the previous bar (ATR as a
+    percentage of the close, or the rolling return standard deviation) by
+    --entry-trail-mult/--exit-trail-mult, so a trigger never uses the bar it
+    fires on. Bars before the indicator warms up get NaN and never trigger.
+    """
+    n_bars = len(stock_data)
+    trail_mode = getattr(args, "trail_mode", "fixed")
+    if trail_mode == "fixed":
+        return (
+            np.full(n_bars, float(args.entry_trail_pct)),
+            np.full(n_bars, float(args.exit_trail_pct)),
+        )
+
+    indicators = indicators if indicators is not None else IndicatorCache()
+    volatility_pct = indicators.get(
+        TRAIL_INDICATORS[trail_mode],
+        ticker,
+        args.interval_short,
+        stock_data,
+        args.trail_window,
+        lag=1,
+    )
+    return (
+        args.entry_trail_mult * volatility_pct,
+        args.exit_trail_mult * volatility_pct,
+    )
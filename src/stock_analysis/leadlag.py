@@ -0,0 +1,224 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from .sessions import parse_interval_minutes
+
+LEAD_LAG_SCOPES = ["group", "universe"]
+
+# 每批 irfft 的最大元素數，用來限制記憶體 (Caps the elements per batched irfft)
+MAX_BATCH_ELEMENTS = 8_000_000
+
+
+def aligned_returns(stock_data_map: dict, regular_hours_mask=None) -> pd.DataFrame:
+    """
+    將各股票的 K 棒報酬率對齊到共同時間軸 (缺值為 NaN)。
+    Aligns the per-bar close-to-close returns of every ticker on the union of
+    their timestamps, NaN where a ticker has no bar. Returns that span a
+    missing bar or a session boundary (the overnight gap) are dropped, so
+    every value is the move over exactly one bar within one session.
+    ``regular_hours_mask(index)``, if given, selects the bars to keep first.
+    """
+    columns = {}
+    for ticker, stock_data in stock_data_map.items():
+        close = stock_data["Close"].dropna()
+        if regular_hours_mask is not None and not close.empty:
+            close = close[regular_hours_mask(close.index)]
+        columns[ticker] = close
+    closes = pd.DataFrame(columns).sort_index()
+
+    returns = np.log(closes).diff()
+    session = closes.index.normalize()
+    new_session = np.r_[True, session[1:] != session[:-1]]
+    returns.iloc[new_session] = np.nan
+    return returns
+
+
+def _fast_length(n: int) -> int:
+    """不小於 n 的最小 2^a 3^b 5^c (Smallest 2^a 3^b 5^c >= n, fast for FFTs)."""
+    best = 1 << int(np.ceil(np.log2(max(n, 1))))
+    power5 = 1
+    while power5 < best:
+        power35 = power5
+        while power35 < best:
+            length = power35 << max(0, int(np.ceil(np.log2(n / power35))))
+            best = min(best, length)
+            power35 *= 3
+        power5 *= 5
+    return best
+
+
+def _batched_correlate(
+    spectra: np.ndarray,
+    left: np.ndarray,
+    right: np.ndarray,
+    n_fft: int,
+    lags: np.ndarray,
+) -> np.ndarray:
+    """
+    以頻域乘積計算多組序列對的互相關 sum_t a[t] * b[t + lag]。
+    Cross-correlations sum_t a[t] * b[t + lag] of many pairs through one
+    batched inverse real FFT of conj(A) * B, keeping only ``lags``.
+    """
+    out = np.empty((len(left), len(lags)))
+    batch = max(1, MAX_BATCH_ELEMENTS // n_fft)
+    for start in range(0, len(left), batch):
+        stop = min(start + batch, len(left))
+        products = np.conj(spectra[left[start:stop]]) * spectra[right[start:stop]]
+        out[start:stop] = np.fft.irfft(products, n=n_fft, axis=1)[:, lags % n_fft]
+    return out
+
+
+def lead_lag_table(
+    returns: pd.DataFrame, max_lag: int, pairs: list = None, min_overlap: int = 30
+) -> pd.DataFrame:
+    """
+    以 FFT 計算所有股票對在 -max_lag..max_lag 根 K 棒的互相關，並找出最強的非零落後期。
+    Cross-correlates every ticker pair's returns over lags -max_lag..max_lag
+    with FFTs and reports each pair's strongest non-zero lag.
+
+    Each column is standardized and zero-filled where missing, transformed
+    once, and every pair's correlations at all lags come from one inverse
+    FFT (O(n log n) per pair instead of O(n * lags)). The number of bars
+    both tickers have at each lag is obtained the same way from the
+    missing-value masks, so each value is the correlation over the bars
+    the two series actually share. corr(lag) > 0 at lag k > 0 means
+    ticker_a's return is followed k bars later by a same-signed return of
+    ticker_b, i.e. a leads b. Lags with fewer than min_overlap shared bars
+    are ignored.
+
+    Columns: ticker_a, ticker_b, leader, follower, best_lag (bars, >0),
+    corr (at the best lag, signed), corr_0 (contemporaneous), asymmetry
+    (|corr| at the best lag minus |corr| at the opposite lag), overlap and
+    z (corr * sqrt(overlap)). Rows are ranked by |corr|, strongest first.
+    """
+    tickers = list(returns.columns)
+    if pairs is None:
+        pairs = list(itertools.combinations(tickers, 2))
+    if not pairs or not len(returns):
+        return pd.DataFrame()
+
+    values = returns.to_numpy(dtype=float)
+    mask = ~np.isnan(values)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        counts = mask.sum(axis=0)
+        mean = np.where(mask, values, 0.0).sum(axis=0) / counts
+        centered = np.where(mask, values - mean, 0.0)
+        std = np.sqrt((centered**2).sum(axis=0) / counts)
+        standardized = np.where(std > 0, centered / std, 0.0)
+
+    n_bars = len(values)
+    max_lag = int(min(max_lag, n_bars - 1))
+    # 補零長度 >= n + max_lag，循環相關不會回繞 (Zero padding avoids wrap-around)
+    n_fft = _fast_length(n_bars + max_lag)
+    value_spectra = np.fft.rfft(standardized.T, n=n_fft, axis=1)
+
+    position = {ticker: i for i, ticker in enumerate(tickers)}
+    left = np.array([position[a] for a, _ in pairs])
+    right = np.array([position[b] for _, b in pairs])
+    lags = np.arange(-max_lag, max_lag + 1)
+    sums = _batched_correlate(value_spectra, left, right, n_fft, lags)
+
+    # 共同 K 棒數只與缺值型態有關，相同型態的股票對只計算一次
+    # (Shared bar counts only depend on the missing-value patterns, which most
+    # tickers share, so each pair of distinct patterns is correlated once)
+    patterns, pattern_of = np.unique(mask.T, axis=0, return_inverse=True)
+    pattern_of = pattern_of.ravel()
+    pattern_pairs, pair_index = np.unique(
+        np.stack([pattern_of[left], pattern_of[right]], axis=1),
+        axis=0,
+        return_inverse=True,
+    )
+    mask_spectra = np.fft.rfft(patterns.astype(float), n=n_fft, axis=1)
+    overlap = np.rint(
+        _batched_correlate(
+            mask_spectra, pattern_pairs[:, 0], pattern_pairs[:, 1], n_fft, lags
+        )
+    )[pair_index.ravel()]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        corr = np.where(overlap >= max(min_overlap, 2), sums / overlap, np.nan)
+
+    zero = max_lag
+    scored = np.abs(corr)
+    scored[:, zero] = np.nan
+    valid = ~np.all(np.isnan(scored), axis=1)
+    best = np.full(len(pairs), zero)
+    best[valid] = np.nanargmax(scored[valid], axis=1)
+
+    rows = np.arange(len(pairs))
+    best_corr = corr[rows, best]
+    opposite_corr = corr[rows, 2 * zero - best]
+    best_lag = lags[best]
+    a_leads = best_lag > 0
+    names = np.array(tickers, dtype=object)
+    table = pd.DataFrame(
+        {
+            "ticker_a": [a for a, _ in pairs],
+            "ticker_b": [b for _, b in pairs],
+            "leader": np.where(a_leads, names[left], names[right]),
+            "follower": np.where(a_leads, names[right], names[left]),
+            "best_lag": np.abs(best_lag),
+            "corr": best_corr,
+            "corr_0": corr[:, zero],
+            "asymmetry": np.abs(best_corr) - np.abs(opposite_corr),
+            "overlap": overlap[rows, best].astype(int),
+        }
+    )
+    table["z"] = table["corr"] * np.sqrt(table["overlap"])
+    table = table[valid]
+    order = np.argsort(-np.abs(table["corr"].to_numpy()), kind="stable")
+    return table.iloc[order].reset_index(drop=True)
+
+
+def rank_lead_lag(
+    stock_data_map: dict,
+    ticker_list_array: list,
+    interval: str,
+    max_lag: int,
+    scope: str = "group",
+    regular_hours_mask=None,
+    min_overlap: int = 30,
+) -> pd.DataFrame:
+    """
+    對整個股票池計算領先/落後關係；scope 'group' 只比較同一主題群組內的股票對。
+    Lead-lag ranking for the whole universe. With scope 'group' only pairs
+    within the same ticker group are compared (a pair in several groups is
+    computed once); with 'universe' every pair is. The return matrix and its
+    FFTs are built once for all groups. Adds the group index and the best
+    lag in minutes.
+    """
+    tickers = [
+        t
+        for t in dict.fromkeys(itertools.chain(*ticker_list_array))
+        if t in stock_data_map
+    ]
+    returns = aligned_returns(
+        {t: stock_data_map[t] for t in tickers}, regular_hours_mask
+    )
+
+    pair_groups = {}
+    if scope == "universe":
+        for pair in itertools.combinations(tickers, 2):
+            pair_groups[pair] = ""
+    else:
+        order = {t: i for i, t in enumerate(tickers)}
+        for group_index, ticker_list in enumerate(ticker_list_array):
+            members = sorted({t for t in ticker_list if t in order}, key=order.get)
+            for pair in itertools.combinations(members, 2):
+                pair_groups.setdefault(pair, str(group_index))
+
+    table = lead_lag_table(returns, max_lag, list(pair_groups), min_overlap)
+    if table.empty:
+        return table
+    table.insert(
+        0,
+        "group",
+        [pair_groups[(a, b)] for a, b in zip(table["ticker_a"], table["ticker_b"])],
+    )
+    table.insert(
+        table.columns.get_loc("best_lag") + 1,
+        "lag_minutes",
+        table["best_lag"] * parse_interval_minutes(interval),
+    )
+    return table
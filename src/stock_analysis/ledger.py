@@ -0,0 +1,186 @@
+import numpy as np
+import pandas as pd
+
+# 各欄位的型別 (Column dtypes); 時間以 UTC 奈秒整數儲存 (times are int64 ns UTC)
+LEDGER_COLUMNS = {
+    "ticker_id": np.int32,
+    "param_id": np.int32,
+    "buy_time": np.int64,
+    "sell_time": np.int64,
+    "buy_price": np.float64,
+    "sell_price": np.float64,
+    "shares": np.float64,
+    "profit_and_loss": np.float64,
+    "profit_pct": np.float64,
+}
+
+
+class TradeLedger:
+    """
+    以欄位陣列儲存的交易紀錄；股票代碼與策略參數只各存一次，每筆交易僅保留編號。
+    Columnar trade ledger. Tickers and strategy parameter sets are stored once
+    in lookup tables and each trade only keeps their integer ids, so the cost
+    per trade is a fixed number of typed array slots.
+    """
+
+    def __init__(self, capacity: int = 256, tz=None):
+        self._columns = {
+            name: np.empty(capacity, dtype=dtype)
+            for name, dtype in LEDGER_COLUMNS.items()
+        }
+        self._size = 0
+        self.tickers = []
+        self.params = []
+        self._ticker_ids = {}
+        self._param_ids = {}
+        self.tz = tz
+
+    def __len__(self) -> int:
+        return self._size
+
+    def ticker_id(self, ticker: str) -> int:
+        if ticker not in self._ticker_ids:
+            self._ticker_ids[ticker] = len(self.tickers)
+            self.tickers.append(ticker)
+        return self._ticker_ids[ticker]
+
+    def param_id(self, **params) -> int:
+        key = tuple(sorted(params.items()))
+        if key not in self._param_ids:
+            self._param_ids[key] = len(self.params)
+            self.params.append(dict(params))
+        return self._param_ids[key]
+
+    def _reserve(self, extra: int):
+        needed = self._size + extra
+        capacity = len(self._columns["ticker_id"])
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        for name, values in self._columns.items():
+            grown = np.empty(new_capacity, dtype=values.dtype)
+            grown[: self._size] = values[: self._size]
+            self._columns[name] = grown
+
+    def append(
+        self,
+        ticker_id: int,
+        param_id: int,
+        buy_time: pd.Timestamp,
+        sell_time: pd.Timestamp,
+        buy_price: float,
+        sell_price: float,
+        shares: float,
+    ):
+        """
+        新增一筆交易並計算損益 (Appends one trade and derives its P&L).
+        """
+        if self.tz is None:
+            self.tz = buy_time.tz
+        self._reserve(1)
+        i = self._size
+        columns = self._columns
+        columns["ticker_id"][i] = ticker_id
+        columns["param_id"][i] = param_id
+        columns["buy_time"][i] = buy_time.value
+        columns["sell_time"][i] = sell_time.value
+        columns["buy_price"][i] = buy_price
+        columns["sell_price"][i] = sell_price
+        columns["shares"][i] = shares
+        columns["profit_and_loss"][i] = (sell_price - buy_price) * shares
+        columns["profit_pct"][i] = (sell_price - buy_price) / buy_price
+        self._size += 1
+
+    def column(self, name: str) -> np.ndarray:
+        """回傳欄位的唯讀視圖 (Returns a read-only view of a column)."""
+        view = self._columns[name][: self._size]
+        view.flags.writeable = False
+        return view
+
+    def extend(self, other: "TradeLedger"):
+        """
+        合併另一份紀錄，並重新對應股票與參數編號。
+        Appends another ledger, remapping its ticker and parameter ids.
+        """
+        if not len(other):
+            return
+        if self.tz is None:
+            self.tz = other.tz
+        ticker_map = np.array(
+            [self.ticker_id(t) for t in other.tickers], dtype=np.int32
+        )
+        param_map = np.array([self.param_id(**p) for p in other.params], dtype=np.int32)
+
+        n = len(other)
+        self._reserve(n)
+        target = slice(self._size, self._size + n)
+        for name in LEDGER_COLUMNS:
+            self._columns[name][target] = other.column(name)
+        self._columns["ticker_id"][target] = ticker_map[other.column("ticker_id")]
+        self._columns["param_id"][target] = param_map[other.column("param_id")]
+        self._size += n
+
+    @classmethod
+    def concat(cls, ledgers: list) -> "TradeLedger":
+        merged = cls(capacity=max(1, sum(len(ledger) for ledger in ledgers)))
+        for ledger in ledgers:
+            merged.extend(ledger)
+        return merged
+
+    def _times(self, name: str, start: int = 0) -> pd.DatetimeIndex:
+        times = pd.DatetimeIndex(self.column(name)[start:].view("M8[ns]"))
+        return times.tz_localize("UTC").tz_convert(self.tz) if self.tz else times
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        轉成 DataFrame，股票代碼為 Categorical，參數欄位依 param_id 展開。
+        Converts to a DataFrame with a categorical ticker column and the
+        parameter columns expanded from the parameter table.
+        """
+        frame = pd.DataFrame(
+            {
+                "ticker": pd.Categorical.from_codes(
+                    self.column("ticker_id"), categories=self.tickers
+                ),
+                "buy_time": self._times("buy_time"),
+                "sell_time": self._times("sell_time"),
+                **{
+                    name: self.column(name)
+                    for name in (
+                        "buy_price",
+                        "sell_price",
+                        "shares",
+                        "profit_and_loss",
+                        "profit_pct",
+                    )
+                },
+            }
+        )
+        if self.params:
+            params = pd.DataFrame(self.params)
+            param_ids = self.column("param_id")
+            for name in params.columns:
+                frame[name] = params[name].to_numpy()[param_ids]
+        return frame
+
+    def records(self, start: int = 0):
+        """
+        逐筆產生與舊版相同格式的交易 dict (Yields trades as the legacy dicts).
+        Only the trades from ``start`` on have their times converted, so
+        reporting each ticker's new trades stays linear in the trade count.
+        """
+        buy_times = self._times("buy_time", start)
+        sell_times = self._times("sell_time", start)
+        for i in range(start, self._size):
+            record = {
+                "ticker": self.tickers[self._columns["ticker_id"][i]],
+                "buy_price": self._columns["buy_price"][i],
+                "buy_time": buy_times[i - start],
+                "sell_price": self._columns["sell_price"][i],
+                "sell_time": sell_times[i - start],
+                "shares": self._columns["shares"][i],
+                "profit_and_loss": self._columns["profit_and_loss"][i],
+                "profit_pct": self._columns["profit_pct"][i],
+            }
+            record.update(self.params[self._columns["param_id"][i]])
+            yield record
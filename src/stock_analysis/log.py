@@ -0,0 +1,79 @@
+import json
+import logging
+import logging.handlers
+import sys
+
+LOGGER_NAME = "stock_analysis"
+
+LOG_LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR"]
+
+
+def get_logger(name: str = None) -> logging.Logger:
+    """
+    取得 stock_analysis 底下的 logger (Returns a logger under the stock_analysis namespace).
+    """
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    將每筆紀錄輸出為一行 JSON；以 extra={"fields": {...}} 附加結構化欄位。
+    Formats each record as one JSON line; structured fields are attached with
+    extra={"fields": {...}}.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        payload.update(getattr(record, "fields", {}))
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def setup_logging(
+    level: str = "INFO",
+    quiet: bool = False,
+    json_path: str = None,
+    buffer_capacity: int = 1000,
+) -> logging.Logger:
+    """
+    設定主控台輸出與選用的 JSON-lines 紀錄檔。
+    Configures console output and an optional JSON-lines sink.
+
+    The console handler prints bare messages (as the previous print calls
+    did) at ``level``, or at WARNING when ``quiet`` is set. The JSON sink keeps
+    ``level`` regardless of ``quiet`` and is written through a MemoryHandler,
+    so records are flushed to disk in batches of ``buffer_capacity``.
+    """
+    logger = get_logger()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+    base_level = getattr(logging, level.upper())
+    console_level = max(base_level, logging.WARNING) if quiet else base_level
+
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter("%(message)s"))
+    console.setLevel(console_level)
+    logger.addHandler(console)
+    effective_level = console_level
+
+    if json_path:
+        file_handler = logging.FileHandler(json_path, mode="w", encoding="utf-8")
+        file_handler.setFormatter(JsonLinesFormatter())
+        buffered = logging.handlers.MemoryHandler(
+            capacity=buffer_capacity, flushLevel=logging.ERROR, target=file_handler
+        )
+        buffered.setLevel(base_level)
+        logger.addHandler(buffered)
+        effective_level = min(effective_level, base_level)
+
+    # logger 的層級決定熱迴圈中 isEnabledFor 的結果，低於此層級的訊息完全不會產生
+    # (The logger level gates isEnabledFor in hot loops; lower records are never built)
+    logger.setLevel(effective_level)
+    logger.propagate = False
+    return logger
@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+
+from .ledger import TradeLedger
+
+METRIC_COLUMNS = [
+    "trades",
+    "total_pnl",
+    "avg_pnl",
+    "win_rate",
+    "profit_factor",
+    "avg_profit_pct",
+    "avg_hold",
+    "max_drawdown",
+]
+
+
+def equity_curve(ledger: TradeLedger, ticker: str = None) -> pd.Series:
+    """
+    依賣出時間排序的累積損益曲線 (Cumulative P&L ordered by sell time).
+    """
+    sell_times = ledger.column("sell_time")
+    pnl = ledger.column("profit_and_loss")
+    if ticker is not None:
+        mask = ledger.column("ticker_id") == ledger.tickers.index(ticker)
+        sell_times, pnl = sell_times[mask], pnl[mask]
+
+    order = np.argsort(sell_times, kind="stable")
+    index = pd.DatetimeIndex(sell_times[order].view("M8[ns]"))
+    if ledger.tz:
+        index = index.tz_localize("UTC").tz_convert(ledger.tz)
+    return pd.Series(np.cumsum(pnl[order]), index=index, name="equity")
+
+
+def _grouped_metrics(group: np.ndarray, n_groups: int, ledger: TradeLedger) -> dict:
+    """
+    以 bincount 與分段累積運算計算每組的績效指標。
+    Computes per-group metrics with bincount and segmented accumulations.
+    """
+    pnl = ledger.column("profit_and_loss")
+    hold_ns = ledger.column("sell_time") - ledger.column("buy_time")
+
+    trades = np.bincount(group, minlength=n_groups)
+    total_pnl = np.bincount(group, weights=pnl, minlength=n_groups)
+    wins = np.bincount(group, weights=pnl > 0, minlength=n_groups)
+    gross_profit = np.bincount(
+        group, weights=np.where(pnl > 0, pnl, 0), minlength=n_groups
+    )
+    gross_loss = np.bincount(
+        group, weights=np.where(pnl < 0, -pnl, 0), minlength=n_groups
+    )
+    pct_sum = np.bincount(
+        group, weights=ledger.column("profit_pct"), minlength=n_groups
+    )
+    hold_sum = np.bincount(group, weights=hold_ns, minlength=n_groups)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_pnl = total_pnl / trades
+        win_rate = wins / trades
+        avg_profit_pct = pct_sum / trades
+        avg_hold = hold_sum / trades
+        profit_factor = np.where(
+            gross_loss > 0,
+            gross_profit / gross_loss,
+            np.where(gross_profit > 0, np.inf, np.nan),
+        )
+
+    # 最大回撤: 依 (組別, 賣出時間) 排序後計算分段累積損益與分段高點
+    # (Max drawdown: segmented equity and running peak after sorting by group/time)
+    order = np.lexsort((ledger.column("sell_time"), group))
+    sorted_group = group[order]
+    equity = pd.Series(pnl[order]).groupby(sorted_group).cumsum()
+    peak = np.maximum(equity.groupby(sorted_group).cummax().to_numpy(), 0.0)
+    drawdown = peak - equity.to_numpy()
+    max_drawdown = np.zeros(n_groups)
+    if len(drawdown):
+        starts = np.flatnonzero(np.r_[True, sorted_group[1:] != sorted_group[:-1]])
+        max_drawdown[sorted_group[starts]] = np.maximum.reduceat(drawdown, starts)
+
+    return {
+        "trades": trades,
+        "total_pnl": total_pnl,
+        "avg_pnl": avg_pnl,
+        "win_rate": win_rate,
+        "profit_factor": profit_factor,
+        "avg_profit_pct": avg_profit_pct,
+        "avg_hold": pd.to_timedelta(avg_hold, unit="ns"),
+        "max_drawdown": max_drawdown,
+    }
+
+
+def compute_trade_metrics(
+    ledger: TradeLedger, by_params: bool = False, include_total: bool = True
+) -> pd.DataFrame:
+    """
+    計算每檔股票 (及每組參數) 與整體的績效指標。
+    Computes per-ticker (optionally per-ticker and parameter set) and
+    aggregate performance metrics: trade count, total/average P&L, win rate,
+    profit factor, average profit %, average holding time and max drawdown of
+    the realized equity curve.
+    """
+    n_tickers = len(ledger.tickers)
+    ticker_ids = ledger.column("ticker_id").astype(np.int64)
+
+    if by_params:
+        n_params = max(1, len(ledger.params))
+        group = ticker_ids * n_params + ledger.column("param_id")
+        n_groups = n_tickers * n_params
+        index = pd.MultiIndex.from_product(
+            [ledger.tickers, range(n_params)], names=["ticker", "param_id"]
+        )
+    else:
+        group = ticker_ids
+        n_groups = n_tickers
+        index = pd.Index(ledger.tickers, name="ticker")
+
+    metrics = pd.DataFrame(_grouped_metrics(group, n_groups, ledger), index=index)
+    metrics = metrics[metrics["trades"] > 0]
+
+    if by_params and ledger.params:
+        params = pd.DataFrame(ledger.params)
+        for name in params.columns:
+            metrics[name] = params[name].to_numpy()[
+                metrics.index.get_level_values("param_id")
+            ]
+
+    if include_total and len(ledger):
+        total = _grouped_metrics(np.zeros(len(ledger), dtype=np.int64), 1, ledger)
+        total_row = pd.DataFrame(total, index=[("ALL", -1)] if by_params else ["ALL"])
+        if by_params:
+            total_row.index = pd.MultiIndex.from_tuples(
+                total_row.index, names=metrics.index.names
+            )
+        metrics = pd.concat([metrics, total_row])
+
+    return metrics[METRIC_COLUMNS + [c for c in metrics if c not in METRIC_COLUMNS]]
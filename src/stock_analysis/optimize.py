@@ -0,0 +1,242 @@
+import argparse
+import math
+
+import numpy as np
+import pandas as pd
+
+from .chunked import chunk_bounds
+from .core import backtest_chunk, new_backtest_state
+from .events import BacktestIndex, backtest_events
+from .indicators import IndicatorCache, trail_percentages
+from .ledger import TradeLedger
+from .log import get_logger
+
+logger = get_logger("optimize")
+
+
+def candidate_names(trail_mode: str = "fixed") -> tuple:
+    """搜尋的參數名稱：fixed 為百分比，atr/std 為倍數 (Searched parameters per trail mode)."""
+    if trail_mode == "fixed":
+        return "entry_trail_pct", "exit_trail_pct"
+    return "entry_trail_mult", "exit_trail_mult"
+
+
+def sample_candidates(
+    n_candidates: int,
+    entry_range: tuple,
+    exit_range: tuple,
+    seed=None,
+    names: tuple = ("entry_trail_pct", "exit_trail_pct"),
+) -> list:
+    """
+    在進場/出場範圍內以對數均勻分布抽樣候選參數。
+    Samples entry/exit candidates log-uniformly within the two ranges
+    (rounded to 0.01, duplicates dropped). ``names`` are the argument names
+    the values are stored under: trail percentages or volatility multiples.
+    """
+    rng = np.random.default_rng(seed)
+    candidates = {}
+    for _ in range(n_candidates * 4):
+        if len(candidates) == n_candidates:
+            break
+        entry, exit_ = (
+            round(float(np.exp(rng.uniform(np.log(lo), np.log(hi)))), 2)
+            for lo, hi in (entry_range, exit_range)
+        )
+        candidates.setdefault((entry, exit_), dict(zip(names, (entry, exit_))))
+    return list(candidates.values())
+
+
+def evaluate_candidate(
+    stock_data: pd.DataFrame,
+    ticker: str,
+    args: argparse.Namespace,
+    candidate: dict,
+    indicators: IndicatorCache = None,
+    bar_index: BacktestIndex = None,
+    start: int = 0,
+) -> dict:
+    """
+    以候選參數回測一段 K 線；分數為各筆交易報酬率的總和。
+    Backtests one candidate on a block of bars. The score is the sum of the
+    per-trade returns, which does not depend on share count or budget.
+    With ``bar_index`` (built over the full history) the block is taken to
+    start at bar ``start`` of it and is run through the event engine.
+    """
+    candidate_args = argparse.Namespace(**{**vars(args), **candidate})
+    ledger = TradeLedger()
+    if bar_index is not None:
+        backtest_events(
+            bar_index, candidate_args, ledger, start, start + len(stock_data)
+        )
+    else:
+        trail_pcts = trail_percentages(stock_data, ticker, candidate_args, indicators)
+        backtest_chunk(
+            stock_data, ticker, candidate_args, ledger, new_backtest_state(), trail_pcts
+        )
+    profit_pct = ledger.column("profit_pct")
+    return {
+        "score": float(profit_pct.sum()),
+        "trades": len(ledger),
+        "win_rate": float((profit_pct > 0).mean()) if len(ledger) else np.nan,
+    }
+
+
+def halving_schedule(
+    n_candidates: int, n_sessions: int, eta: int, min_sessions: int = 1
+) -> list:
+    """
+    逐輪的 (候選數, 視窗交易日數)：每輪保留 1/eta，視窗放大 eta 倍，最後一輪為完整訓練期。
+    Successive-halving rungs as (candidates, window sessions): each rung keeps
+    the best 1/eta and grows the window eta-fold, ending on the full training
+    window. The first window is never shorter than min_sessions. Raises
+    ValueError for eta < 2, which would never shrink the candidates.
+    """
+    if eta < 2:
+        raise ValueError(f"eta must be at least 2, got {eta}.")
+    n_rungs = 1
+    while (
+        n_candidates // eta**n_rungs >= 1
+        and math.ceil(n_sessions / eta**n_rungs) >= min_sessions
+    ):
+        n_rungs += 1
+    return [
+        (
+            max(1, math.ceil(n_candidates / eta**rung)),
+            math.ceil(n_sessions / eta ** (n_rungs - 1 - rung)),
+        )
+        for rung in range(n_rungs)
+    ]
+
+
+def _schedule_cost(schedule: list, session_starts: np.ndarray, n_bars: int) -> int:
+    n_sessions = len(session_starts)
+    return sum(
+        count * (n_bars - session_starts[n_sessions - window])
+        for count, window in schedule
+    )
+
+
+def optimize_trails(
+    stock_data: pd.DataFrame,
+    ticker: str,
+    args: argparse.Namespace,
+    candidates: list,
+    indicators: IndicatorCache = None,
+):
+    """
+    以逐次減半 (successive halving) 搜尋追蹤停損百分比，並以最後的驗證期做前進式檢驗。
+    Successive-halving search over trail-percentage candidates with a
+    walk-forward holdout.
+
+    The last args.opt_holdout fraction of sessions is held out. All candidates
+    are scored on the most recent short window of the training sessions, the
+    best 1/eta are promoted to an eta-times longer window, and so on until
+    the survivors are scored on the full training period. If the schedule
+    would exceed args.opt_budget (in full-training-window evaluations), the
+    candidate count is reduced until it fits. The top args.opt_top candidates
+    are then scored on the unseen holdout sessions. In atr/std trail mode the
+    volatility is computed once on the full history and every window reads
+    it from ``indicators``. With args.backtest_engine 'event' one
+    BacktestIndex is built for the ticker and shared by every candidate and
+    window, including the holdout.
+
+    Returns (table of every evaluated candidate, bars simulated, bars a full
+    grid on the training and holdout windows would simulate).
+    """
+    bounds = chunk_bounds(stock_data.index, "day")
+    session_starts = bounds[:-1]
+    n_sessions = len(session_starts)
+    n_holdout = int(round(n_sessions * args.opt_holdout))
+    n_train = n_sessions - n_holdout
+    if n_train < 1:
+        logger.warning(
+            f"[{ticker}] 資料不足，無法最佳化 (Not enough sessions to optimize)."
+        )
+        return None, 0, 0
+
+    indicators = indicators if indicators is not None else IndicatorCache()
+    trail_percentages(stock_data, ticker, args, indicators)
+    bar_index = None
+    if getattr(args, "backtest_engine", "loop") == "event":
+        bar_index = BacktestIndex(stock_data, ticker, args.interval_short, indicators)
+
+    train_end = bounds[n_train]
+    train = stock_data.iloc[:train_end]
+    holdout = stock_data.iloc[train_end:]
+    train_starts = session_starts[:n_train]
+
+    grid_bars = len(candidates) * len(stock_data)
+    schedule = halving_schedule(len(candidates), n_train, args.opt_eta)
+    if args.opt_budget:
+        budget_bars = args.opt_budget * train_end
+        while (
+            len(candidates) > 1
+            and _schedule_cost(schedule, train_starts, train_end) > budget_bars
+        ):
+            candidates = candidates[: max(1, len(candidates) // args.opt_eta)]
+            schedule = halving_schedule(len(candidates), n_train, args.opt_eta)
+
+    rows = [dict(candidate, rung=-1) for candidate in candidates]
+    survivors = list(range(len(candidates)))
+    bars_evaluated = 0
+    for rung, (_, window) in enumerate(schedule):
+        window_start = train_starts[n_train - window]
+        window_data = train.iloc[window_start:]
+        for i in survivors:
+            rows[i].update(
+                evaluate_candidate(
+                    window_data,
+                    ticker,
+                    args,
+                    candidates[i],
+                    indicators,
+                    bar_index,
+                    window_start,
+                ),
+                rung=rung,
+                window_sessions=window,
+            )
+        bars_evaluated += len(survivors) * len(window_data)
+
+        if rung + 1 < len(schedule):
+            # 分數相同時以候選順序決定 (Ties keep the candidate order)
+            survivors = sorted(survivors, key=lambda i: -rows[i]["score"])[
+                : schedule[rung + 1][0]
+            ]
+            logger.debug(
+                f"[{ticker}] rung {rung}: {window} sessions, promoting {len(survivors)}"
+            )
+
+    table = pd.DataFrame(rows).sort_values(
+        ["rung", "score"], ascending=[False, False], kind="stable"
+    )
+    table = table.rename(
+        columns={
+            "score": "train_score",
+            "trades": "train_trades",
+            "win_rate": "train_win_rate",
+        }
+    )
+
+    table["holdout_score"] = np.nan
+    table["holdout_trades"] = np.nan
+    if not holdout.empty:
+        for label in table.index[: args.opt_top]:
+            result = evaluate_candidate(
+                holdout,
+                ticker,
+                args,
+                candidates[label],
+                indicators,
+                bar_index,
+                train_end,
+            )
+            table.loc[label, ["holdout_score", "holdout_trades"]] = (
+                result["score"],
+                result["trades"],
+            )
+        bars_evaluated += min(args.opt_top, len(table)) * len(holdout)
+
+    table.insert(0, "ticker", ticker)
+    return table.reset_index(drop=True), bars_evaluated, grid_bars
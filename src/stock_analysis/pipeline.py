@@ -0,0 +1,191 @@
+import queue
+import threading
+import time
+
+from .log import get_logger
+
+logger = get_logger("pipeline")
+
+# yf.download 以模組層級的字典收集結果，同時呼叫會互相覆蓋，因此一次只下載一批
+# (yf.download gathers results in module-level dicts, so concurrent calls
+# would clobber each other; only one chunk is downloaded at a time)
+_DOWNLOAD_LOCK = threading.Lock()
+
+
+class StreamingBars:
+    """
+    在背景執行緒分批下載的 K 線；取用某檔股票時只等待它所在的那一批。
+    Bars downloaded chunk by chunk on a background I/O thread while the
+    caller is already analyzing the tickers that have arrived. ``download``
+    is called with each chunk of ``tickers`` (in the given order) and returns
+    a yf.download (group_by="ticker") DataFrame.
+
+    Supports the same ``bars[ticker]``, ``bars.get(ticker)``, ``ticker in
+    bars`` and ``bars.empty`` interface as a yf.download DataFrame or a
+    BarStore; each access blocks only until the ticker's own chunk has
+    arrived. Downloaded chunks wait in a queue of at most ``queue_depth``
+    chunks, so the download runs at most that many chunks (plus the one in
+    progress) ahead of the consumer. As in a BarStore, each ticker's frame
+    keeps only its own bars (rows that are empty for the ticker are dropped),
+    and tickers without any bars are not ``in`` the source.
+
+    Arrived frames are kept until released: after ``set_uses({ticker:
+    count})`` each ``release(ticker)`` counts one use down, and the frame is
+    dropped once all uses are done, so only the tickers in flight stay
+    resident; tickers with no uses are dropped as soon as they arrive.
+    Reading a ticker after its last release raises RuntimeError. Without
+    set_uses, release() keeps every frame (e.g. for the lead-lag
+    ranking, which needs all tickers at once).
+
+    With ``after`` a chunk is only downloaded while that source is idle (it
+    has downloaded everything or waits for its consumer), so a second
+    interval does not delay the first one.
+    """
+
+    def __init__(
+        self,
+        tickers: list,
+        download,
+        chunk_size: int,
+        queue_depth: int = 2,
+        after=None,
+        name: str = "bars",
+    ):
+        self.name = name
+        self._chunks = [
+            tickers[i : i + chunk_size] for i in range(0, len(tickers), chunk_size)
+        ]
+        self._chunk_of = {
+            ticker: number
+            for number, chunk in enumerate(self._chunks)
+            for ticker in chunk
+        }
+        self._frames = {}
+        self._present = set()
+        self._uses = None
+        self._released = set()
+        self._received = 0
+        self._error = None
+        self.wait_seconds = 0.0
+        self._ready = queue.Queue(maxsize=queue_depth)
+        self._stop = threading.Event()
+        self.idle = threading.Event()
+        self._thread = threading.Thread(
+            target=self._produce,
+            args=(download, after),
+            name=f"download-{name}",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _produce(self, download, after):
+        for number, chunk in enumerate(self._chunks):
+            if after is not None:
+                while not after.idle.wait(0.1):
+                    if self._stop.is_set():
+                        return
+            if self._stop.is_set():
+                return
+            self.idle.clear()
+            try:
+                with _DOWNLOAD_LOCK:
+                    item = (number, download(chunk), None)
+            except Exception as e:
+                item = (number, None, e)
+            try:
+                self._ready.put_nowait(item)
+            except queue.Full:
+                # 佇列已滿時等待消費者 (Backpressure: wait while the queue is full)
+                self.idle.set()
+                while True:
+                    if self._stop.is_set():
+                        return
+                    try:
+                        self._ready.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+            if item[2] is not None:
+                break
+        self.idle.set()
+
+    def _wait_for(self, number: int):
+        """取出佇列中的批次直到第 number 批到達 (Drains chunks up to ``number``)."""
+        while self._received <= number:
+            if self._error is not None:
+                raise self._error
+            started = time.perf_counter()
+            got, data_batch, error = self._ready.get()
+            self.wait_seconds += time.perf_counter() - started
+            if error is not None:
+                self._error = error
+                raise error
+            for ticker in self._chunks[got]:
+                if self._uses is not None and ticker not in self._uses:
+                    continue
+                try:
+                    frame = data_batch[ticker].dropna(how="all")
+                except (KeyError, AttributeError):
+                    continue
+                if not frame.empty:
+                    self._frames[ticker] = frame
+                    self._present.add(ticker)
+            self._received = got + 1
+            logger.debug(
+                f"[{self.name}] 第 {got + 1}/{len(self._chunks)} 批已到達 "
+                f"(Chunk {got + 1}/{len(self._chunks)} arrived): {self._chunks[got]}"
+            )
+
+    @property
+    def empty(self) -> bool:
+        if self._chunks:
+            self._wait_for(len(self._chunks) - 1)
+        return not self._present
+
+    def __contains__(self, ticker) -> bool:
+        number = self._chunk_of.get(ticker)
+        if number is None:
+            return False
+        if ticker in self._released:
+            raise RuntimeError(f"The bars of {ticker} were already released.")
+        self._wait_for(number)
+        return ticker in self._present
+
+    def __getitem__(self, ticker: str):
+        if ticker not in self:
+            raise KeyError(ticker)
+        return self._frames[ticker]
+
+    def get(self, ticker: str, default=None):
+        return self[ticker] if ticker in self else default
+
+    def set_uses(self, uses: dict):
+        """設定每檔股票會被使用 (並釋放) 的次數 (How often each ticker is used)."""
+        self._uses = {ticker: count for ticker, count in uses.items() if count > 0}
+        for ticker in list(self._frames):
+            if ticker not in self._uses:
+                del self._frames[ticker]
+
+    def release(self, ticker: str):
+        """
+        一次使用結束；最後一次使用後丟棄該股票的 K 線。
+        Marks one use of ``ticker`` as done and drops its bars after the last
+        one. A no-op without set_uses.
+        """
+        if self._uses is None or ticker not in self._uses:
+            return
+        self._uses[ticker] -= 1
+        if self._uses[ticker] <= 0:
+            del self._uses[ticker]
+            self._frames.pop(ticker, None)
+            self._released.add(ticker)
+
+    def close(self):
+        """停止背景下載 (Stops the background download)."""
+        self._stop.set()
+        logger.info(
+            f"[{self.name}] 已取得 {self._received}/{len(self._chunks)} 批，"
+            f"等待下載共 {self.wait_seconds:.1f} 秒 "
+            f"(Received {self._received}/{len(self._chunks)} chunks, "
+            f"waited {self.wait_seconds:.1f}s for downloads)"
+        )
@@ -3,6 +3,123 @@ import seaborn as sns
 import pandas as pd
 import numpy as np
 
+from .log import get_logger
+
+logger = get_logger("plotting")
+
+# 跨股票比較圖所需的資料：每個持有期前幾檔股票的報酬欄位
+# (What the comparison charts need: the return column of the first few
+# tickers of each holding period)
+COMPARISON_COLUMNS = ["return"]
+COMPARISON_MAX_TICKERS = 5
+
+
+class ReturnEnvelope:
+    """
+    逐區塊累積報酬序列的最小/最大值外框，以固定點數繪圖。
+    Streaming min/max envelope of a return series for plot_results when the
+    full series is not kept (``--chunk-by``). Consecutive returns are grouped
+    into buckets and each bucket keeps its minimum and maximum, so spikes
+    survive while the envelope holds at most about ``max_points`` rows.
+    Whenever there would be more buckets, neighbouring buckets are merged
+    and the bucket size doubles; the last, partial bucket is carried
+    between blocks.
+    """
+
+    def __init__(self, max_points: int = 4000):
+        self.max_buckets = max(1, max_points // 2)
+        self.bucket = 1
+        self._tz = None
+        # 每個桶的最小/最大值及其時間 (Each bucket's min/max and their times)
+        self._low = (np.empty(0, dtype=np.int64), np.empty(0))
+        self._high = (np.empty(0, dtype=np.int64), np.empty(0))
+        self._pending = (np.empty(0, dtype=np.int64), np.empty(0))
+
+    def add(self, frame: pd.DataFrame):
+        """加入一個區塊的 'return' 欄位 (Adds one block's 'return' column)."""
+        if frame.empty:
+            return
+        self._tz = frame.index.tz
+        times = np.concatenate([self._pending[0], frame.index.as_unit("ns").asi8])
+        values = np.concatenate(
+            [self._pending[1], frame["return"].to_numpy(dtype=float)]
+        )
+        full = len(values) // self.bucket * self.bucket
+        self._pending = (times[full:], values[full:])
+        if full:
+            self._append(
+                times[:full].reshape(-1, self.bucket),
+                values[:full].reshape(-1, self.bucket),
+            )
+        while len(self._low[1]) > self.max_buckets:
+            self._merge()
+
+    def _append(self, times: np.ndarray, values: np.ndarray):
+        rows = np.arange(len(values))
+        lows = values.argmin(axis=1)
+        highs = values.argmax(axis=1)
+        self._low = tuple(
+            np.concatenate([old, new[rows, lows]])
+            for old, new in zip(self._low, (times, values))
+        )
+        self._high = tuple(
+            np.concatenate([old, new[rows, highs]])
+            for old, new in zip(self._high, (times, values))
+        )
+
+    def _merge(self):
+        """兩兩合併相鄰的桶 (Merges neighbouring buckets pairwise)."""
+        pairs = len(self._low[1]) // 2 * 2
+
+        def combine(bound, pick):
+            times, values = bound
+            first, second = values[:pairs:2], values[1:pairs:2]
+            take_second = pick(second, first)
+            return (
+                np.concatenate(
+                    [
+                        np.where(take_second, times[1:pairs:2], times[:pairs:2]),
+                        times[pairs:],
+                    ]
+                ),
+                np.concatenate([np.where(take_second, second, first), values[pairs:]]),
+            )
+
+        self._low = combine(self._low, np.less)
+        self._high = combine(self._high, np.greater)
+        self.bucket *= 2
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        依時間排列的外框點 (單一 'return' 欄位)，可直接交給 plot_results。
+        The envelope points in time order as a 'return' frame for plot_results.
+        """
+        low_times, low_values = self._low
+        high_times, high_values = self._high
+        pending_times, pending_values = self._pending
+        if len(pending_values):
+            low_times = np.append(low_times, pending_times[pending_values.argmin()])
+            low_values = np.append(low_values, pending_values.min())
+            high_times = np.append(high_times, pending_times[pending_values.argmax()])
+            high_values = np.append(high_values, pending_values.max())
+
+        # 桶內依時間排列；最小與最大為同一根時只保留一點
+        # (Time order within a bucket; one point when the min and max coincide)
+        low_first = low_times <= high_times
+        first_times = np.where(low_first, low_times, high_times)
+        first_values = np.where(low_first, low_values, high_values)
+        second_times = np.where(low_first, high_times, low_times)
+        second_values = np.where(low_first, high_values, low_values)
+        distinct = low_times != high_times
+        times = np.column_stack([first_times, second_times]).ravel()
+        values = np.column_stack([first_values, second_values]).ravel()
+        keep = np.column_stack([np.ones_like(distinct), distinct]).ravel()
+
+        index = pd.DatetimeIndex(times[keep].view("M8[ns]"))
+        if self._tz is not None:
+            index = index.tz_localize("UTC").tz_convert(self._tz)
+        return pd.DataFrame({"return": values[keep]}, index=index)
+
 
 def plot_results(
     results: dict,
@@ -71,7 +188,7 @@ def plot_results(
         f"{output_folder}/{results['ticker']}_{holding_hours}hr{filename_suffix}.png"
     )
     plt.savefig(plot_filename)
-    print(f"Plot saved as {plot_filename}")
+    logger.info(f"Plot saved as {plot_filename}")
     plt.close()
     # plt.show()
 
@@ -173,5 +290,5 @@ def plot_comparison_chart(
     safe_tickers_str = "_".join(tickers_to_plot)
     plot_filename = f"{output_folder}/COMP_{safe_tickers_str}_{holding_hours}hr{filename_suffix}.png"
     plt.savefig(plot_filename)
-    print(f"Comparison chart saved as {plot_filename}")
+    logger.info(f"Comparison chart saved as {plot_filename}")
     plt.close()
@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+
+from .sessions import (
+    INTERVAL_UNIT_MINUTES,
+    NS_PER_MINUTE,
+    REGULAR_OPEN_MINUTE,
+    parse_interval_minutes,
+    regular_hours_mask,
+)
+
+# 重新取樣時各欄位的彙總方式 (How each column is aggregated when resampling)
+OHLCV_AGGREGATION = {
+    "Open": "first",
+    "High": "max",
+    "Low": "min",
+    "Close": "last",
+    "Adj Close": "last",
+    "Volume": "sum",
+}
+
+
+def order_intervals(intervals: list) -> list:
+    """
+    去除重複並由細到粗排序 K 線間隔；較粗的間隔必須是最細間隔的整數倍。
+    Deduplicates and sorts intervals from finest to coarsest. Every interval
+    must be a whole multiple of the finest one and at most one day, since
+    coarser bars are built from the finest download.
+    """
+    minutes = {}
+    for interval in intervals:
+        minutes.setdefault(interval, parse_interval_minutes(interval))
+    ordered = sorted(minutes, key=minutes.get)
+    finest = minutes[ordered[0]]
+    for interval in ordered:
+        if minutes[interval] > INTERVAL_UNIT_MINUTES["d"]:
+            raise ValueError(f"Interval '{interval}' is longer than one day.")
+        if minutes[interval] % finest:
+            raise ValueError(
+                f"Interval '{interval}' is not a multiple of the finest interval '{ordered[0]}'."
+            )
+    if len({minutes[i] for i in ordered}) < len(ordered):
+        raise ValueError(f"Intervals {ordered} contain the same bar size twice.")
+    return ordered
+
+
+def resample_bars(stock_data: pd.DataFrame, interval: str) -> pd.DataFrame:
+    """
+    將較細的 K 線彙總為 interval 的 K 線，分組對齊每個交易日的 09:30，不會跨日。
+    Aggregates finer OHLCV bars into ``interval`` bars. Bins are aligned to
+    09:30 local time of each session (so 30m bars start at 09:30, 10:00, ...
+    and 1h bars at 09:30, 10:30, ..., as yfinance labels them) and never span
+    two sessions; daily bars are labelled with the local midnight. Open is
+    the first and Close the last available value, High/Low the extremes and
+    Volume the sum, skipping missing bars; bins without any bar are dropped.
+    """
+    if stock_data is None or stock_data.empty:
+        return stock_data
+
+    minutes = parse_interval_minutes(interval)
+    index = stock_data.index
+    day = index.normalize()
+    if minutes >= INTERVAL_UNIT_MINUTES["d"]:
+        labels = day
+    else:
+        elapsed = (
+            index.as_unit("ns").asi8
+            - day.as_unit("ns").asi8
+            - REGULAR_OPEN_MINUTE * NS_PER_MINUTE
+        )
+        bins = np.floor_divide(elapsed, minutes * NS_PER_MINUTE)
+        labels = day + pd.to_timedelta(REGULAR_OPEN_MINUTE + bins * minutes, unit="min")
+
+    aggregation = {
+        column: how
+        for column, how in OHLCV_AGGREGATION.items()
+        if column in stock_data.columns
+    }
+    grouped = stock_data.groupby(labels, sort=False)
+    resampled = pd.DataFrame(
+        {
+            column: (
+                grouped[column].sum(min_count=1)
+                if how == "sum"
+                else grouped[column].agg(how)
+            )
+            for column, how in aggregation.items()
+        }
+    )
+    resampled.index.name = index.name
+    return resampled.dropna(how="all")
+
+
+class ResampledBars:
+    """
+    由最細間隔的 K 線即時產生較粗間隔的 K 線，只在取用時彙總，不另外保留。
+    Coarser-interval view of a finest-interval bar source (a yf.download
+    DataFrame, a BarStore or a dict of frames). Supports the same
+    ``source[ticker]``, ``source.get(ticker)``, ``ticker in source`` and
+    ``source.empty`` interface; each access resamples that ticker's bars, so
+    only the finest bars are ever held or downloaded.
+
+    With ``regular_hours`` the extended-hours bars are dropped before
+    resampling, so no coarse bar mixes the two.
+    """
+
+    def __init__(self, source, interval: str, base_interval: str, regular_hours=False):
+        self.source = source
+        self.interval = interval
+        self.base_interval = base_interval
+        self.regular_hours = regular_hours
+
+    @property
+    def empty(self) -> bool:
+        return (
+            len(self.source) == 0
+            if isinstance(self.source, dict)
+            else self.source.empty
+        )
+
+    def __contains__(self, ticker) -> bool:
+        return ticker in self.source
+
+    def __getitem__(self, ticker: str) -> pd.DataFrame:
+        stock_data = self.source[ticker].dropna(how="all")
+        if self.regular_hours and not stock_data.empty:
+            stock_data = stock_data[
+                regular_hours_mask(stock_data.index, self.base_interval)
+            ]
+        return resample_bars(stock_data, self.interval)
+
+    def get(self, ticker: str, default=None):
+        return self[ticker] if ticker in self else default
+
+    def release(self, ticker: str):
+        """轉交給來源 (Forwards to the source, e.g. a StreamingBars)."""
+        if hasattr(self.source, "release"):
+            self.source.release(ticker)
@@ -0,0 +1,182 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .log import get_logger
+
+logger = get_logger("retain")
+
+
+class _SpilledFrame:
+    """
+    已寫到磁碟的 DataFrame：每欄一個 .npy 檔，讀取時以記憶體映射載入。
+    A frame written to disk as one .npy file per column plus the index,
+    reloaded memory-mapped on demand.
+    """
+
+    def __init__(self, directory: str, frame: pd.DataFrame):
+        self.directory = directory
+        self.columns = list(frame.columns)
+        self.index_name = frame.index.name
+        index = frame.index
+        if isinstance(index, pd.DatetimeIndex):
+            self.tz = index.tz
+            index_values = index.as_unit("ns").asi8
+        else:
+            self.tz = None
+            index_values = np.asarray(index)
+        self.is_datetime = isinstance(index, pd.DatetimeIndex)
+        os.makedirs(directory)
+        np.save(os.path.join(directory, "index.npy"), index_values)
+        for i, column in enumerate(self.columns):
+            np.save(
+                os.path.join(directory, f"column-{i}.npy"), frame[column].to_numpy()
+            )
+
+    def load(self) -> pd.DataFrame:
+        index_values = np.load(os.path.join(self.directory, "index.npy"), mmap_mode="r")
+        if self.is_datetime:
+            index = pd.DatetimeIndex(index_values.view("M8[ns]"), tz="UTC")
+            index = (
+                index.tz_convert(self.tz)
+                if self.tz is not None
+                else index.tz_localize(None)
+            )
+        else:
+            index = pd.Index(index_values)
+        index.name = self.index_name
+        return pd.DataFrame(
+            {
+                column: np.load(
+                    os.path.join(self.directory, f"column-{i}.npy"), mmap_mode="r"
+                )
+                for i, column in enumerate(self.columns)
+            },
+            index=index,
+            copy=False,
+        )
+
+
+class _HoldingPeriodView:
+    """一個持有期保留的股票資料 (The frames retained for one holding period)."""
+
+    def __init__(self, entries: dict):
+        self._entries = entries
+
+    def __contains__(self, ticker) -> bool:
+        return ticker in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __getitem__(self, ticker: str) -> pd.DataFrame:
+        entry = self._entries[ticker]
+        return entry.load() if isinstance(entry, _SpilledFrame) else entry
+
+    def get(self, ticker: str, default=None):
+        return self[ticker] if ticker in self else default
+
+
+class ResultStore:
+    """
+    只保留下游宣告需要的分析結果，並限制記憶體用量。
+    Retains only what downstream consumers declared they need from each
+    ticker's per-holding-period analysis frames: the ``columns`` of at most
+    ``max_tickers`` tickers per holding period (the first ones added, i.e.
+    in group order). Everything else is dropped as soon as it is offered,
+    so memory does not grow with the group size.
+
+    Once the retained frames exceed ``memory_budget_mb``, further frames are
+    spilled to a temporary directory (one .npy file per column) and reloaded
+    memory-mapped when read. ``close()`` (or leaving the ``with`` block)
+    deletes the spilled files.
+
+    Reading mirrors the previous {holding_hours: {ticker: frame}} dict:
+    ``store.items()`` yields (holding_hours, view) pairs whose views support
+    ``ticker in view``, ``view[ticker]`` and ``view.get(ticker)``.
+    """
+
+    def __init__(
+        self, columns: list, max_tickers: int = None, memory_budget_mb: float = None
+    ):
+        self.columns = list(columns)
+        self.max_tickers = max_tickers
+        self.memory_budget = (
+            None if memory_budget_mb is None else memory_budget_mb * 2**20
+        )
+        self.memory_bytes = 0
+        self.spilled = 0
+        self._entries = {}
+        self._spill_dir = None
+
+    def wants(self, holding_hours) -> bool:
+        """此持有期是否還需要更多股票 (Whether the holding period needs more tickers)."""
+        return (
+            self.max_tickers is None
+            or len(self._entries.get(holding_hours, {})) < self.max_tickers
+        )
+
+    def add(self, holding_hours, ticker: str, frame: pd.DataFrame) -> bool:
+        """
+        保留 frame 中需要的欄位 (複製)，回傳是否保留。
+        Retains a copy of the declared columns of ``frame`` if the holding
+        period still needs tickers; returns whether it was retained.
+        """
+        entries = self._entries.setdefault(holding_hours, {})
+        if ticker not in entries and not self.wants(holding_hours):
+            return False
+
+        previous = entries.get(ticker)
+        if isinstance(previous, pd.DataFrame):
+            self.memory_bytes -= int(previous.memory_usage(index=True).sum())
+
+        retained = frame[[c for c in self.columns if c in frame.columns]].copy()
+        size = int(retained.memory_usage(index=True).sum())
+        if (
+            self.memory_budget is not None
+            and self.memory_bytes + size > self.memory_budget
+        ):
+            if self._spill_dir is None:
+                self._spill_dir = tempfile.mkdtemp(prefix="stock_dynamic_retain_")
+                logger.info(
+                    f"保留結果超過 {self.memory_budget / 2**20:g} MB，改寫入暫存檔 "
+                    f"(Retained results exceed {self.memory_budget / 2**20:g} MB, "
+                    f"spilling to {self._spill_dir})"
+                )
+            entries[ticker] = _SpilledFrame(
+                os.path.join(self._spill_dir, str(self.spilled)), retained
+            )
+            self.spilled += 1
+        else:
+            entries[ticker] = retained
+            self.memory_bytes += size
+        return True
+
+    def items(self):
+        for holding_hours, entries in self._entries.items():
+            yield holding_hours, _HoldingPeriodView(entries)
+
+    def __getitem__(self, holding_hours) -> _HoldingPeriodView:
+        return _HoldingPeriodView(self._entries[holding_hours])
+
+    def __contains__(self, holding_hours) -> bool:
+        return holding_hours in self._entries
+
+    def close(self):
+        self._entries = {}
+        self.memory_bytes = 0
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,144 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# 一般交易時段 (Regular trading hours, America/New_York local minutes of day)
+REGULAR_OPEN_MINUTE = 9 * 60 + 30
+REGULAR_CLOSE_MINUTE = 16 * 60
+
+INTERVAL_UNIT_MINUTES = {"m": 1, "h": 60, "d": 24 * 60, "wk": 7 * 24 * 60}
+
+HORIZON_MODES = ["bars", "wall", "session", "intraday"]
+
+NS_PER_MINUTE = 60 * 1_000_000_000
+
+
+def parse_interval_minutes(interval: str) -> int:
+    """
+    將 yfinance 的 K 線間隔字串轉換為分鐘數 (e.g. '5m' -> 5, '1h' -> 60, '1d' -> 1440)。
+    Converts a yfinance interval string into minutes.
+    """
+    match = re.fullmatch(r"(\d+)(m|h|d|wk)", str(interval).strip())
+    if not match:
+        raise ValueError(f"Unsupported interval '{interval}'.")
+    return int(match.group(1)) * INTERVAL_UNIT_MINUTES[match.group(2)]
+
+
+def regular_hours_mask(index: pd.DatetimeIndex, interval: str) -> np.ndarray:
+    """
+    回傳位於一般交易時段 (09:30-16:00) 內的 K 棒遮罩；日線以上的間隔一律視為一般時段。
+    Boolean mask of bars inside regular trading hours. Daily and longer bars
+    are always considered regular.
+    """
+    if parse_interval_minutes(interval) >= INTERVAL_UNIT_MINUTES["d"]:
+        return np.ones(len(index), dtype=bool)
+    minute_of_day = index.hour * 60 + index.minute
+    return np.asarray(
+        (minute_of_day >= REGULAR_OPEN_MINUTE) & (minute_of_day < REGULAR_CLOSE_MINUTE)
+    )
+
+
+def build_session_index(index: pd.DatetimeIndex, interval: str) -> pd.DataFrame:
+    """
+    由已轉換時區的 K 線索引建立交易時段索引，每檔股票只需建立一次。
+    Builds a trading-session index from a tz-converted bar index, once per ticker.
+
+    Columns (aligned with ``index``):
+      - ts: integer timestamp (ns since epoch, UTC)
+      - session_id: trading day number (local calendar date)
+      - minute_of_session: minutes since the session's first bar
+      - session_open / session_close: positions of the session's first/last bar
+      - clock: trading-time clock in ns; overnight/weekend gaps are removed, so
+        the first bar of a session follows the previous session's last bar by
+        exactly one interval
+      - is_regular: bar lies within regular trading hours
+    """
+    ts = index.as_unit("ns").asi8.astype(np.int64)
+    interval_ns = parse_interval_minutes(interval) * NS_PER_MINUTE
+
+    session_id, _ = pd.factorize(index.date)
+    counts = np.bincount(session_id)
+    first_pos = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    last_pos = first_pos + counts - 1
+
+    session_open = first_pos[session_id]
+    session_close = last_pos[session_id]
+    elapsed = ts - ts[session_open]
+
+    session_length = ts[last_pos] - ts[first_pos] + interval_ns
+    session_start_clock = np.concatenate([[0], np.cumsum(session_length)[:-1]])
+
+    return pd.DataFrame(
+        {
+            "ts": ts,
+            "session_id": session_id,
+            "minute_of_session": elapsed // NS_PER_MINUTE,
+            "session_open": session_open,
+            "session_close": session_close,
+            "clock": session_start_clock[session_id] + elapsed,
+            "is_regular": regular_hours_mask(index, interval),
+        },
+        index=index,
+    )
+
+
+def slice_session_index(
+    session_index: pd.DataFrame, index: pd.DatetimeIndex
+) -> pd.DataFrame:
+    """
+    取出與 index (完整索引的尾段) 對齊的時段索引，並重新定位開收盤位置。
+    Returns the part of a session index aligned with ``index``, which must be a
+    tail of the index the session index was built from; open/close positions
+    are rebased to the slice.
+    """
+    start = len(session_index) - len(index)
+    if start == 0:
+        return session_index
+    sliced = session_index.iloc[start:].copy()
+    sliced["session_open"] = np.maximum(sliced["session_open"] - start, 0)
+    sliced["session_close"] = sliced["session_close"] - start
+    return sliced
+
+
+def resolve_horizon(
+    session_index: pd.DataFrame,
+    horizon_minutes: float,
+    mode: str,
+    time_anchor: str = "start",
+) -> np.ndarray:
+    """
+    以 searchsorted 解析每根 K 棒的持有期對應位置，無對應者回傳 -1。
+    Resolves, for every bar, the position of the bar at the other end of the
+    holding period using searchsorted over integer timestamps; -1 marks bars
+    without a valid counterpart.
+
+    With time_anchor 'start' the result is the sell bar for a buy at each bar
+    (first bar at or after t + horizon); with 'end' it is the buy bar for a
+    sell at each bar (last bar at or before t - horizon).
+
+    Modes:
+      - wall: wall-clock time; holds may span overnight/weekend gaps
+      - session: trading time; gaps between sessions are not counted
+      - intraday: trading time, and both ends must be in the same session
+    """
+    if mode not in ("wall", "session", "intraday"):
+        raise ValueError(f"Unsupported horizon mode '{mode}'.")
+
+    key = "ts" if mode == "wall" else "clock"
+    times = session_index[key].to_numpy()
+    horizon_ns = int(round(horizon_minutes * NS_PER_MINUTE))
+    n = len(times)
+
+    if time_anchor == "end":
+        partner = np.searchsorted(times, times - horizon_ns, side="right") - 1
+        valid = partner >= 0
+        if mode == "intraday":
+            valid &= partner >= session_index["session_open"].to_numpy()
+    else:
+        partner = np.searchsorted(times, times + horizon_ns, side="left")
+        valid = partner < n
+        if mode == "intraday":
+            valid &= partner <= session_index["session_close"].to_numpy()
+
+    return np.where(valid, partner, -1)
@@ -0,0 +1,153 @@
+import json
+import os
+import uuid
+
+import pandas as pd
+
+PLAN_NAME = "plan.json"
+SHARD_MODES = ["analysis", "backtest"]
+
+
+def parse_shard_spec(spec: str) -> tuple:
+    """
+    解析 'i/N' 形式的分片參數 (0 <= i < N)。
+    Parses a shard spec of the form 'i/N' with 0 <= i < N.
+    """
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard spec '{spec}', expected 'i/N'.")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard spec '{spec}', expected 0 <= i < N.")
+    return index, count
+
+
+def partition_tickers(tickers: list, n_shards: int, weights: dict = None) -> list:
+    """
+    以預期 K 棒數為權重，將股票確定性地分配到 n_shards 個分片 (最長處理時間優先)。
+    Deterministically assigns tickers to n_shards shards, balancing the expected
+    bar count per shard (longest-processing-time first, ties broken by name).
+    """
+    weights = weights or {}
+    unique = list(dict.fromkeys(tickers))
+    ordered = sorted(unique, key=lambda t: (-weights.get(t, 1), t))
+
+    loads = [0] * n_shards
+    shards = [[] for _ in range(n_shards)]
+    for ticker in ordered:
+        target = min(range(n_shards), key=lambda i: (loads[i], i))
+        shards[target].append(ticker)
+        loads[target] += weights.get(ticker, 1)
+
+    # 各分片內維持原本的設定檔順序 (Keep config order inside each shard)
+    position = {ticker: i for i, ticker in enumerate(unique)}
+    return [sorted(shard, key=position.__getitem__) for shard in shards]
+
+
+def expected_bar_counts(store, tickers: list) -> dict:
+    """
+    由 K 線檔取得每檔股票的 K 棒數作為分片權重；缺少資料者以中位數估計。
+    Expected bar count per ticker from a bar store, used as shard weights;
+    tickers missing from the store get the median count.
+    """
+    counts = {t: store.bar_count(t) for t in tickers if t in store}
+    if not counts:
+        return {}
+    median = float(pd.Series(list(counts.values())).median())
+    return {t: counts.get(t, median) for t in tickers}
+
+
+def load_or_create_plan(
+    shard_dir: str,
+    ticker_list_array: list,
+    n_shards: int,
+    run_config: dict,
+    weights: dict = None,
+) -> dict:
+    """
+    讀取共用資料夾中的分片計畫；若不存在則建立。第一個啟動的分片建立計畫，其餘分片與續跑皆沿用。
+    Loads the shard plan from the shared directory, creating it if absent. The
+    first shard to start writes the plan and every other shard (and any resumed
+    run) reuses it, so all workers agree on the partition even if their
+    weights would differ. Raises ValueError if an existing plan was made for a
+    different universe, shard count or run configuration.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    plan_path = os.path.join(shard_dir, PLAN_NAME)
+
+    if not os.path.exists(plan_path):
+        tickers = [t for group in ticker_list_array for t in group]
+        assignments = partition_tickers(tickers, n_shards, weights)
+        plan = {
+            "n_shards": n_shards,
+            "groups": [list(group) for group in ticker_list_array],
+            "shards": assignments,
+            "config": run_config,
+        }
+        tmp_path = os.path.join(shard_dir, f"{PLAN_NAME}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(plan, f, indent=2)
+        try:
+            # link 在目標已存在時失敗，確保只有一個計畫 (link fails if the plan exists)
+            os.link(tmp_path, plan_path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+
+    plan = load_plan(shard_dir, ticker_list_array, run_config)
+    if plan["n_shards"] != n_shards:
+        raise ValueError(
+            f"Shard plan in {shard_dir} was made for {plan['n_shards']} shards, not {n_shards}."
+        )
+    return plan
+
+
+def load_plan(shard_dir: str, ticker_list_array: list, run_config: dict) -> dict:
+    """
+    讀取既有的分片計畫，並確認它屬於同一個股票池與執行設定 (例如合併前)。
+    Loads an existing shard plan (e.g. before merging). Raises ValueError if
+    there is none, or if it was made for a different universe or run
+    configuration, so shards of different runs are never mixed.
+    """
+    plan_path = os.path.join(shard_dir, PLAN_NAME)
+    if not os.path.exists(plan_path):
+        raise ValueError(f"No shard plan in {shard_dir}.")
+    with open(plan_path, encoding="utf-8") as f:
+        plan = json.load(f)
+
+    if plan["groups"] != [list(group) for group in ticker_list_array]:
+        raise ValueError(
+            f"Shard plan in {shard_dir} was made for a different ticker universe."
+        )
+    if plan["config"] != run_config:
+        raise ValueError(
+            f"Shard plan in {shard_dir} was made for a different run configuration."
+        )
+    return plan
+
+
+def checkpoint_path(shard_dir: str, mode: str, ticker: str) -> str:
+    return os.path.join(shard_dir, mode, f"{ticker}.pkl")
+
+
+def has_checkpoint(shard_dir: str, mode: str, ticker: str) -> bool:
+    return os.path.exists(checkpoint_path(shard_dir, mode, ticker))
+
+
+def save_checkpoint(shard_dir: str, mode: str, ticker: str, payload: dict):
+    """
+    原子地寫入單檔股票的部分結果，完成的股票在續跑時會被跳過。
+    Atomically writes one ticker's partial results; tickers with a checkpoint
+    are skipped when a failed shard is resumed.
+    """
+    path = checkpoint_path(shard_dir, mode, ticker)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    pd.to_pickle(payload, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(shard_dir: str, mode: str, ticker: str):
+    path = checkpoint_path(shard_dir, mode, ticker)
+    return pd.read_pickle(path) if os.path.exists(path) else None
@@ -0,0 +1,163 @@
+import math
+
+import numpy as np
+
+# 總結報告列出的報酬率分位數 (Return quantiles listed in the summary report)
+SUMMARY_QUANTILES = (0.01, 0.05, 0.5, 0.95, 0.99)
+
+# 相鄰層級容量的縮減比例 (Capacity ratio between adjacent levels)
+_CAPACITY_RATIO = 2 / 3
+_MIN_CAPACITY = 2
+
+
+class QuantileSketch:
+    """
+    可合併的 KLL 分位數摘要；記憶體固定，不需保留完整的報酬率序列。
+    Mergeable KLL quantile sketch with bounded memory.
+
+    Level h holds items of weight 2**h. When the sketch outgrows its total
+    capacity, the lowest level over its own capacity is sorted and every
+    other item is promoted to the next level, so the sketch keeps at most
+    about 3 * k floats (under 5 KB at the default k=200) however many values
+    it has seen. The rank error shrinks roughly as 1/k (about 0.3% of the
+    count at k=200) and the sketch is exact until it compacts. Compactions
+    alternate between keeping the odd and the even items instead of picking
+    at random, so the same input always produces the same sketch.
+    """
+
+    def __init__(self, k: int = 200):
+        if k < _MIN_CAPACITY:
+            raise ValueError(
+                f"Sketch size k must be at least {_MIN_CAPACITY}, got {k}."
+            )
+        self.k = int(k)
+        self.n = 0
+        self._levels = [np.empty(0)]
+        self._parity = [0]
+
+    def __len__(self) -> int:
+        return self.n
+
+    @property
+    def nbytes(self) -> int:
+        return sum(level.nbytes for level in self._levels)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self._levels) - 1 - level
+        return max(_MIN_CAPACITY, math.ceil(self.k * _CAPACITY_RATIO**depth))
+
+    def _compress(self):
+        # 只在總量超出總容量時壓縮最低的超量層級 (lazy compaction keeps the
+        # levels fuller, and so more accurate, for the same memory)
+        while sum(map(len, self._levels)) > sum(
+            self._capacity(level) for level in range(len(self._levels))
+        ):
+            level = next(
+                h
+                for h, items in enumerate(self._levels)
+                if len(items) > self._capacity(h)
+            )
+            if level + 1 == len(self._levels):
+                self._levels.append(np.empty(0))
+                self._parity.append(0)
+
+            items = np.sort(self._levels[level])
+            # 奇數個時保留最大的一個 (With an odd count the largest item stays)
+            keep = items[len(items) - len(items) % 2 :]
+            promoted = items[self._parity[level] : len(items) - len(keep) : 2]
+            self._parity[level] ^= 1
+            self._levels[level] = keep
+            self._levels[level + 1] = np.concatenate(
+                [self._levels[level + 1], promoted]
+            )
+
+    def update(self, values) -> "QuantileSketch":
+        """加入一批數值，NaN 會被忽略 (Adds a batch of values; NaNs are ignored)."""
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if len(values):
+            self._levels[0] = np.concatenate([self._levels[0], values])
+            self.n += len(values)
+            self._compress()
+        return self
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """
+        合併另一個摘要 (例如另一個分片或日期區間)，k 取兩者中較小者。
+        Merges another sketch into this one, e.g. from another shard or date
+        range. The merged sketch uses the smaller k of the two.
+        """
+        self.k = min(self.k, other.k)
+        for level, items in enumerate(other._levels):
+            if level == len(self._levels):
+                self._levels.append(np.empty(0))
+                self._parity.append(0)
+            self._levels[level] = np.concatenate([self._levels[level], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def scaled(self, factor: float) -> "QuantileSketch":
+        """
+        回傳所有數值乘上正數 factor 的摘要 (Sketch of the values times a positive factor).
+        """
+        if factor <= 0:
+            raise ValueError(f"Scale factor must be positive, got {factor}.")
+        sketch = QuantileSketch(self.k)
+        sketch.n = self.n
+        sketch._levels = [items * factor for items in self._levels]
+        sketch._parity = list(self._parity)
+        return sketch
+
+    def quantiles(self, qs) -> tuple:
+        """
+        各分位數 q 的估計值：累積權重首次達到 q * n 的數值；空摘要回傳 NaN。
+        Estimates for each q: the smallest kept value whose cumulative weight
+        reaches q * n (no interpolation). An empty sketch gives NaN.
+        """
+        if not self.n:
+            return tuple(np.nan for _ in qs)
+        items = np.concatenate(self._levels)
+        weights = np.concatenate(
+            [np.full(len(level), 2.0**h) for h, level in enumerate(self._levels)]
+        )
+        order = np.argsort(items, kind="stable")
+        items = items[order]
+        cumulative = np.cumsum(weights[order])
+        positions = np.searchsorted(
+            cumulative, np.asarray(qs, dtype=float) * cumulative[-1], side="left"
+        )
+        return tuple(float(items[min(p, len(items) - 1)]) for p in positions)
+
+    def quantile(self, q: float) -> float:
+        return self.quantiles([q])[0]
+
+    def to_dict(self) -> dict:
+        """可序列化為 JSON 的表示 (JSON-serializable form)."""
+        return {
+            "k": self.k,
+            "n": self.n,
+            "levels": [items.tolist() for items in self._levels],
+            "parity": list(self._parity),
+        }
+
+    @classmethod
+    def from_dict(cls, payload: dict) -> "QuantileSketch":
+        sketch = cls(payload["k"])
+        sketch.n = int(payload["n"])
+        sketch._levels = [np.asarray(items, dtype=float) for items in payload["levels"]]
+        sketch._parity = list(payload["parity"])
+        return sketch
+
+
+def merge_sketches(sketches) -> QuantileSketch:
+    """
+    合併多個摘要為新的摘要，不修改輸入 (Merges sketches into a new one, leaving the inputs unchanged).
+    """
+    sketches = [sketch for sketch in sketches if sketch is not None]
+    if not sketches:
+        return None
+    merged = QuantileSketch(min(sketch.k for sketch in sketches))
+    for sketch in sketches:
+        merged.merge(sketch)
+    return merged
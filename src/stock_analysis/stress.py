@@ -0,0 +1,237 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .log import get_logger
+
+logger = get_logger("stress")
+
+STRESS_PERCENTILES = [1, 5, 25, 50, 75, 95, 99]
+
+
+def build_session_blocks(stock_data: pd.DataFrame) -> dict:
+    """
+    將歷史 K 線依交易日切成區塊，作為合成路徑的重抽樣單位。
+    Splits historical bars into per-session blocks used as resampling units.
+
+    Each bar is stored relative to the previous close (log return, including
+    the overnight gap on a session's first bar) plus High/Low relative to its
+    own close, padded to the longest session so that sessions can be gathered
+    as (paths, bars) arrays.
+    """
+    close = stock_data["Close"].to_numpy(dtype=float)
+    high = stock_data["High"].to_numpy(dtype=float)
+    low = stock_data["Low"].to_numpy(dtype=float)
+    open_ = stock_data["Open"].to_numpy(dtype=float)
+
+    session_codes, _ = pd.factorize(stock_data.index.date)
+    counts = np.bincount(session_codes)
+    session_starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    bar_in_session = np.arange(len(close)) - session_starts[session_codes]
+
+    prev_close = np.concatenate([[open_[0]], close[:-1]])
+    shape = (len(counts), counts.max())
+
+    log_returns = np.zeros(shape)
+    high_ratio = np.ones(shape)
+    low_ratio = np.ones(shape)
+    valid = np.zeros(shape, dtype=bool)
+
+    log_returns[session_codes, bar_in_session] = np.log(close / prev_close)
+    high_ratio[session_codes, bar_in_session] = high / close
+    low_ratio[session_codes, bar_in_session] = low / close
+    valid[session_codes, bar_in_session] = True
+
+    return {
+        "log_returns": log_returns,
+        "high_ratio": high_ratio,
+        "low_ratio": low_ratio,
+        "valid": valid,
+        "start_close": close[-1],
+    }
+
+
+def simulate_trailing_stop_paths(
+    blocks: dict,
+    n_paths: int,
+    n_sessions: int,
+    entry_trail_pct: float,
+    exit_trail_pct: float,
+    daily_trades: bool,
+    shares: int,
+    budget,
+    seed=None,
+) -> dict:
+    """
+    在 n_paths 條合成路徑上同時執行追蹤停損策略。
+    Runs the trailing stop strategy on n_paths synthetic paths at once.
+
+    Paths are generated one session at a time by drawing a historical session
+    per path, so memory stays at O(n_paths * bars_per_session). The state
+    machine mirrors run_strategy_backtest, with every state variable held as
+    an array over paths.
+    """
+    rng = np.random.default_rng(seed)
+    n_hist_sessions, bars_per_session = blocks["valid"].shape
+    entry_factor = 1 + entry_trail_pct / 100
+    exit_factor = 1 - exit_trail_pct / 100
+
+    last_close = np.full(n_paths, blocks["start_close"])
+    in_position = np.zeros(n_paths, dtype=bool)
+    lowest = np.full(n_paths, np.inf)
+    highest = np.full(n_paths, -np.inf)
+    buy_price = np.zeros(n_paths)
+    current_day = np.full(n_paths, -1)
+    day_of_last_trade = np.full(n_paths, -1)
+
+    total_pnl = np.zeros(n_paths)
+    trade_count = np.zeros(n_paths, dtype=np.int64)
+    win_count = np.zeros(n_paths, dtype=np.int64)
+    peak_equity = np.zeros(n_paths)
+    max_drawdown = np.zeros(n_paths)
+
+    for day in range(n_sessions):
+        picks = rng.integers(0, n_hist_sessions, size=n_paths)
+        closes = last_close[:, None] * np.exp(
+            np.cumsum(blocks["log_returns"][picks], axis=1)
+        )
+        highs = closes * blocks["high_ratio"][picks]
+        lows = closes * blocks["low_ratio"][picks]
+        valid = blocks["valid"][picks]
+        last_close = closes[:, -1]
+
+        for bar in range(bars_per_session):
+            bar_valid = valid[:, bar]
+            current_high = highs[:, bar]
+            current_low = lows[:, bar]
+
+            # --- LOOKING_TO_BUY ---
+            looking = bar_valid & ~in_position & (day_of_last_trade != day)
+            if daily_trades:
+                new_day = looking & (current_day != day)
+                current_day[new_day] = day
+                lowest = np.where(new_day, current_low, lowest)
+                tracking = looking & ~new_day
+            else:
+                tracking = looking
+            lowest = np.where(tracking, np.minimum(lowest, current_low), lowest)
+
+            buy_trigger_price = lowest * entry_factor
+            buys = looking & (current_high >= buy_trigger_price)
+
+            # --- IN_POSITION ---
+            holding = bar_valid & in_position
+            highest = np.where(holding, np.maximum(highest, current_high), highest)
+            sell_trigger_price = highest * exit_factor
+            sells = holding & (current_low <= sell_trigger_price)
+
+            if buys.any():
+                buy_price = np.where(buys, buy_trigger_price, buy_price)
+                highest = np.where(buys, buy_trigger_price, highest)
+                in_position |= buys
+
+            if sells.any():
+                if budget:
+                    shares_to_trade = budget // buy_price[sells]
+                else:
+                    shares_to_trade = shares
+                pnl = (sell_trigger_price[sells] - buy_price[sells]) * shares_to_trade
+
+                total_pnl[sells] += pnl
+                trade_count[sells] += 1
+                win_count[sells] += pnl > 0
+                peak_equity[sells] = np.maximum(peak_equity[sells], total_pnl[sells])
+                max_drawdown[sells] = np.maximum(
+                    max_drawdown[sells], peak_equity[sells] - total_pnl[sells]
+                )
+
+                in_position[sells] = False
+                day_of_last_trade[sells] = day
+                lowest = np.where(sells, current_low, lowest)
+                highest = np.where(sells, -np.inf, highest)
+                buy_price = np.where(sells, 0.0, buy_price)
+
+    return {
+        "pnl": total_pnl,
+        "trades": trade_count,
+        "wins": win_count,
+        "max_drawdown": max_drawdown,
+    }
+
+
+def run_stress_test(
+    stock_data: pd.DataFrame,
+    ticker: str,
+    args: argparse.Namespace,
+):
+    """
+    以合成路徑對追蹤停損策略進行蒙地卡羅壓力測試。
+    Monte Carlo stress test of the trailing stop strategy on synthetic paths
+    block-resampled (by session) from the ticker's own bars.
+
+    Paths are split across args.stress_workers processes, each with an
+    independent seed spawned from args.stress_seed.
+    """
+    if stock_data.empty:
+        logger.warning(f"No data for {ticker}, skipping stress test.")
+        return None
+
+    blocks = build_session_blocks(stock_data)
+    n_sessions = args.stress_sessions or blocks["valid"].shape[0]
+    workers = max(1, min(args.stress_workers, args.stress_paths))
+
+    path_counts = [
+        len(c) for c in np.array_split(np.arange(args.stress_paths), workers)
+    ]
+    seeds = np.random.SeedSequence(args.stress_seed).spawn(workers)
+    jobs = [
+        (
+            blocks,
+            count,
+            n_sessions,
+            args.entry_trail_pct,
+            args.exit_trail_pct,
+            args.daily_trades,
+            args.shares,
+            args.budget,
+            seed,
+        )
+        for count, seed in zip(path_counts, seeds)
+    ]
+
+    if workers == 1:
+        parts = [simulate_trailing_stop_paths(*jobs[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parts = list(executor.map(_simulate_job, jobs))
+
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def _simulate_job(job):
+    return simulate_trailing_stop_paths(*job)
+
+
+def summarize_stress_results(results: dict) -> pd.DataFrame:
+    """
+    將每條路徑的結果彙整成分位數表。
+    Summarizes per-path results into a table of mean/std and percentiles.
+    """
+    trades = results["trades"]
+    columns = {
+        "pnl": results["pnl"],
+        "trades": trades,
+        "win_rate": np.divide(
+            results["wins"],
+            trades,
+            out=np.full(len(trades), np.nan),
+            where=trades > 0,
+        ),
+        "max_drawdown": results["max_drawdown"],
+    }
+    frame = pd.DataFrame(columns)
+    summary = frame.describe(percentiles=[p / 100 for p in STRESS_PERCENTILES])
+    summary.loc["prob_loss"] = [(frame["pnl"] < 0).mean(), np.nan, np.nan, np.nan]
+    return summary
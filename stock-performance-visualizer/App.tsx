@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { StockDataPoint } from './types';
-import { parseAndProcessStockData } from './services/dataService';
+import { FeedManifest, loadFeedManifest, loadFeedRange, parseAndProcessStockData } from './services/dataService';
 import Header from './components/Header';
 import StockChart from './components/StockChart';
 import IndicatorChart from './components/IndicatorChart';
@@ -14,6 +14,9 @@ const formatDateForInput = (date: Date): string => {
   return date.toISOString().split('T')[0];
 };
 
+// `?feed=<url>` points the app at a directory exported with `run.py --export-feed`.
+const feedUrl = new URLSearchParams(window.location.search).get('feed');
+
 const App: React.FC = () => {
   const [data, setData] = useState<StockDataPoint[]>([]);
   const [filteredData, setFilteredData] = useState<StockDataPoint[]>([]);
@@ -27,7 +30,54 @@ const App: React.FC = () => {
     table: true,
   });
 
+  const [feed, setFeed] = useState<FeedManifest | null>(null);
+  const [ticker, setTicker] = useState<string>('');
+  const [holdingHours, setHoldingHours] = useState<string>('');
+  const [feedRange, setFeedRange] = useState<{ min: string; max: string }>({ min: '', max: '' });
+
+  useEffect(() => {
+    if (!feedUrl) return;
+    loadFeedManifest(feedUrl)
+      .then(manifest => {
+        const firstTicker = Object.keys(manifest.tickers)[0] ?? '';
+        setFeed(manifest);
+        setTicker(firstTicker);
+        setHoldingHours(Object.keys(manifest.tickers[firstTicker] ?? {})[0] ?? '');
+      })
+      .catch(error => console.error("Failed to load feed manifest:", error))
+      .finally(() => setLoading(false));
+  }, []);
+
+  useEffect(() => {
+    const dataset = feed?.tickers[ticker]?.[holdingHours];
+    if (!dataset) return;
+    const levels = Object.values(dataset.levels);
+    const starts = levels.map(l => l.start).filter((t): t is number => t !== null);
+    const ends = levels.map(l => l.end).filter((t): t is number => t !== null);
+    if (!starts.length) return;
+    const min = formatDateForInput(new Date(Math.min(...starts)));
+    const max = formatDateForInput(new Date(Math.max(...ends)));
+    setFeedRange({ min, max });
+    setStartDate(min);
+    setEndDate(max);
+  }, [feed, ticker, holdingHours]);
+
+  useEffect(() => {
+    if (!feed || !feedUrl || !startDate || !endDate) return;
+    const start = new Date(startDate);
+    start.setUTCHours(0, 0, 0, 0);
+    const end = new Date(endDate);
+    end.setUTCHours(23, 59, 59, 999);
+
+    let cancelled = false;
+    loadFeedRange(feedUrl, feed, ticker, holdingHours, start, end)
+      .then(points => { if (!cancelled) setFilteredData(points); })
+      .catch(error => console.error("Failed to load feed data:", error));
+    return () => { cancelled = true; };
+  }, [feed, ticker, holdingHours, startDate, endDate]);
+
   useEffect(() => {
+    if (feedUrl) return;
     const loadData = () => {
       try {
         const processedData = parseAndProcessStockData();
@@ -77,13 +127,40 @@ const App: React.FC = () => {
     );
   }
 
-  const minDate = data.length > 0 ? formatDateForInput(data[0].datetime) : '';
-  const maxDate = data.length > 0 ? formatDateForInput(data[data.length - 1].datetime) : '';
+  const minDate = feed ? feedRange.min : data.length > 0 ? formatDateForInput(data[0].datetime) : '';
+  const maxDate = feed ? feedRange.max : data.length > 0 ? formatDateForInput(data[data.length - 1].datetime) : '';
 
   return (
     <div className="min-h-screen bg-gray-900 text-gray-200 font-sans">
       <Header />
       <main className="p-4 sm:p-6 lg:p-8">
+        {feed && (
+          <div className="flex flex-col sm:flex-row items-center justify-center gap-4 my-4 p-4 bg-gray-800 rounded-lg shadow-md">
+            <label className="text-gray-400 text-sm font-medium">
+              Ticker:
+              <select
+                value={ticker}
+                onChange={e => {
+                  setTicker(e.target.value);
+                  setHoldingHours(Object.keys(feed.tickers[e.target.value] ?? {})[0] ?? '');
+                }}
+                className="ml-2 bg-gray-700 text-white rounded p-1"
+              >
+                {Object.keys(feed.tickers).map(t => <option key={t} value={t}>{t}</option>)}
+              </select>
+            </label>
+            <label className="text-gray-400 text-sm font-medium">
+              Holding Hours:
+              <select
+                value={holdingHours}
+                onChange={e => setHoldingHours(e.target.value)}
+                className="ml-2 bg-gray-700 text-white rounded p-1"
+              >
+                {Object.keys(feed.tickers[ticker] ?? {}).map(h => <option key={h} value={h}>{h}</option>)}
+              </select>
+            </label>
+          </div>
+        )}
         <DateRangePicker
           startDate={startDate}
           endDate={endDate}
@@ -270,3 +270,153 @@ export const parseAndProcessStockData = (): StockDataPoint[] => {
 
     return processed;
 };
+
+// --- Pre-aggregated feed (exported by `run.py --export-feed DIR`) ---
+
+export interface FeedLevelSummary {
+  rows: number;
+  start: number | null;
+  end: number | null;
+}
+
+export interface FeedDatasetEntry {
+  index: string;
+  timezone: string | null;
+  summary: Record<string, number | number[] | null>;
+  levels: Record<string, FeedLevelSummary>;
+}
+
+export interface FeedManifest {
+  version: number;
+  levels: string[];
+  tickers: Record<string, Record<string, FeedDatasetEntry>>;
+}
+
+interface FeedTile {
+  file: string;
+  rows: number;
+  start: number;
+  end: number;
+}
+
+interface FeedDatasetIndex {
+  levels: Record<string, { rows: number; columns: string[]; tiles: FeedTile[] }>;
+}
+
+const feedColumnMap: Record<string, keyof StockDataPoint> = {
+  open: 'open',
+  high: 'high',
+  low: 'low',
+  close: 'close',
+  volume: 'volume',
+  p_buy: 'pBuy',
+  p_sell: 'pSell',
+  price_diff: 'priceDiff',
+  return: 'return',
+};
+
+const feedIndexCache = new Map<string, Promise<FeedDatasetIndex>>();
+const feedTileCache = new Map<string, Promise<ArrayBuffer>>();
+
+const joinUrl = (baseUrl: string, path: string): string =>
+  `${baseUrl.replace(/\/+$/, '')}/${path}`;
+
+const fetchCached = <T>(cache: Map<string, Promise<T>>, url: string, read: (r: Response) => Promise<T>): Promise<T> => {
+  let pending = cache.get(url);
+  if (!pending) {
+    pending = fetch(url).then(response => {
+      if (!response.ok) throw new Error(`Failed to fetch ${url}: ${response.status}`);
+      return read(response);
+    });
+    pending.catch(() => cache.delete(url));
+    cache.set(url, pending);
+  }
+  return pending;
+};
+
+export const loadFeedManifest = async (baseUrl: string): Promise<FeedManifest> => {
+  const response = await fetch(joinUrl(baseUrl, 'manifest.json'));
+  if (!response.ok) throw new Error(`Failed to fetch feed manifest: ${response.status}`);
+  return response.json();
+};
+
+/**
+ * Picks the finest pyramid level whose estimated row count in [start, end]
+ * stays within maxPoints, falling back to the coarsest level.
+ */
+export const selectFeedLevel = (
+  dataset: FeedDatasetEntry,
+  levelOrder: string[],
+  start: Date,
+  end: Date,
+  maxPoints: number,
+): string => {
+  const available = levelOrder.filter(level => dataset.levels[level]);
+  for (const level of available) {
+    const { rows, start: levelStart, end: levelEnd } = dataset.levels[level];
+    if (levelStart === null || levelEnd === null) continue;
+    const span = Math.max(levelEnd - levelStart, 1);
+    const overlap = Math.max(0, Math.min(end.getTime(), levelEnd) - Math.max(start.getTime(), levelStart));
+    if ((rows * overlap) / span <= maxPoints) return level;
+  }
+  return available[available.length - 1];
+};
+
+const decodeTile = (buffer: ArrayBuffer, rows: number, columns: string[]): Omit<StockDataPoint, 'ohlc' | 'range' | 'k' | 'd'>[] => {
+  // Layout: float64 't' (epoch ms), then one float32 run per column, little-endian.
+  const view = new DataView(buffer);
+  const points = [];
+  for (let i = 0; i < rows; i++) {
+    const entry: any = {
+      datetime: new Date(view.getFloat64(i * 8, true)),
+      open: 0, high: 0, low: 0, close: 0, volume: 0,
+      pBuy: 0, pSell: 0, priceDiff: 0, return: 0,
+    };
+    columns.forEach((column, c) => {
+      const key = feedColumnMap[column];
+      if (key) {
+        const value = view.getFloat32(rows * 8 + (c * rows + i) * 4, true);
+        entry[key] = Number.isNaN(value) ? 0 : value;
+      }
+    });
+    points.push(entry);
+  }
+  return points;
+};
+
+/**
+ * Loads one ticker/holding period for a date range from the exported feed,
+ * fetching only the tiles of the level matching the range, so a view
+ * transfers at most a few tiles regardless of the history length.
+ */
+export const loadFeedRange = async (
+  baseUrl: string,
+  manifest: FeedManifest,
+  ticker: string,
+  holdingHours: string,
+  start: Date,
+  end: Date,
+  maxPoints: number = 2000,
+): Promise<StockDataPoint[]> => {
+  const dataset = manifest.tickers[ticker]?.[holdingHours];
+  if (!dataset) return [];
+
+  const level = selectFeedLevel(dataset, manifest.levels, start, end, maxPoints);
+  const index = await fetchCached(feedIndexCache, joinUrl(baseUrl, dataset.index), r => r.json());
+  const { columns, tiles } = index.levels[level];
+  const wanted = tiles.filter(tile => tile.end >= start.getTime() && tile.start <= end.getTime());
+
+  const buffers = await Promise.all(
+    wanted.map(tile => fetchCached(feedTileCache, joinUrl(baseUrl, tile.file), r => r.arrayBuffer())),
+  );
+  const parsed = buffers
+    .flatMap((buffer, i) => decodeTile(buffer, wanted[i].rows, columns))
+    .filter(d => d.datetime >= start && d.datetime <= end);
+
+  const processed = parsed.map(d => ({
+    ...d,
+    ohlc: [d.open, d.high, d.low, d.close] as [number, number, number, number],
+    range: [d.low, d.high] as [number, number],
+  }));
+  return calculateKD(processed);
+};